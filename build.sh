@@ -7,3 +7,4 @@ python manage.py migrate
 python manage.py create_admin
 python manage.py seed_dialogues
 python manage.py create_sample_data
+python manage.py pregenerate_tts --all
@@ -55,6 +55,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "simulator.middleware.ImmutableMediaCacheMiddleware",
 ]
 
 ROOT_URLCONF = "core.urls"
@@ -133,7 +134,8 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 # Media files (user uploads)
 MEDIA_URL = '/media/'
-MEDIA_ROOT = BASE_DIR / 'media'
+# Shared by the web service and the audio worker (see render.yaml)
+MEDIA_ROOT = Path(os.environ.get('MEDIA_ROOT', BASE_DIR / 'media'))
 
 
 # Default primary key field type
@@ -143,3 +145,132 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # Custom user model configuration
 AUTH_USER_MODEL = "users.CustomUser"
+
+
+# Audio caches live outside MEDIA_ROOT so they are never served as user media
+AUDIO_CACHE_ROOT = Path(os.environ.get('AUDIO_CACHE_ROOT', BASE_DIR / 'cache'))
+
+# Text-to-speech cache (content-addressed, LRU-evicted above the size budget)
+TTS_CACHE_DIR = AUDIO_CACHE_ROOT / 'tts'
+TTS_CACHE_MAX_BYTES = int(os.environ.get('TTS_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+TTS_PREGENERATE_CONCURRENCY = int(os.environ.get('TTS_PREGENERATE_CONCURRENCY', 4))
+
+# Raw PCM layout and encoder bitrate used when building dialogue/simulation audio
+AUDIO_SAMPLE_RATE = int(os.environ.get('AUDIO_SAMPLE_RATE', 24000))
+AUDIO_CHANNELS = 1
+AUDIO_SAMPLE_WIDTH = 2
+AUDIO_BITRATE = os.environ.get('AUDIO_BITRATE', '64k')
+
+# Encoded per-line segments reused by incremental dialogue rebuilds
+AUDIO_SEGMENT_CACHE_DIR = AUDIO_CACHE_ROOT / 'segments'
+AUDIO_SEGMENT_CACHE_MAX_BYTES = int(os.environ.get('AUDIO_SEGMENT_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+
+# Background audio jobs (processed by `manage.py run_audio_worker`)
+AUDIO_JOBS_EAGER = os.environ.get('AUDIO_JOBS_EAGER', 'False') == 'True'
+AUDIO_WORKER_CONCURRENCY = int(os.environ.get('AUDIO_WORKER_CONCURRENCY', 2))
+AUDIO_JOB_MAX_ATTEMPTS = 3
+AUDIO_JOB_RETRY_DELAY = 5
+# Workers refresh the heartbeat of their running jobs every
+# AUDIO_JOB_HEARTBEAT seconds; a job without one for AUDIO_JOB_STALE_AFTER
+# seconds belongs to a dead worker and is retried (or failed)
+AUDIO_JOB_HEARTBEAT = 30
+AUDIO_JOB_STALE_AFTER = 5 * 60
+
+# Line recording uploads (`/api/line/<id>/upload/`)
+RECORDING_UPLOAD_MAX_BYTES = int(os.environ.get('RECORDING_UPLOAD_MAX_BYTES', 10 * 1024 * 1024))
+RECORDING_UPLOAD_CONTENT_TYPES = {
+    'audio/webm': 'webm',
+    'audio/ogg': 'ogg',
+    'audio/mpeg': 'mp3',
+    'audio/mp4': 'm4a',
+    'audio/wav': 'wav',
+    'audio/x-wav': 'wav',
+}
+
+# Decoded PCM of recordings and clips, memory-mapped by audio builds
+AUDIO_PCM_CACHE_DIR = AUDIO_CACHE_ROOT / 'pcm'
+AUDIO_PCM_CACHE_MAX_BYTES = int(os.environ.get('AUDIO_PCM_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+
+# Take analysis (simulator.analysis): silence trimming and loudness normalization
+AUDIO_ANALYSIS_FRAME_MS = 20
+AUDIO_SILENCE_DBFS = -45.0
+AUDIO_TRIM_PADDING_MS = 100
+AUDIO_TARGET_DBFS = -20.0
+AUDIO_PEAK_CEILING_DBFS = -1.0
+AUDIO_ANALYSIS_ON_CONCAT = True
+
+# Generated audio is named after a hash of its inputs, so it never changes in place
+IMMUTABLE_MEDIA_PATTERN = r'^(dialogues/complete|simulations/final|audio/shared)/[^/]+_[0-9a-f]{16}\.mp3$'
+IMMUTABLE_MEDIA_MAX_AGE = 365 * 24 * 60 * 60
+
+# Media serving (simulator.media.serve_media). Set MEDIA_SENDFILE_BACKEND to
+# "x-accel-redirect" (nginx) or "x-sendfile" (Apache) to offload transfers
+MEDIA_SENDFILE_BACKEND = os.environ.get('MEDIA_SENDFILE_BACKEND') or None
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get('MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+# Generated audio under MEDIA_PUBLIC_PREFIXES is served to anyone; line
+# recordings under MEDIA_PRIVATE_PREFIX only to the user owning the line's
+# participant, or to staff. Any other path is a 404
+MEDIA_PUBLIC_PREFIXES = ('dialogues/complete/', 'simulations/final/', 'audio/shared/')
+MEDIA_PRIVATE_PREFIX = 'simulations/lines/'
+
+# "file" encodes dialogue/simulation audio into one MP3; "playlist" stores a
+# manifest of the existing line recordings, title clips and shared silences
+AUDIO_OUTPUT_MODE = os.environ.get('AUDIO_OUTPUT_MODE', 'file')
+
+# Media garbage collection and retention (`manage.py media_gc`)
+MEDIA_GC_MIN_AGE = int(os.environ.get('MEDIA_GC_MIN_AGE', 60 * 60))
+MEDIA_RETENTION_DAYS = int(os.environ['MEDIA_RETENTION_DAYS']) if os.environ.get('MEDIA_RETENTION_DAYS') else None
+MEDIA_USER_QUOTA_BYTES = int(os.environ['MEDIA_USER_QUOTA_BYTES']) if os.environ.get('MEDIA_USER_QUOTA_BYTES') else None
+
+# Store simulator audio content-addressed (simulator.storage): identical files
+# share one blob under MEDIA_ROOT/.blobs via hard links
+AUDIO_DEDUP_STORAGE = os.environ.get('AUDIO_DEDUP_STORAGE', 'True') == 'True'
+
+# Text-to-speech providers, in order of preference ("gtts", "espeak",
+# "synthetic"). A provider that fails or exceeds TTS_TIMEOUT seconds is
+# skipped for the next one; after TTS_BREAKER_THRESHOLD consecutive failures
+# it is not called again for TTS_BREAKER_RESET seconds. "synthetic" makes
+# tones, not speech: system line recordings are stored once and never
+# regenerated, so it is only a default fallback in development
+TTS_PROVIDERS = [name.strip() for name in os.environ.get('TTS_PROVIDERS', 'gtts,synthetic' if DEBUG else 'gtts').split(',') if name.strip()]
+TTS_TIMEOUT = float(os.environ.get('TTS_TIMEOUT', 10))
+TTS_BREAKER_THRESHOLD = 3
+TTS_BREAKER_RESET = 30
+TTS_MAX_CONCURRENCY = int(os.environ.get('TTS_MAX_CONCURRENCY', 8))
+
+# Synthesize system lines phrase by phrase (simulator.phrases): lines are
+# split at punctuation and assembled from cached phrase clips, so phrases
+# shared across lines ("merci beaucoup", "s'il vous plaît") are made once
+TTS_PHRASE_SEGMENTATION = os.environ.get('TTS_PHRASE_SEGMENTATION', 'False') == 'True'
+
+# Background synthesis of the system lines ahead of a learner when a
+# simulation run opens (simulator.prefetch): lines synthesized at once (0
+# disables prefetching) and lines prefetched from the next dialogue
+TTS_PREFETCH_CONCURRENCY = int(os.environ.get('TTS_PREFETCH_CONCURRENCY', 2))
+TTS_PREFETCH_NEXT_LINES = int(os.environ.get('TTS_PREFETCH_NEXT_LINES', 3))
+
+# Speech recognition (simulator.asr): "whisper" (needs openai-whisper) or
+# "stub" for tests. Models stay loaded per process; requests arriving within
+# ASR_BATCH_WAIT_MS are transcribed together, up to ASR_BATCH_SIZE at once.
+# With ASR_ENABLED, learner recordings are transcribed after normalization
+ASR_BACKEND = os.environ.get('ASR_BACKEND', 'whisper')
+ASR_MODEL = os.environ.get('ASR_MODEL', 'small')
+ASR_BATCH_SIZE = int(os.environ.get('ASR_BATCH_SIZE', 8))
+ASR_BATCH_WAIT_MS = int(os.environ.get('ASR_BATCH_WAIT_MS', 25))
+ASR_TIMEOUT = float(os.environ.get('ASR_TIMEOUT', 120))
+ASR_ENABLED = os.environ.get('ASR_ENABLED', 'False') == 'True'
+
+# Live recognition while recording (simulator.realtime, needs the ASGI app:
+# `uvicorn core.asgi:application`). The run page streams takes over
+# /ws/line/<id>/record/ and falls back to uploading if the socket fails.
+# Partial transcripts are refreshed every ASR_PARTIAL_INTERVAL_MS; speech has
+# ended after ASR_ENDPOINT_SILENCE_MS below AUDIO_SILENCE_DBFS. Takes are cut
+# at REALTIME_MAX_TAKE_SECONDS of decoded audio
+REALTIME_RECOGNITION = os.environ.get('REALTIME_RECOGNITION', 'False') == 'True'
+ASR_PARTIAL_INTERVAL_MS = int(os.environ.get('ASR_PARTIAL_INTERVAL_MS', 500))
+ASR_ENDPOINT_SILENCE_MS = int(os.environ.get('ASR_ENDPOINT_SILENCE_MS', 1200))
+REALTIME_MAX_TAKE_SECONDS = int(os.environ.get('REALTIME_MAX_TAKE_SECONDS', 120))
+
+# Rows per page of the simulation and participant lists (keyset pagination,
+# simulator.pagination)
+LIST_PAGE_SIZE = int(os.environ.get('LIST_PAGE_SIZE', 24))
@@ -1,6 +1,14 @@
 from django.contrib import admin
 
-from .models import Participant, Simulation, Dialogue, DialogueLine, LineRecording
+from .models import (
+    AudioJob,
+    Counter,
+    Participant,
+    Simulation,
+    Dialogue,
+    DialogueLine,
+    LineRecording,
+)
 
 
 @admin.register(Participant)
@@ -52,3 +60,26 @@ class DialogueLineAdmin(admin.ModelAdmin):
 class LineRecordingAdmin(admin.ModelAdmin):
     list_display = ("dialogue_line", "audio_file", "recorded_at")
     list_filter = ("dialogue_line", "recorded_at")
+
+
+@admin.register(AudioJob)
+class AudioJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "kind",
+        "object_id",
+        "status",
+        "attempts",
+        "max_attempts",
+        "worker",
+        "created_at",
+        "finished_at",
+    )
+    list_filter = ("kind", "status", "created_at")
+    date_hierarchy = "created_at"
+
+
+@admin.register(Counter)
+class CounterAdmin(admin.ModelAdmin):
+    list_display = ("scope", "object_id", "name", "value")
+    list_filter = ("scope", "name")
@@ -0,0 +1,155 @@
+import numpy as np
+from django.conf import settings
+
+
+# ========================
+# Sample Conversion
+# ========================
+def pcm_to_array(data, sample_width=2):
+    """
+    Converts little-endian signed PCM bytes to a float32 array in [-1, 1]
+
+    Args:
+        data (bytes): Raw PCM (any buffer, including an mmap slice)
+        sample_width (int): Bytes per sample (2 or 4)
+
+    Returns:
+        numpy.ndarray: Samples as float32
+    """
+
+    dtype = {2: np.int16, 4: np.int32}[sample_width]
+    scale = float(2 ** (8 * sample_width - 1))
+    return np.frombuffer(data, dtype=dtype).astype(np.float32) / scale
+
+
+def array_to_pcm(samples, sample_width=2):
+    """Converts float samples in [-1, 1] back to little-endian PCM bytes"""
+
+    dtype = {2: np.int16, 4: np.int32}[sample_width]
+    scale = float(2 ** (8 * sample_width - 1))
+    clipped = np.clip(samples, -1.0, (scale - 1) / scale)
+    return (clipped * scale).astype(dtype).tobytes()
+
+
+def to_dbfs(value):
+    """Converts a linear amplitude to dBFS (-inf for digital silence)"""
+
+    with np.errstate(divide="ignore"):
+        return 20 * np.log10(value)
+
+
+# ========================
+# Analysis
+# ========================
+def frame_rms_batch(arrays, frame_len):
+    """
+    Computes per-frame RMS for several sample arrays in one vectorized pass
+
+    Arrays are zero-padded into a single (batch, frames, frame_len) matrix,
+    so no Python loop runs over samples or frames.
+
+    Args:
+        arrays (list): 1-D float sample arrays
+        frame_len (int): Samples per analysis frame
+
+    Returns:
+        tuple: (rms matrix of shape (batch, frames), frame counts per array)
+    """
+
+    counts = np.array([-(-len(a) // frame_len) for a in arrays], dtype=np.int64)
+    n_frames = max(int(counts.max()) if len(counts) else 0, 1)
+
+    padded = np.zeros((len(arrays), n_frames * frame_len), dtype=np.float32)
+    for row, samples in enumerate(arrays):
+        padded[row, : len(samples)] = samples
+
+    frames = padded.reshape(len(arrays), n_frames, frame_len)
+    return np.sqrt(np.mean(frames**2, axis=2)), counts
+
+
+def analyze_batch(arrays, frame_rate):
+    """
+    Measures loudness, silence bounds and normalization gain for each take
+
+    Args:
+        arrays (list): 1-D float sample arrays (mono)
+        frame_rate (int): Sample rate of the arrays
+
+    Returns:
+        list: One dict per array with rms_dbfs, peak_dbfs, start, end
+        (sample bounds of the non-silent part), gain_db and is_silent
+    """
+
+    if not arrays:
+        return []
+
+    frame_len = max(1, frame_rate * settings.AUDIO_ANALYSIS_FRAME_MS // 1000)
+    rms, counts = frame_rms_batch(arrays, frame_len)
+
+    valid = np.arange(rms.shape[1])[None, :] < counts[:, None]
+    voiced = valid & (to_dbfs(rms) > settings.AUDIO_SILENCE_DBFS)
+    has_voice = voiced.any(axis=1)
+
+    # First/last voiced frame per row, widened by the padding kept around speech
+    first = np.argmax(voiced, axis=1)
+    last = rms.shape[1] - 1 - np.argmax(voiced[:, ::-1], axis=1)
+    pad = settings.AUDIO_TRIM_PADDING_MS * frame_rate // 1000
+    lengths = np.array([len(a) for a in arrays], dtype=np.int64)
+    starts = np.where(has_voice, np.maximum(first * frame_len - pad, 0), 0)
+    ends = np.where(has_voice, np.minimum((last + 1) * frame_len + pad, lengths), 0)
+
+    # Loudness over voiced frames only, so leading/trailing silence does not skew it
+    voiced_energy = np.where(voiced, rms**2, 0.0).sum(axis=1)
+    voiced_count = np.maximum(voiced.sum(axis=1), 1)
+    rms_dbfs = to_dbfs(np.sqrt(voiced_energy / voiced_count))
+
+    peaks = np.array([np.abs(a).max() if len(a) else 0.0 for a in arrays])
+    peak_dbfs = to_dbfs(peaks)
+
+    gain_db = settings.AUDIO_TARGET_DBFS - rms_dbfs
+    gain_db = np.minimum(gain_db, settings.AUDIO_PEAK_CEILING_DBFS - peak_dbfs)
+    gain_db = np.where(has_voice, gain_db, 0.0)
+
+    return [
+        {
+            "rms_dbfs": float(rms_dbfs[i]) if has_voice[i] else None,
+            "peak_dbfs": float(peak_dbfs[i]) if peaks[i] > 0 else None,
+            "start": int(starts[i]),
+            "end": int(ends[i]),
+            "gain_db": float(gain_db[i]),
+            "is_silent": not bool(has_voice[i]),
+        }
+        for i in range(len(arrays))
+    ]
+
+
+def process_samples(samples, frame_rate):
+    """
+    Trims leading/trailing silence and normalizes loudness of one take
+
+    Args:
+        samples (numpy.ndarray): 1-D float samples (mono)
+        frame_rate (int): Sample rate
+
+    Returns:
+        tuple: (processed samples, analysis dict from analyze_batch)
+    """
+
+    report = analyze_batch([samples], frame_rate)[0]
+    if report["is_silent"]:
+        return samples, report
+
+    trimmed = samples[report["start"] : report["end"]]
+    return trimmed * np.float32(10 ** (report["gain_db"] / 20)), report
+
+
+def process_pcm(data, frame_rate, sample_width=2):
+    """
+    Runs process_samples on raw mono PCM
+
+    Returns:
+        tuple: (processed PCM bytes, analysis dict)
+    """
+
+    samples, report = process_samples(pcm_to_array(data, sample_width), frame_rate)
+    return array_to_pcm(samples, sample_width), report
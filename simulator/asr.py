@@ -0,0 +1,260 @@
+import hashlib
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+
+import numpy as np
+from django.conf import settings
+
+# Sample rate of the float32 arrays the backends accept instead of a path
+SAMPLE_RATE = 16000
+
+
+class ASRUnavailable(Exception):
+    """Raised when the configured speech recognition backend cannot run"""
+
+
+# ========================
+# Backends
+# ========================
+BACKENDS = {}
+
+
+def register(name):
+    """Registers a backend class under the name used in ASR_BACKEND"""
+
+    def decorator(cls):
+        cls.name = name
+        BACKENDS[name] = cls
+        return cls
+
+    return decorator
+
+
+class ASRBackend:
+    """
+    A speech recognition engine.
+
+    load() is called once per model and process; transcribe_batch() receives
+    the loaded model and several inputs in the same language, each a file
+    path or a mono float32 array at SAMPLE_RATE.
+    """
+
+    name = ""
+
+    def load(self, model_name):
+        raise NotImplementedError
+
+    def transcribe_batch(self, model, paths, lang):
+        raise NotImplementedError
+
+
+@register("whisper")
+class WhisperBackend(ASRBackend):
+    """
+    OpenAI Whisper (`pip install openai-whisper`)
+
+    Clips are padded to Whisper's 30-second window and decoded together in
+    one forward pass, which suits short line recordings.
+
+    Reference: Radford et al. (2022) Robust Speech Recognition
+    via Large-Scale Weak Supervision
+    """
+
+    def load(self, model_name):
+        try:
+            import whisper
+        except ImportError as exc:
+            raise ASRUnavailable("openai-whisper is not installed") from exc
+        return whisper.load_model(name=model_name)
+
+    def transcribe_batch(self, model, paths, lang):
+        import torch
+        import whisper
+
+        mels = [
+            whisper.log_mel_spectrogram(
+                whisper.pad_or_trim(
+                    path if isinstance(path, np.ndarray) else whisper.load_audio(path)
+                ),
+                n_mels=model.dims.n_mels,
+            )
+            for path in paths
+        ]
+        results = whisper.decode(
+            model,
+            torch.stack(mels).to(model.device),
+            whisper.DecodingOptions(language=lang, fp16=False),
+        )
+        return [result.text.strip() for result in results]
+
+
+@register("stub")
+class StubBackend(ASRBackend):
+    """
+    Offline stand-in for tests: returns the transcript registered for a file
+
+    Files are matched by content, so copies and normalized renditions saved
+    under other names need registering separately. Unknown files give "".
+    Arrays (live audio) reveal `stream_text` at `words_per_second`.
+    """
+
+    transcripts = {}
+    stream_text = ""
+    words_per_second = 2.5
+
+    @classmethod
+    def expect(cls, path, text):
+        cls.transcripts[_file_digest(path)] = text
+
+    def load(self, model_name):
+        return model_name
+
+    def transcribe_batch(self, model, paths, lang):
+        return [self.transcribe_one(path) for path in paths]
+
+    def transcribe_one(self, path):
+        if isinstance(path, np.ndarray):
+            words = self.stream_text.split()
+            spoken = int(len(path) / SAMPLE_RATE * self.words_per_second)
+            return " ".join(words[:spoken])
+        return self.transcripts.get(_file_digest(path), "")
+
+
+def _file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+# ========================
+# Model Pool
+# ========================
+class ASRPool:
+    """
+    Keeps recognition models resident and batches requests to them.
+
+    Each model is loaded the first time it is needed and kept for the life
+    of the process. Requests are queued to a single worker thread, which
+    waits up to `batch_wait` seconds after the first request for up to
+    `batch_size` more and transcribes them in one call.
+    """
+
+    def __init__(self, backend, batch_size, batch_wait):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown ASR backend: {backend}")
+
+        self.backend = BACKENDS[backend]()
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._models = {}
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.load_seconds = {}
+
+    def model(self, model_name):
+        """Returns a loaded model, loading it on first use"""
+
+        with self._lock:
+            if model_name not in self._models:
+                started = time.monotonic()
+                self._models[model_name] = self.backend.load(model_name)
+                self.load_seconds[model_name] = time.monotonic() - started
+            return self._models[model_name]
+
+    def submit(self, path, lang="fr", model_name=None):
+        """
+        Queues an audio file (or a float32 array at SAMPLE_RATE) for transcription
+
+        Returns:
+            Future: Resolves to the transcript text
+        """
+
+        future = Future()
+        self._queue.put((model_name or settings.ASR_MODEL, lang, path, future))
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="asr-batcher", daemon=True
+                )
+                self._worker.start()
+        return future
+
+    def transcribe(self, path, lang="fr", model_name=None, timeout=None):
+        """
+        Transcribes one audio file or array, waiting for the batch it joins
+
+        Raises:
+            ASRUnavailable: If the backend or model cannot be loaded
+            TimeoutError: If no result arrived within timeout seconds
+        """
+
+        future = self.submit(path, lang, model_name)
+        return future.result(timeout=timeout or settings.ASR_TIMEOUT)
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            groups = defaultdict(list)
+            for model_name, lang, path, future in self._next_batch():
+                if future.set_running_or_notify_cancel():
+                    groups[model_name, lang].append((path, future))
+
+            for (model_name, lang), requests in groups.items():
+                try:
+                    texts = self.backend.transcribe_batch(
+                        self.model(model_name), [path for path, _f in requests], lang
+                    )
+                except Exception as exc:
+                    for _path, future in requests:
+                        future.set_exception(exc)
+                    continue
+
+                self.batches += 1
+                self.requests += len(requests)
+                for (_path, future), text in zip(requests, texts):
+                    future.set_result(text)
+
+    def stats(self):
+        return {
+            "backend": self.backend.name,
+            "models": sorted(self._models),
+            "load_seconds": dict(self.load_seconds),
+            "batches": self.batches,
+            "requests": self.requests,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+        }
+
+
+_asr_pool = None
+_asr_pool_lock = threading.Lock()
+
+
+def get_asr_pool():
+    """Returns the process-wide model pool configured from settings"""
+
+    global _asr_pool
+    with _asr_pool_lock:
+        if _asr_pool is None:
+            _asr_pool = ASRPool(
+                settings.ASR_BACKEND,
+                batch_size=settings.ASR_BATCH_SIZE,
+                batch_wait=settings.ASR_BATCH_WAIT_MS / 1000,
+            )
+        return _asr_pool
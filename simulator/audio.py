@@ -0,0 +1,644 @@
+import hashlib
+import json
+import mmap
+import os
+import subprocess
+import tempfile
+import threading
+
+from django.conf import settings
+from pydub.utils import get_encoder_name
+
+from .tts import DiskBudget
+
+
+# Bytes of PCM moved per write, so memory stays flat whatever the input size
+CHUNK_SIZE = 64 * 1024
+
+
+def pcm_format():
+    """
+    Returns the raw PCM layout the audio pipeline works in
+
+    Returns:
+        dict: frame_rate, channels and sample_width taken from settings
+    """
+
+    return {
+        "frame_rate": settings.AUDIO_SAMPLE_RATE,
+        "channels": settings.AUDIO_CHANNELS,
+        "sample_width": settings.AUDIO_SAMPLE_WIDTH,
+    }
+
+
+def file_digest(path):
+    """
+    Returns the sha256 hex digest of a file's contents, read in chunks
+
+    Args:
+        path (str): Path to the file
+
+    Returns:
+        str: Hex digest
+    """
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def decode_pcm(path):
+    """
+    Decodes a whole audio file to raw PCM in the pipeline format
+
+    Only meant for single takes; builds stream files instead.
+
+    Raises:
+        RuntimeError: If the file cannot be decoded
+    """
+
+    command = [get_encoder_name(), "-loglevel", "error", "-i", str(path)]
+    command += ["-vn"] + _pcm_args(pcm_format()) + ["pipe:1"]
+    result = subprocess.run(command, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"Could not decode {path}: {result.stderr.decode(errors='replace')}"
+        )
+    return result.stdout
+
+
+def inputs_digest(parts):
+    """
+    Returns a sha256 hex digest identifying a build from its inputs
+
+    Args:
+        parts (list): JSON-serializable description of every input
+
+    Returns:
+        str: Hex digest
+    """
+
+    payload = json.dumps(parts, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _pcm_args(fmt):
+    return [
+        "-f",
+        f"s{fmt['sample_width'] * 8}le",
+        "-ar",
+        str(fmt["frame_rate"]),
+        "-ac",
+        str(fmt["channels"]),
+    ]
+
+
+# ========================
+# Streaming Encoder
+# ========================
+class AudioStreamWriter:
+    """
+    Encodes a sequence of audio files, segments and silences into one file.
+
+    Every input is converted to raw PCM and piped straight into a single
+    ffmpeg encoder, so building an output is linear in its length and only
+    one chunk of audio is held in memory at a time. The output is written to
+    a temporary file and moved into place on success.
+
+    Example:
+        >>> with AudioStreamWriter("/path/to/out.mp3") as writer:
+        ...     writer.add_file("/path/to/line.webm")
+        ...     writer.add_silence(750)
+    """
+
+    def __init__(self, output_path, format="mp3", bitrate=None, encoder_args=None):
+        self.output_path = str(output_path)
+        self.format = format
+        self.bitrate = bitrate or settings.AUDIO_BITRATE
+        self.encoder_args = list(encoder_args or [])
+        self.fmt = pcm_format()
+        self.frame_size = self.fmt["sample_width"] * self.fmt["channels"]
+        self.frames_written = 0
+        self._process = None
+        self._stderr = None
+        self._tmp_path = None
+
+    @property
+    def duration_ms(self):
+        return self.frames_written * 1000 // self.fmt["frame_rate"]
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    def open(self):
+        directory = os.path.dirname(self.output_path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(
+            suffix=f".{self.format}", dir=directory, prefix=".partial-"
+        )
+        os.close(fd)
+
+        command = [get_encoder_name(), "-y", "-loglevel", "error"]
+        command += _pcm_args(self.fmt) + ["-i", "pipe:0"]
+        command += ["-f", self.format, "-b:a", self.bitrate]
+        command += self.encoder_args + [self._tmp_path]
+
+        self._stderr = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=self._stderr,
+        )
+
+    def write_pcm(self, data):
+        """
+        Writes raw PCM already in the pipeline format
+
+        Raises:
+            RuntimeError: If the encoder has exited
+        """
+
+        if not data:
+            return
+        try:
+            self._process.stdin.write(data)
+        except BrokenPipeError as exc:
+            raise RuntimeError(f"Audio encoding failed: {self._encoder_error()}") from exc
+        self.frames_written += len(data) // self.frame_size
+
+    def add_segment(self, segment):
+        """Writes an in-memory AudioSegment"""
+
+        segment = (
+            segment.set_frame_rate(self.fmt["frame_rate"])
+            .set_channels(self.fmt["channels"])
+            .set_sample_width(self.fmt["sample_width"])
+        )
+        data = segment.raw_data
+        for start in range(0, len(data), CHUNK_SIZE):
+            self.write_pcm(data[start : start + CHUNK_SIZE])
+
+    def add_file(self, path):
+        """
+        Decodes an audio file and streams its samples into the encoder
+
+        The decoder runs as its own ffmpeg process, so the file is never
+        loaded into memory as a whole.
+
+        Raises:
+            RuntimeError: If the file cannot be decoded
+        """
+
+        command = [get_encoder_name(), "-loglevel", "error", "-i", str(path)]
+        command += ["-vn"] + _pcm_args(self.fmt) + ["pipe:1"]
+
+        with tempfile.TemporaryFile() as stderr:
+            decoder = subprocess.Popen(
+                command, stdout=subprocess.PIPE, stderr=stderr
+            )
+            remainder = b""
+            while True:
+                chunk = decoder.stdout.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                chunk = remainder + chunk
+                usable = len(chunk) - len(chunk) % self.frame_size
+                self.write_pcm(chunk[:usable])
+                remainder = chunk[usable:]
+            decoder.stdout.close()
+
+            if decoder.wait() != 0:
+                stderr.seek(0)
+                raise RuntimeError(
+                    f"Could not decode {path}: {stderr.read().decode(errors='replace')}"
+                )
+
+    def add_cached_file(self, path, process=False):
+        """
+        Streams a file's samples from the decoded PCM cache
+
+        The first call decodes the file into the cache; later calls
+        memory-map the raw samples instead of running a decoder.
+
+        Args:
+            path (str): Audio file to add
+            process (bool): Trim silence and normalize loudness first
+                (see simulator.analysis); this loads the take into memory
+        """
+
+        with get_pcm_cache().open(path) as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as samples:
+                if process:
+                    from .analysis import process_pcm
+
+                    data, _report = process_pcm(
+                        samples[:], self.fmt["frame_rate"], self.fmt["sample_width"]
+                    )
+                    for start in range(0, len(data), CHUNK_SIZE):
+                        self.write_pcm(data[start : start + CHUNK_SIZE])
+                    return
+
+                for start in range(0, len(samples), CHUNK_SIZE):
+                    self.write_pcm(samples[start : start + CHUNK_SIZE])
+
+    def add_silence(self, duration_ms):
+        """Writes duration_ms of digital silence without allocating it all at once"""
+
+        remaining = duration_ms * self.fmt["frame_rate"] // 1000 * self.frame_size
+        block = bytes(min(remaining, CHUNK_SIZE))
+        while remaining > 0:
+            size = min(remaining, len(block))
+            self.write_pcm(block[:size])
+            remaining -= size
+
+    def close(self):
+        """
+        Finishes encoding and moves the output into place
+
+        Returns:
+            bool: False (and no output file) if nothing was written
+
+        Raises:
+            RuntimeError: If the encoder fails
+        """
+
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            # The encoder exited early: its return code and stderr say why
+            pass
+        returncode = self._process.wait()
+        error = self._encoder_error()
+        self._stderr.close()
+
+        if returncode != 0:
+            self._discard()
+            raise RuntimeError(f"Audio encoding failed: {error}")
+
+        if self.frames_written == 0:
+            self._discard()
+            return False
+
+        os.replace(self._tmp_path, self.output_path)
+        return True
+
+    def abort(self):
+        """Stops the encoder and removes the partial output"""
+
+        if self._process and self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+        if self._stderr:
+            self._stderr.close()
+        self._discard()
+
+    def _encoder_error(self):
+        """Waits for the encoder to exit and returns what it wrote to stderr"""
+
+        self._process.wait()
+        self._stderr.seek(0)
+        return self._stderr.read().decode(errors="replace")
+
+    def _discard(self):
+        if self._tmp_path and os.path.exists(self._tmp_path):
+            os.unlink(self._tmp_path)
+
+
+# ========================
+# Decoded PCM Cache
+# ========================
+class PCMCache:
+    """
+    Raw decoded samples of audio files, keyed by content hash.
+
+    Each entry is the file decoded once to the pipeline PCM format, so
+    builds can memory-map it instead of running ffmpeg again. Entries are
+    evicted least-recently-used above max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._digests = {}
+        self._budget = DiskBudget(self.directory, max_bytes, suffix=".pcm")
+        self._lock = threading.Lock()
+
+    def digest_for(self, source_path):
+        """
+        Returns the sha256 hex digest of a source file
+
+        Digests are memoized per (path, size, mtime) so an unchanged file is
+        only hashed once per process.
+        """
+
+        stat = os.stat(source_path)
+        memo_key = (str(source_path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(memo_key)
+        if digest is None:
+            digest = file_digest(source_path)
+            with self._lock:
+                if len(self._digests) >= 10000:
+                    self._digests.clear()
+                self._digests[memo_key] = digest
+        return digest
+
+    def key_for(self, source_path):
+        """Returns the cache key of a source file"""
+
+        digest = self.digest_for(source_path)
+        fmt = pcm_format()
+        return f"{digest}-{fmt['frame_rate']}-{fmt['channels']}-{fmt['sample_width']}"
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.pcm")
+
+    def get(self, source_path):
+        """
+        Returns the raw PCM file for source_path, decoding it on a miss
+
+        Raises:
+            RuntimeError: If the file cannot be decoded
+        """
+
+        path = self.path_for(self.key_for(source_path))
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        else:
+            with self._lock:
+                self.hits += 1
+            return path
+
+        with self._lock:
+            self.misses += 1
+        self._decode(source_path, path)
+        self._budget.added(path)
+        return path
+
+    def open(self, source_path):
+        """
+        Opens the raw PCM of source_path for reading, decoding it on a miss
+
+        A concurrent build going over budget can evict the entry between
+        get() and the open; it is then decoded again. Once open, the file
+        stays readable even if it is evicted.
+
+        Raises:
+            RuntimeError: If the file cannot be decoded
+        """
+
+        try:
+            return open(self.get(source_path), "rb")
+        except FileNotFoundError:
+            return open(self.get(source_path), "rb")
+
+    def _decode(self, source_path, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+        os.close(fd)
+
+        command = [get_encoder_name(), "-y", "-loglevel", "error", "-i", str(source_path)]
+        command += ["-vn"] + _pcm_args(pcm_format()) + [tmp_path]
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            os.unlink(tmp_path)
+            raise RuntimeError(
+                f"Could not decode {source_path}: {result.stderr.decode(errors='replace')}"
+            )
+        os.replace(tmp_path, path)
+
+    def duration_ms(self, source_path):
+        """Returns the duration of a source file, measured on its decoded samples"""
+
+        fmt = pcm_format()
+        frame_bytes = fmt["channels"] * fmt["sample_width"]
+        with self.open(source_path) as f:
+            frames = os.fstat(f.fileno()).st_size // frame_bytes
+        return frames * 1000 // fmt["frame_rate"]
+
+    def invalidate(self, source_path):
+        """Drops the cached samples of a file that is being replaced or deleted"""
+
+        try:
+            path = self.path_for(self.key_for(source_path))
+        except FileNotFoundError:
+            return
+        try:
+            size = os.path.getsize(path)
+            os.unlink(path)
+        except FileNotFoundError:
+            return
+        self._budget.removed(size)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_pcm_cache = None
+_pcm_cache_lock = threading.Lock()
+
+
+def get_pcm_cache():
+    """Returns the process-wide decoded PCM cache configured from settings"""
+
+    global _pcm_cache
+    with _pcm_cache_lock:
+        if _pcm_cache is None:
+            _pcm_cache = PCMCache(settings.AUDIO_PCM_CACHE_DIR, settings.AUDIO_PCM_CACHE_MAX_BYTES)
+        return _pcm_cache
+
+
+# ========================
+# Encoded Segment Cache
+# ========================
+
+# Raw MP3 frames only (no ID3 tag, no Xing header), so segments can be
+# spliced byte for byte into a valid stream without decoding them
+SPLICEABLE_MP3_ARGS = ["-write_xing", "0", "-id3v2_version", "0"]
+
+
+class SegmentCache:
+    """
+    Encoded (recording + trailing pause) segments shared by dialogue builds.
+
+    Each segment is encoded once and stored under a hash of its source
+    recording, pause length and output format. A manifest per dialogue
+    remembers which segment every line used, so a rebuild only re-encodes
+    lines whose recording changed and splices the rest as raw MP3 frames.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self._budget = DiskBudget(self.directory, max_bytes, suffix=".mp3")
+
+    def segment_path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.mp3")
+
+    def manifest_path(self, dialogue_id):
+        return os.path.join(self.directory, "manifests", f"dialogue_{dialogue_id}.json")
+
+    def load_manifest(self, dialogue_id):
+        """Returns the previous build's entries keyed by line id"""
+
+        try:
+            with open(self.manifest_path(dialogue_id)) as f:
+                entries = json.load(f)["segments"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return {}
+        return {entry["line"]: entry for entry in entries}
+
+    def save_manifest(self, dialogue_id, entries):
+        path = self.manifest_path(dialogue_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".json", dir=os.path.dirname(path))
+        with os.fdopen(fd, "w") as f:
+            json.dump({"segments": entries}, f)
+        os.replace(tmp_path, path)
+
+    def make_entry(self, line_id, source_path, choose_pause, previous=None, process=False):
+        """
+        Describes the segment for one line, reusing the previous entry if possible
+
+        The source is only re-hashed when its name, size or mtime changed.
+
+        Args:
+            line_id (int): DialogueLine id (None for segments outside a dialogue)
+            source_path (str): Path to the source audio
+            choose_pause (callable): Returns the pause length in ms for a
+                source digest; it must be deterministic for reproducible builds
+            previous (dict): Entry for this line from the last manifest
+            process (bool): Trim and loudness-normalize the recording
+
+        Returns:
+            dict: Manifest entry with the segment key
+        """
+
+        stat = os.stat(source_path)
+        name = os.path.basename(source_path)
+        if previous and (previous["name"], previous["size"], previous["mtime_ns"]) == (
+            name,
+            stat.st_size,
+            stat.st_mtime_ns,
+        ):
+            source = previous["source"]
+        else:
+            source = file_digest(source_path)
+
+        pause_ms = choose_pause(source)
+
+        fmt = pcm_format()
+        payload = json.dumps(
+            [
+                source,
+                pause_ms,
+                fmt["frame_rate"],
+                fmt["channels"],
+                settings.AUDIO_BITRATE,
+                process,
+            ]
+        )
+        return {
+            "line": line_id,
+            "name": name,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "source": source,
+            "pause_ms": pause_ms,
+            "process": process,
+            "key": hashlib.sha256(payload.encode()).hexdigest(),
+        }
+
+    def ensure_segment(self, entry, source_path):
+        """
+        Returns the encoded segment for entry, encoding it only if missing
+
+        Returns:
+            tuple: (segment path, True if it had to be encoded)
+        """
+
+        path = self.segment_path(entry["key"])
+        try:
+            os.utime(path)
+            return path, False
+        except FileNotFoundError:
+            pass
+
+        with AudioStreamWriter(path, encoder_args=SPLICEABLE_MP3_ARGS) as writer:
+            writer.add_cached_file(source_path, process=entry.get("process", False))
+            writer.add_silence(entry["pause_ms"])
+        self._budget.added(path)
+        return path, True
+
+    def iter_splice(self, segment_paths, out):
+        """
+        Copies encoded segments to out, yielding each chunk as it is written
+
+        segment_paths may be a lazy iterable, so later segments can still be
+        encoding while earlier ones are already sent to a client.
+
+        Args:
+            segment_paths (iterable): Paths of encoded segments, in order
+            out (file): Binary file receiving the spliced MP3
+        """
+
+        for path in segment_paths:
+            with open(path, "rb") as segment:
+                while chunk := segment.read(CHUNK_SIZE):
+                    out.write(chunk)
+                    yield chunk
+
+    def splice(self, segment_paths, output_path):
+        """Joins encoded segments into output_path without decoding them"""
+
+        directory = os.path.dirname(output_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".mp3", dir=directory, prefix=".partial-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for _chunk in self.iter_splice(segment_paths, out):
+                    pass
+            os.replace(tmp_path, output_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+
+_segment_cache = None
+_segment_cache_lock = threading.Lock()
+
+
+def get_segment_cache():
+    """Returns the process-wide segment cache configured from settings"""
+
+    global _segment_cache
+    with _segment_cache_lock:
+        if _segment_cache is None:
+            _segment_cache = SegmentCache(
+                settings.AUDIO_SEGMENT_CACHE_DIR, settings.AUDIO_SEGMENT_CACHE_MAX_BYTES
+            )
+        return _segment_cache
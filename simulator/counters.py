@@ -0,0 +1,308 @@
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Subquery, Value, When
+
+from .models import Counter, Dialogue, DialogueLine, Participant, Simulation
+
+# Counter names per scope
+SCOPE_NAMES = {
+    "global": (
+        "simulations",
+        "completed_simulations",
+        "dialogues",
+        "participants",
+        "lines",
+        "recorded_lines",
+    ),
+    "simulation": ("dialogues", "lines", "recorded_lines"),
+    "dialogue": ("lines", "recorded_lines"),
+}
+
+
+# ========================
+# Updates
+# ========================
+def create_counters(scope, object_id):
+    """Creates the zeroed counters of a new simulation or dialogue"""
+
+    Counter.objects.bulk_create(
+        [
+            Counter(scope=scope, object_id=object_id, name=name)
+            for name in SCOPE_NAMES[scope]
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def delete_counters(scope, object_ids):
+    Counter.objects.filter(scope=scope, object_id__in=object_ids).delete()
+
+
+def bump(scope, object_id, **deltas):
+    """
+    Adds deltas to the counters of one object in a single UPDATE
+
+    Runs in the caller's transaction, so a rolled-back change leaves the
+    counters untouched. The signal receivers get one from CountedModel.save()
+    and from delete(); other callers must open their own. Missing counters are not created; `recount` fills
+    them in.
+
+    Args:
+        scope (str): "global", "simulation" or "dialogue"
+        object_id: Primary key (0 for global) or a subquery resolving to one
+        **deltas: Counter name to amount, e.g. lines=1, recorded_lines=-1
+    """
+
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    Counter.objects.filter(scope=scope, object_id=object_id, name__in=deltas).update(
+        value=F("value")
+        + Case(*(When(name=name, then=Value(delta)) for name, delta in deltas.items()))
+    )
+
+
+def line_changed(dialogue_id, **deltas):
+    """
+    Applies line deltas to a dialogue, its simulation and the global counters
+
+    Args:
+        dialogue_id: Dialogue primary key, or a subquery resolving to one
+        **deltas: lines and/or recorded_lines amounts
+    """
+
+    bump("dialogue", dialogue_id, **deltas)
+    bump(
+        "simulation",
+        Subquery(Dialogue.objects.filter(pk=dialogue_id).values("simulation_id")[:1]),
+        **deltas,
+    )
+    bump("global", 0, **deltas)
+
+
+def dialogue_of_line(line_id):
+    """Subquery resolving to the dialogue of a line, for bump()"""
+
+    return Subquery(DialogueLine.objects.filter(pk=line_id).values("dialogue_id")[:1])
+
+
+# ========================
+# Reads
+# ========================
+def read(scope, object_ids):
+    """
+    Returns the counters of several objects with one query
+
+    Returns:
+        dict: {object_id: {name: value}}, with 0 for missing counters
+    """
+
+    counts = {
+        object_id: dict.fromkeys(SCOPE_NAMES[scope], 0) for object_id in object_ids
+    }
+    rows = Counter.objects.filter(scope=scope, object_id__in=counts).values_list(
+        "object_id", "name", "value"
+    )
+    for object_id, name, value in rows:
+        counts[object_id][name] = value
+    return counts
+
+
+def global_counts():
+    """Returns the global counters as {name: value}"""
+
+    return read("global", [0])[0]
+
+
+# ========================
+# Reconciliation
+# ========================
+# Objects reconciled per transaction: only their counters are locked
+RECOUNT_BATCH_SIZE = 1000
+
+
+def actual_counts(scope, object_ids):
+    """
+    Computes the counters of existing objects from the source tables
+
+    Args:
+        scope (str): "global", "simulation" or "dialogue"
+        object_ids (list): Objects to compute ([0] for global); ids of
+            deleted objects are left out
+
+    Returns:
+        dict: {(object_id, name): value}
+    """
+
+    if scope == "global":
+        simulations = Simulation.objects.aggregate(
+            simulations=Count("pk"),
+            completed_simulations=Count("pk", filter=Q(status="completed")),
+        )
+        lines = DialogueLine.objects.aggregate(
+            lines=Count("pk"), recorded_lines=Count("recording")
+        )
+        values = {
+            **simulations,
+            **lines,
+            "dialogues": Dialogue.objects.count(),
+            "participants": Participant.objects.count(),
+        }
+        return {(0, name): values[name] for name in SCOPE_NAMES["global"]}
+
+    lines = {"lines": Count("pk"), "recorded_lines": Count("recording")}
+    if scope == "simulation":
+        existing = Simulation.objects.filter(pk__in=object_ids)
+        per_object = [
+            (
+                "simulation_id",
+                Dialogue.objects.filter(simulation_id__in=object_ids)
+                .values("simulation_id")
+                .annotate(dialogues=Count("pk")),
+            ),
+            (
+                "dialogue__simulation_id",
+                DialogueLine.objects.filter(dialogue__simulation_id__in=object_ids)
+                .values("dialogue__simulation_id")
+                .annotate(**lines),
+            ),
+        ]
+    else:
+        existing = Dialogue.objects.filter(pk__in=object_ids)
+        per_object = [
+            (
+                "dialogue_id",
+                DialogueLine.objects.filter(dialogue_id__in=object_ids)
+                .values("dialogue_id")
+                .annotate(**lines),
+            ),
+        ]
+
+    counts = {
+        (object_id, name): 0
+        for object_id in existing.values_list("pk", flat=True)
+        for name in SCOPE_NAMES[scope]
+    }
+    for key, rows in per_object:
+        for row in rows:
+            object_id = row.pop(key)
+            counts.update(((object_id, name), value) for name, value in row.items())
+    return counts
+
+
+def reconcile(scope, object_ids, dry_run=False):
+    """
+    Rewrites the counters of a few objects from the source tables
+
+    The counter rows are locked before counting: a concurrent change either
+    committed its bump first (and is counted) or waits for this transaction
+    (and bumps the corrected value). Only these objects' counters are locked.
+
+    Returns:
+        list: (scope, object_id, name, stored value or None, actual value)
+        for every counter that was wrong
+    """
+
+    with transaction.atomic():
+        stored = {
+            (counter.object_id, counter.name): counter
+            for counter in Counter.objects.select_for_update().filter(
+                scope=scope, object_id__in=object_ids
+            )
+        }
+        actual = actual_counts(scope, object_ids)
+
+        corrections = []
+        to_create, to_update = [], []
+        for (object_id, name), value in actual.items():
+            counter = stored.pop((object_id, name), None)
+            if counter is None:
+                to_create.append(
+                    Counter(scope=scope, object_id=object_id, name=name, value=value)
+                )
+                corrections.append((scope, object_id, name, None, value))
+            elif counter.value != value:
+                corrections.append((scope, object_id, name, counter.value, value))
+                counter.value = value
+                to_update.append(counter)
+        # Counters of deleted objects
+        corrections += [
+            (scope, object_id, name, counter.value, 0)
+            for (object_id, name), counter in stored.items()
+        ]
+
+        if not dry_run:
+            Counter.objects.bulk_create(to_create, ignore_conflicts=True)
+            Counter.objects.bulk_update(to_update, ["value"])
+            Counter.objects.filter(pk__in=[c.pk for c in stored.values()]).delete()
+    return corrections
+
+
+def recount(dry_run=False, batch_size=RECOUNT_BATCH_SIZE):
+    """
+    Rewrites every counter from the source tables, batch by batch
+
+    Safe on a live system: each batch only locks its own counters while
+    it is counted. Counters of deleted objects are removed and missing
+    ones created.
+
+    Returns:
+        list: (scope, object_id, name, stored value or None, actual value)
+        for every counter that was wrong
+    """
+
+    corrections = []
+    for scope, model in (("dialogue", Dialogue), ("simulation", Simulation)):
+        # Existing objects, plus deleted ones that still have counters
+        object_ids = sorted(
+            set(model.objects.values_list("pk", flat=True))
+            | set(
+                Counter.objects.filter(scope=scope)
+                .values_list("object_id", flat=True)
+                .distinct()
+            )
+        )
+        for start in range(0, len(object_ids), batch_size):
+            batch = object_ids[start : start + batch_size]
+            corrections += reconcile(scope, batch, dry_run)
+    corrections += reconcile("global", [0], dry_run)
+    return corrections
+
+
+def refresh_dialogues(dialogue_ids):
+    """
+    Reconciles the counters of a few dialogues after a bulk operation
+
+    bulk_create() and QuerySet.update() send no signals. The dialogue
+    counters are locked and recounted, and the differences are applied to
+    their simulations and the global counters as F() increments.
+    """
+
+    dialogue_ids = set(dialogue_ids)
+    if not dialogue_ids:
+        return
+
+    with transaction.atomic():
+        stored = read_for_update("dialogue", dialogue_ids)
+        actual = actual_counts("dialogue", dialogue_ids)
+        for dialogue_id in dialogue_ids:
+            deltas = {
+                name: actual.get((dialogue_id, name), 0) - stored[dialogue_id][name]
+                for name in SCOPE_NAMES["dialogue"]
+            }
+            line_changed(dialogue_id, **deltas)
+
+
+def read_for_update(scope, object_ids):
+    """read() that locks the counter rows until the end of the transaction"""
+
+    counts = {
+        object_id: dict.fromkeys(SCOPE_NAMES[scope], 0) for object_id in object_ids
+    }
+    rows = (
+        Counter.objects.select_for_update()
+        .filter(scope=scope, object_id__in=counts)
+        .values_list("object_id", "name", "value")
+    )
+    for object_id, name, value in rows:
+        counts[object_id][name] = value
+    return counts
@@ -0,0 +1,340 @@
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import AudioJob, Dialogue, LineRecording, Simulation
+from .storage import get_audio_storage
+
+
+# ========================
+# Job Handlers
+# ========================
+HANDLERS = {}
+
+
+def register(kind):
+    """Registers a handler taking an object id and returning a media path"""
+
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+
+    return decorator
+
+
+@register("dialogue_audio")
+def build_dialogue_audio(object_id):
+    dialogue = Dialogue.objects.select_related("simulation").filter(pk=object_id).first()
+    if dialogue is None:
+        # Deleted since the job was queued
+        return ""
+    if not dialogue.generate_complete_audio():
+        raise RuntimeError("No recordings found")
+
+    if settings.AUDIO_OUTPUT_MODE == "playlist":
+        # Rebuild a completed simulation whose manifest was dropped with this one's
+        simulation = dialogue.simulation
+        if simulation.status == "completed" and not simulation.has_audio:
+            enqueue("simulation_audio", simulation.pk)
+        # Playlist builds have no file; the payload points at the playlist instead
+        return ""
+    return dialogue.complete_audio.name
+
+
+@register("simulation_audio")
+def build_simulation_audio(object_id):
+    from .utils import generate_simulation_audio
+
+    simulation = Simulation.objects.get(pk=object_id)
+
+    if settings.AUDIO_OUTPUT_MODE == "playlist":
+        from .playlist import build_simulation_manifest
+
+        manifest = build_simulation_manifest(simulation)
+        if not manifest:
+            raise RuntimeError("No dialogue audios found")
+        # A file from an earlier build in file mode would be stale
+        simulation.audio_manifest = manifest
+        simulation.final_audio = None
+        simulation.save(update_fields=["audio_manifest", "final_audio"])
+        return ""
+
+    audio_path = generate_simulation_audio(simulation)
+    if not audio_path:
+        raise RuntimeError("No dialogue audios found")
+
+    simulation.final_audio = audio_path
+    simulation.audio_manifest = None
+    simulation.save(update_fields=["final_audio", "audio_manifest"])
+    return audio_path
+
+
+@register("normalize_recording")
+def normalize_recording(object_id):
+    from .utils import normalize_line_recording
+
+    recording = LineRecording.objects.filter(pk=object_id).first()
+    if recording is None:
+        return ""
+    if not recording.normalized_audio:
+        normalize_line_recording(recording)
+
+    if settings.ASR_ENABLED and not recording.dialogue_line.participant.is_system:
+        enqueue("transcribe_recording", recording.pk)
+    return recording.normalized_audio.name if recording.normalized_audio else ""
+
+
+@register("transcribe_recording")
+def transcribe_recording(object_id):
+    from .scoring import score_transcript
+    from .utils import transcribe_audio
+
+    recording = (
+        LineRecording.objects.select_related("dialogue_line")
+        .filter(pk=object_id)
+        .first()
+    )
+    if recording is None:
+        return ""
+    recording.transcript = (
+        "" if recording.is_silent else transcribe_audio(recording.playback_file.path)
+    )
+    scores = score_transcript(recording.transcript, recording.dialogue_line.text)
+    recording.char_score = scores["char_score"]
+    recording.word_score = scores["word_score"]
+    recording.save(update_fields=["transcript", "char_score", "word_score"])
+    return ""
+
+
+# ========================
+# Queue API
+# ========================
+def enqueue(kind, object_id, max_attempts=None):
+    """
+    Queues an audio job, reusing a pending job for the same target
+
+    Args:
+        kind (str): One of AudioJob.KIND_CHOICES
+        object_id (int): Primary key of the dialogue/simulation/recording
+        max_attempts (int): Retries before the job is marked failed
+
+    Returns:
+        AudioJob: The queued (or, with AUDIO_JOBS_EAGER, finished) job
+    """
+
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown audio job kind: {kind}")
+
+    pending = AudioJob.objects.filter(kind=kind, object_id=object_id, status="pending")
+    job = pending.first()
+    while job is None:
+        try:
+            with transaction.atomic():
+                job = AudioJob.objects.create(
+                    kind=kind,
+                    object_id=object_id,
+                    max_attempts=max_attempts or settings.AUDIO_JOB_MAX_ATTEMPTS,
+                )
+        except IntegrityError:
+            # Queued by another process since the lookup (unique_pending_audio_job);
+            # if it was already claimed too, try again
+            job = pending.first()
+
+    if settings.AUDIO_JOBS_EAGER and claim(job.pk, worker="eager"):
+        job.refresh_from_db()
+        run_job(job)
+
+    return job
+
+
+def enqueue_many(kind, object_ids):
+    """
+    Queues one job per object id with a single INSERT
+
+    Targets that already have a pending job are skipped by the database.
+
+    Returns:
+        list: The AudioJob instances passed to the INSERT
+    """
+
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown audio job kind: {kind}")
+
+    if settings.AUDIO_JOBS_EAGER:
+        return [enqueue(kind, object_id) for object_id in object_ids]
+
+    return AudioJob.objects.bulk_create(
+        [
+            AudioJob(
+                kind=kind,
+                object_id=object_id,
+                max_attempts=settings.AUDIO_JOB_MAX_ATTEMPTS,
+            )
+            for object_id in object_ids
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def claim(job_pk, worker):
+    """
+    Atomically moves a pending job to running
+
+    Uses a conditional UPDATE rather than row locks, so it behaves the same
+    on SQLite and PostgreSQL.
+
+    Returns:
+        bool: True if this worker owns the job
+    """
+
+    now = timezone.now()
+    return bool(
+        AudioJob.objects.filter(pk=job_pk, status="pending").update(
+            status="running",
+            worker=worker,
+            started_at=now,
+            heartbeat_at=now,
+            attempts=F("attempts") + 1,
+        )
+    )
+
+
+def claim_next(worker):
+    """
+    Claims the oldest runnable job
+
+    Returns:
+        AudioJob: The claimed job or None if the queue is empty
+    """
+
+    while True:
+        job_pk = (
+            AudioJob.objects.filter(status="pending", run_after__lte=timezone.now())
+            .order_by("run_after", "pk")
+            .values_list("pk", flat=True)
+            .first()
+        )
+        if job_pk is None:
+            return None
+        if claim(job_pk, worker):
+            return AudioJob.objects.get(pk=job_pk)
+
+
+def run_job(job):
+    """
+    Runs a claimed job and records its outcome
+
+    Failures are retried with exponential backoff until max_attempts. A
+    failure is not retried if another job for the same target was queued
+    meanwhile: that job does the work.
+    """
+
+    try:
+        job.result = HANDLERS[job.kind](job.object_id) or ""
+    except Exception:
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            delay = settings.AUDIO_JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            job.status = "pending"
+            job.run_after = timezone.now() + timedelta(seconds=delay)
+        else:
+            job.status = "failed"
+            job.finished_at = timezone.now()
+    else:
+        job.status = "succeeded"
+        job.error = ""
+        job.finished_at = timezone.now()
+
+    fields = ["status", "result", "error", "run_after", "finished_at"]
+    try:
+        with transaction.atomic():
+            job.save(update_fields=fields)
+    except IntegrityError:
+        job.status = "failed"
+        job.finished_at = timezone.now()
+        job.save(update_fields=fields)
+    return job
+
+
+def heartbeat(worker_prefix):
+    """
+    Marks the running jobs of a worker process as alive
+
+    Args:
+        worker_prefix (str): Worker id shared by the process's slots
+
+    Returns:
+        int: Number of jobs touched
+    """
+
+    return AudioJob.objects.filter(
+        status="running", worker__startswith=worker_prefix
+    ).update(heartbeat_at=timezone.now())
+
+
+def requeue_stale(timeout):
+    """
+    Recovers jobs whose worker died (crash, OOM kill, lost host)
+
+    A running job is stale once its heartbeat is older than timeout, so
+    jobs of live workers are never taken over however long they run. The
+    attempt was counted when the job was claimed: stale jobs with attempts
+    left go back to the queue, the others are marked failed, so a job that
+    kills its worker is not retried forever, and so do those whose target
+    was queued again meanwhile.
+
+    Args:
+        timeout (int): Seconds without a heartbeat after which a job is lost
+
+    Returns:
+        tuple: (jobs requeued, jobs failed)
+    """
+
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=timeout)
+    stale = AudioJob.objects.filter(status="running").filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    )
+    failed = stale.filter(attempts__gte=F("max_attempts")).update(
+        status="failed",
+        finished_at=now,
+        error="Worker lost while running the job",
+    )
+    requeued = 0
+    for job_pk in stale.filter(attempts__lt=F("max_attempts")).values_list("pk", flat=True):
+        try:
+            with transaction.atomic():
+                requeued += stale.filter(pk=job_pk).update(status="pending", run_after=now)
+        except IntegrityError:
+            failed += stale.filter(pk=job_pk).update(
+                status="failed",
+                finished_at=now,
+                error="Worker lost while running the job; already queued again",
+            )
+    return requeued, failed
+
+
+# Playlist endpoints for jobs that build a manifest instead of a file
+PLAYLIST_URLS = {
+    "dialogue_audio": "simulator:dialogue_playlist",
+    "simulation_audio": "simulator:simulation_playlist",
+}
+
+
+def job_payload(job):
+    """Serializes a job for the polling endpoint"""
+
+    payload = {"success": job.status != "failed", "job_id": job.pk, "status": job.status}
+    playlist = settings.AUDIO_OUTPUT_MODE == "playlist" and job.kind in PLAYLIST_URLS
+    if job.status == "succeeded" and playlist:
+        payload["playlist_url"] = reverse(PLAYLIST_URLS[job.kind], args=[job.object_id])
+    elif job.status == "succeeded" and job.result:
+        payload["audio_url"] = get_audio_storage().url(job.result)
+    if job.status == "failed":
+        payload["error"] = job.error.strip().splitlines()[-1] if job.error else ""
+    return payload
@@ -21,16 +21,16 @@ class Command(BaseCommand):
             user.save()
             self.stdout.write(self.style.SUCCESS(f"Created user: {user.email}"))
 
-        # Create participants
-        marie = Participant.objects.create(
-            user=user, speaker_name="Marie", is_system=False
+        # Get or create participants, so running the command again reuses them
+        marie, _ = Participant.objects.get_or_create(
+            user=user, speaker_name="Marie", defaults={"is_system": False}
         )
 
-        serveur = Participant.objects.create(
-            user=user, speaker_name="Serveur", is_system=True
+        serveur, _ = Participant.objects.get_or_create(
+            user=user, speaker_name="Serveur", defaults={"is_system": True}
         )
 
-        self.stdout.write(self.style.SUCCESS("Created participants"))
+        self.stdout.write(self.style.SUCCESS("Participants ready"))
 
         # Create simulation
         simulation = Simulation.objects.create(title="Au Restaurant")
@@ -0,0 +1,272 @@
+"""
+Django management command that generates a large synthetic dataset for
+load and query benchmarking.
+
+Usage:
+    python manage.py generate_scale_data --scale 100000
+    python manage.py generate_scale_data --scale 1000000 --audio tiny --seed 7
+
+--scale is the number of dialogue lines; users, participants, simulations,
+dialogues and recordings are derived from it at the ratios below. The same
+seed always produces the same data. Rows are inserted with bulk_create()
+in batches, so a million lines take minutes, and the counters are
+recounted at the end since bulk inserts send no signals.
+
+Recordings either have no audio (--audio none, the default) or all share
+one short silent clip (--audio tiny), enough for the audio pipeline.
+"""
+
+import io
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from pydub import AudioSegment
+
+from simulator.counters import recount
+from simulator.models import (
+    Dialogue,
+    DialogueLine,
+    LineRecording,
+    Participant,
+    Simulation,
+)
+
+User = get_user_model()
+
+# Ratios
+LINES_PER_DIALOGUE = 8
+DIALOGUES_PER_SIMULATION = 5
+SIMULATIONS_PER_USER = 5
+
+# Share of simulations per status; completed simulations have every learner
+# line recorded, simulations in progress their first dialogues
+STATUS_WEIGHTS = {"pending": 2, "in_progress": 3, "completed": 5}
+
+SPEAKERS = [("Client", False), ("Apprenant", False), ("Serveur", True), ("Vendeur", True)]
+
+TOPICS = ["Au restaurant", "Au marché", "À la gare", "À l'hôtel", "Chez le médecin", "À la banque"]
+
+PHRASES = [
+    "Bonjour, comment allez-vous?",
+    "Je voudrais un café, s'il vous plaît.",
+    "Combien ça coûte?",
+    "Merci beaucoup, bonne journée!",
+    "Vous avez réservé?",
+    "Une table pour deux personnes.",
+    "Je cherche la gare, c'est loin d'ici?",
+    "Pouvez-vous répéter plus lentement?",
+    "L'addition, s'il vous plaît.",
+    "Je ne comprends pas.",
+    "À quelle heure part le prochain train?",
+    "Voici votre clé, chambre douze.",
+]
+
+EMAIL_PATTERN = "scale-{seed}-{index}@example.com"
+
+
+class Command(BaseCommand):
+    help = "Generates synthetic users, simulations, dialogues, lines and recordings"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale", type=int, required=True, help="Number of dialogue lines"
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Random seed (default: 0)"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Lines inserted per transaction (default: 5000)",
+        )
+        parser.add_argument(
+            "--audio",
+            choices=["none", "tiny"],
+            default="none",
+            help="Recording audio: none, or one shared silent clip",
+        )
+
+    def handle(self, *args, **options):
+        scale = options["scale"]
+        if scale < 1:
+            raise CommandError("--scale must be at least 1")
+
+        seed = options["seed"]
+        if User.objects.filter(email=EMAIL_PATTERN.format(seed=seed, index=0)).exists():
+            raise CommandError(
+                f"Data for seed {seed} already exists; use another --seed or a fresh database"
+            )
+
+        self.rng = random.Random(seed)
+        self.audio_name = self.tiny_audio() if options["audio"] == "tiny" else ""
+
+        dialogues = -(-scale // LINES_PER_DIALOGUE)
+        simulations = -(-dialogues // DIALOGUES_PER_SIMULATION)
+        users = -(-simulations // SIMULATIONS_PER_USER)
+        self.stdout.write(
+            f"Generating {users} users, {simulations} simulations, "
+            f"{dialogues} dialogues and {scale} lines (seed {seed})"
+        )
+
+        started = time.monotonic()
+        speakers = self.create_users(users, seed)
+
+        per_batch = max(
+            1, options["batch_size"] // (LINES_PER_DIALOGUE * DIALOGUES_PER_SIMULATION)
+        )
+        remaining = scale
+        totals = {"lines": 0, "recordings": 0}
+        for first in range(0, simulations, per_batch):
+            count = min(per_batch, simulations - first)
+            with transaction.atomic():
+                lines, recordings = self.create_simulations(
+                    first, count, remaining, speakers
+                )
+            remaining -= lines
+            totals["lines"] += lines
+            totals["recordings"] += recordings
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"{totals['lines']}/{scale} lines "
+                f"({totals['lines'] / elapsed if elapsed else 0:.0f} lines/s)"
+            )
+
+        self.stdout.write("Recounting counters...")
+        recount()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {totals['lines']} lines and {totals['recordings']} recordings "
+                f"in {time.monotonic() - started:.1f}s"
+            )
+        )
+
+    def tiny_audio(self):
+        """Stores a 200 ms silent MP3 once and returns its name"""
+
+        buffer = io.BytesIO()
+        AudioSegment.silent(duration=200).export(buffer, format="mp3")
+        storage = LineRecording._meta.get_field("audio_file").storage
+        return storage.save("simulations/lines/scale_silence.mp3", ContentFile(buffer.getvalue()))
+
+    def create_users(self, count, seed):
+        """
+        Creates the users and their participants
+
+        Returns:
+            list: (learner participant ids, system participant ids) per user
+        """
+
+        # Hashing is deliberately slow; every generated user shares one hash
+        password = make_password("password123")
+        users = User.objects.bulk_create(
+            (
+                User(email=EMAIL_PATTERN.format(seed=seed, index=index), password=password)
+                for index in range(count)
+            ),
+            batch_size=1000,
+        )
+        participants = Participant.objects.bulk_create(
+            (
+                Participant(user=user, speaker_name=name, is_system=is_system)
+                for user in users
+                for name, is_system in SPEAKERS
+            ),
+            batch_size=1000,
+        )
+
+        speakers = []
+        for index in range(0, len(participants), len(SPEAKERS)):
+            group = participants[index : index + len(SPEAKERS)]
+            speakers.append(
+                (
+                    [p.pk for p in group if not p.is_system],
+                    [p.pk for p in group if p.is_system],
+                )
+            )
+        return speakers
+
+    def create_simulations(self, first, count, max_lines, speakers):
+        """
+        Creates `count` simulations with their dialogues, lines and recordings
+
+        Returns:
+            tuple: (lines created, recordings created)
+        """
+
+        statuses = self.rng.choices(
+            list(STATUS_WEIGHTS), weights=list(STATUS_WEIGHTS.values()), k=count
+        )
+        simulations = Simulation.objects.bulk_create(
+            Simulation(title=f"Simulation {first + index + 1}", status=status)
+            for index, status in enumerate(statuses)
+        )
+
+        dialogues = []
+        for index, simulation in enumerate(simulations):
+            for order in range(1, DIALOGUES_PER_SIMULATION + 1):
+                if len(dialogues) * LINES_PER_DIALOGUE >= max_lines:
+                    break
+                dialogue = Dialogue(
+                    simulation=simulation,
+                    title=f"{self.rng.choice(TOPICS)} {order}",
+                    difficulty_level=self.rng.choice(Dialogue.DIFFICULTY_CHOICES)[0],
+                    order=order,
+                )
+                dialogue.speakers = speakers[(first + index) // SIMULATIONS_PER_USER]
+                dialogues.append(dialogue)
+        Dialogue.objects.bulk_create(dialogues)
+
+        members, lines, recorded = [], [], []
+        for dialogue in dialogues:
+            learners, systems = dialogue.speakers
+            learner, system = self.rng.choice(learners), self.rng.choice(systems)
+            members += [
+                Dialogue.participants.through(dialogue_id=dialogue.pk, participant_id=learner),
+                Dialogue.participants.through(dialogue_id=dialogue.pk, participant_id=system),
+            ]
+
+            simulation = dialogue.simulation
+            is_recorded = simulation.status == "completed" or (
+                simulation.status == "in_progress"
+                and dialogue.order <= DIALOGUES_PER_SIMULATION // 2
+            )
+            for order in range(1, LINES_PER_DIALOGUE + 1):
+                if len(lines) == max_lines:
+                    break
+                line = DialogueLine(
+                    dialogue_id=dialogue.pk,
+                    participant_id=system if order % 2 else learner,
+                    order=order,
+                    text=self.rng.choice(PHRASES),
+                )
+                lines.append(line)
+                if is_recorded and not order % 2:
+                    recorded.append(line)
+
+        Dialogue.participants.through.objects.bulk_create(members)
+        DialogueLine.objects.bulk_create(lines)
+        LineRecording.objects.bulk_create(
+            LineRecording(
+                dialogue_line_id=line.pk,
+                audio_file=self.audio_name,
+                duration_ms=self.rng.randint(800, 4000),
+                rms_dbfs=round(self.rng.uniform(-30, -12), 1),
+            )
+            for line in recorded
+        )
+
+        started = []
+        for index, simulation in enumerate(simulations):
+            if simulation.status != "pending":
+                simulation.current_dialogue_id = dialogues[index * DIALOGUES_PER_SIMULATION].pk
+                started.append(simulation)
+        Simulation.objects.bulk_update(started, ["current_dialogue"])
+        return len(lines), len(recorded)
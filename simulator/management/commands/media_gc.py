@@ -0,0 +1,189 @@
+"""
+Django management command that reclaims media storage.
+
+Usage:
+    python manage.py media_gc --dry-run            # Report only
+    python manage.py media_gc                      # Delete orphaned files
+    python manage.py media_gc --retention-days 30  # Also drop old line recordings
+    python manage.py media_gc --dry-run --usage    # Per-user storage report
+    python manage.py media_gc --dedupe             # Share blobs for existing files
+
+Orphans are files under MEDIA_ROOT that no FileField of the simulator app
+and no playlist manifest references (old builds, crashed-build leftovers,
+test files). Files younger than --min-age are never touched. Blobs of the
+deduplicating audio storage are removed once no file links to them.
+"""
+
+import os
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from simulator.models import LineRecording
+from simulator.retention import (
+    deduplicate_media,
+    delete_media_files,
+    expired_recordings,
+    find_orphans,
+    find_unreferenced_blobs,
+    storage_by_user,
+)
+
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+class Command(BaseCommand):
+    help = "Deletes orphaned media files and applies media retention policies"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would be deleted without deleting anything",
+        )
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=settings.MEDIA_GC_MIN_AGE,
+            help="Only collect orphans older than this many seconds",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Files or recordings deleted per batch",
+        )
+        parser.add_argument(
+            "--retention-days",
+            type=int,
+            default=settings.MEDIA_RETENTION_DAYS,
+            help="Drop line recordings this many days after their simulation "
+            "was completed and its final audio exists",
+        )
+        parser.add_argument(
+            "--dedupe",
+            action="store_true",
+            help="Move files stored before deduplication into the blob store",
+        )
+        parser.add_argument(
+            "--usage",
+            action="store_true",
+            help="Print storage used per user",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1 or options["min_age"] < 0:
+            raise CommandError("--batch-size must be positive and --min-age not negative")
+
+        dry_run = options["dry_run"]
+        if dry_run:
+            self.stdout.write(self.style.WARNING("Dry run: nothing will be deleted"))
+
+        if options["retention_days"] is not None:
+            self.apply_retention(options["retention_days"], options["batch_size"], dry_run)
+
+        self.collect_orphans(options["min_age"], options["batch_size"], dry_run)
+        self.collect_blobs(options["min_age"], dry_run)
+
+        if options["dedupe"] and not dry_run:
+            adopted, freed = deduplicate_media()
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Dedupe: {adopted} file(s) moved to the blob store, "
+                    f"{format_bytes(freed)} freed"
+                )
+            )
+
+        if options["usage"]:
+            self.report_usage()
+
+    def apply_retention(self, days, batch_size, dry_run):
+        """Deletes expired line recordings; django_cleanup removes their files"""
+
+        expired = expired_recordings(days)
+        if dry_run:
+            total = 0
+            count = 0
+            for recording in expired.iterator():
+                count += 1
+                for field_file in (recording.audio_file, recording.normalized_audio):
+                    if field_file and os.path.exists(field_file.path):
+                        total += os.path.getsize(field_file.path)
+            self.stdout.write(
+                f"Retention ({days} days): {count} recording(s), {format_bytes(total)}"
+            )
+            return
+
+        deleted = 0
+        while True:
+            pks = list(expired.values_list("pk", flat=True)[:batch_size])
+            if not pks:
+                break
+            deleted += LineRecording.objects.filter(pk__in=pks).delete()[0]
+            self.stdout.write(f"  deleted {deleted} expired recording(s)...")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Retention ({days} days): deleted {deleted} recording(s)")
+        )
+
+    def collect_orphans(self, min_age, batch_size, dry_run):
+        orphans = find_orphans(min_age)
+
+        by_directory = defaultdict(lambda: [0, 0])
+        for path, size in orphans:
+            stats = by_directory[os.path.dirname(path) or "."]
+            stats[0] += 1
+            stats[1] += size
+
+        for directory, (count, size) in sorted(by_directory.items()):
+            self.stdout.write(f"  {directory}/: {count} file(s), {format_bytes(size)}")
+
+        total = sum(size for _path, size in orphans)
+        if dry_run:
+            self.stdout.write(f"Orphans: {len(orphans)} file(s), {format_bytes(total)}")
+            return
+
+        removed = 0
+        for start in range(0, len(orphans), batch_size):
+            batch = orphans[start : start + batch_size]
+            removed += delete_media_files(path for path, _size in batch)
+            self.stdout.write(f"  removed {removed}/{len(orphans)} orphan(s)...")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Orphans: removed {removed} file(s), {format_bytes(total)}")
+        )
+
+    def collect_blobs(self, min_age, dry_run):
+        blobs = find_unreferenced_blobs(min_age)
+        total = sum(size for _path, size in blobs)
+        if dry_run:
+            self.stdout.write(f"Unreferenced blobs: {len(blobs)}, {format_bytes(total)}")
+            return
+
+        for path, _size in blobs:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Unreferenced blobs: removed {len(blobs)}, {format_bytes(total)}"
+            )
+        )
+
+    def report_usage(self):
+        quota = settings.MEDIA_USER_QUOTA_BYTES
+        usage = storage_by_user()
+
+        self.stdout.write("Storage by user:")
+        for email, size in sorted(usage.items(), key=lambda item: -item[1]):
+            line = f"  {email or '(shared / generated)'}: {format_bytes(size)}"
+            if email and quota and size > quota:
+                line = self.style.ERROR(f"{line} (over quota of {format_bytes(quota)})")
+            self.stdout.write(line)
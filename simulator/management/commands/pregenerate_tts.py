@@ -0,0 +1,184 @@
+"""
+Django management command that synthesizes TTS for system lines ahead of time.
+
+Usage:
+    python manage.py pregenerate_tts --all
+    python manage.py pregenerate_tts --simulation 3 --concurrency 8
+    python manage.py pregenerate_tts --dialogue 12
+    python manage.py pregenerate_tts --all --analyze   # Phrase reuse report only
+
+Only lines without a LineRecording are processed and recordings are saved
+batch by batch, so an interrupted run can simply be started again. A line
+recorded by someone else while its batch was synthesized keeps that
+recording, and the clip made here is deleted.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from simulator.counters import refresh_dialogues
+from simulator.jobs import enqueue_many
+from simulator.models import DialogueLine, LineRecording
+from simulator.phrases import catalogue_report, phrase_stats
+from simulator.storage import get_audio_storage
+from simulator.tts import get_tts_cache
+from simulator.tts_providers import get_tts_service
+from simulator.utils import synthesize_system_line
+
+
+class Command(BaseCommand):
+    help = "Pre-generates TTS recordings for system participant lines"
+
+    def add_arguments(self, parser):
+        scope = parser.add_mutually_exclusive_group(required=True)
+        scope.add_argument("--simulation", type=int, help="Simulation id")
+        scope.add_argument("--dialogue", type=int, help="Dialogue id")
+        scope.add_argument(
+            "--all", action="store_true", help="Every simulation and dialogue"
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=settings.TTS_PREGENERATE_CONCURRENCY,
+            help="Maximum number of lines synthesized in parallel",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Lines synthesized and saved per batch",
+        )
+        parser.add_argument(
+            "--analyze",
+            action="store_true",
+            help="Report how often lines and phrases repeat, without synthesizing",
+        )
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1 or options["batch_size"] < 1:
+            raise CommandError("--concurrency and --batch-size must be positive")
+
+        lines = DialogueLine.objects.filter(participant__is_system=True)
+        if options["simulation"]:
+            lines = lines.filter(dialogue__simulation_id=options["simulation"])
+        elif options["dialogue"]:
+            lines = lines.filter(dialogue_id=options["dialogue"])
+
+        if options["analyze"]:
+            self.report_reuse(lines.values_list("text", flat=True))
+            return
+
+        lines = lines.filter(recording__isnull=True)
+
+        total = lines.count()
+        self.stdout.write(f"{total} system line(s) without audio")
+
+        created = failed = 0
+        last_pk = 0
+        started = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            while True:
+                batch = list(
+                    lines.filter(pk__gt=last_pk)
+                    .order_by("pk")
+                    .only("pk", "text", "dialogue_id")[: options["batch_size"]]
+                )
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+
+                recordings = []
+                for line, result in zip(batch, executor.map(self.synthesize, batch)):
+                    if isinstance(result, Exception):
+                        failed += 1
+                        self.stderr.write(f"Line {line.pk}: {result}")
+                        continue
+                    recordings.append(
+                        LineRecording(dialogue_line=line, audio_file=result)
+                    )
+
+                LineRecording.objects.bulk_create(recordings, ignore_conflicts=True)
+                recordings = self.discard_lost(recordings)
+                # bulk_create() sends no signals
+                refresh_dialogues(line.dialogue_id for line in batch)
+                enqueue_many(
+                    "normalize_recording", [r.dialogue_line_id for r in recordings]
+                )
+                created += len(recordings)
+
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"{created + failed}/{total} lines "
+                    f"({created / elapsed if elapsed else 0:.1f} lines/s)"
+                )
+
+        elapsed = time.monotonic() - started
+        stats = get_tts_cache().stats()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✓ Created {created} recording(s) in {elapsed:.1f}s "
+                f"({created / elapsed if elapsed else 0:.1f} lines/s), "
+                f"{failed} failed, TTS cache hit rate {stats['hit_rate']:.0%}"
+            )
+        )
+        for name, provider in get_tts_service().stats().items():
+            self.stdout.write(
+                f"  {name}: {provider['calls']} call(s), {provider['failures']} failed "
+                f"({provider['timeouts']} timeouts), p50 {provider['p50_ms']:.0f} ms, "
+                f"p99 {provider['p99_ms']:.0f} ms, circuit {provider['circuit']}"
+            )
+        if settings.TTS_PHRASE_SEGMENTATION:
+            phrases = phrase_stats.stats()
+            self.stdout.write(
+                f"  phrases: {phrases['lookups']} lookup(s), hit rate "
+                f"{phrases['hit_rate']:.0%}, {phrases['chars_synthesized']}/"
+                f"{phrases['chars']} characters synthesized"
+            )
+
+    def report_reuse(self, texts):
+        report = catalogue_report(texts.iterator())
+        self.stdout.write(
+            f"Lines: {report['lines']} ({report['distinct_lines']} distinct), "
+            f"whole-line cache hit rate {report['line_hit_rate']:.0%}, "
+            f"{report['chars_line_cache']} characters to synthesize"
+        )
+        self.stdout.write(
+            f"Phrases: {report['phrases']} ({report['distinct_phrases']} distinct), "
+            f"phrase cache hit rate {report['phrase_hit_rate']:.0%}, "
+            f"{report['chars_phrase_cache']} characters to synthesize"
+        )
+
+    @staticmethod
+    def discard_lost(recordings):
+        """
+        Returns the recordings that were inserted, deleting the others' files
+
+        bulk_create(ignore_conflicts=True) silently skips lines that got a
+        recording since the batch was read; their clips are referenced by
+        nothing. The storage gave each clip a unique name, so a row still
+        pointing at it is ours.
+        """
+
+        stored = dict(
+            LineRecording.objects.filter(
+                pk__in=[r.dialogue_line_id for r in recordings]
+            ).values_list("pk", "audio_file")
+        )
+        kept = []
+        for recording in recordings:
+            if stored.get(recording.dialogue_line_id) == recording.audio_file.name:
+                kept.append(recording)
+            else:
+                get_audio_storage().delete(recording.audio_file.name)
+        return kept
+
+    @staticmethod
+    def synthesize(line):
+        try:
+            return synthesize_system_line(line)
+        except Exception as exc:
+            return exc
@@ -0,0 +1,41 @@
+"""
+Django management command that reconciles the materialized counters.
+
+Usage:
+    python manage.py recount
+    python manage.py recount --dry-run
+
+Counters (simulator.counters) are updated by signals as rows are created
+and deleted. bulk_create(), QuerySet.update() and raw SQL bypass signals;
+run this after such changes, or periodically, to fix any drift.
+"""
+
+from django.core.management.base import BaseCommand
+
+from simulator.counters import recount
+
+
+class Command(BaseCommand):
+    help = "Recomputes the dashboard and progress counters from the source tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report wrong counters without fixing them",
+        )
+
+    def handle(self, *args, **options):
+        corrections = recount(dry_run=options["dry_run"])
+
+        for scope, object_id, name, stored, actual in corrections:
+            label = scope if scope == "global" else f"{scope} #{object_id}"
+            stored = "missing" if stored is None else stored
+            self.stdout.write(f"  {label} {name}: {stored} -> {actual}")
+
+        if not corrections:
+            self.stdout.write(self.style.SUCCESS("All counters are correct"))
+        elif options["dry_run"]:
+            self.stdout.write(self.style.WARNING(f"{len(corrections)} counters are wrong"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Corrected {len(corrections)} counters"))
@@ -0,0 +1,143 @@
+"""
+Django management command that processes queued audio generation jobs.
+
+Usage:
+    python manage.py run_audio_worker
+    python manage.py run_audio_worker --concurrency 4
+    python manage.py run_audio_worker --once  # Drain the queue and exit
+
+While running, the worker refreshes the heartbeat of its jobs and recovers
+jobs of workers that stopped sending one (see simulator.jobs.requeue_stale).
+"""
+
+import os
+import signal
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from simulator.jobs import claim_next, heartbeat, requeue_stale, run_job
+
+
+class Command(BaseCommand):
+    help = "Processes background audio generation jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=settings.AUDIO_WORKER_CONCURRENCY,
+            help="Number of jobs processed in parallel",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="Seconds to wait when the queue is empty",
+        )
+        parser.add_argument(
+            "--stale-after",
+            type=int,
+            default=settings.AUDIO_JOB_STALE_AFTER,
+            help="Recover running jobs without a heartbeat for this many seconds",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty instead of polling",
+        )
+
+    def handle(self, *args, **options):
+        self.stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: self.stop.set())
+
+        if connection.vendor == "sqlite" and not settings.DEBUG:
+            # Without DATABASE_URL the worker would poll its own empty database
+            self.stdout.write(
+                self.style.WARNING(
+                    "DATABASE_URL is not set: polling the local SQLite database, "
+                    "which the web service does not share"
+                )
+            )
+
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.recover(options["stale_after"])
+
+        concurrency = max(1, options["concurrency"])
+        self.stdout.write(
+            f"Audio worker {worker_id} started with concurrency {concurrency}"
+        )
+
+        finished = threading.Event()
+        pulse = threading.Thread(
+            target=self.pulse,
+            args=(f"{worker_id}/", options["stale_after"], finished),
+            daemon=True,
+        )
+        pulse.start()
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [
+                executor.submit(
+                    self.work,
+                    f"{worker_id}/{slot}",
+                    options["poll_interval"],
+                    options["once"],
+                )
+                for slot in range(concurrency)
+            ]
+            try:
+                for future in futures:
+                    future.result()
+            except KeyboardInterrupt:
+                self.stop.set()
+
+        finished.set()
+        pulse.join()
+        self.stdout.write(self.style.SUCCESS("Audio worker stopped"))
+
+    def recover(self, stale_after):
+        requeued, failed = requeue_stale(stale_after)
+        if requeued:
+            self.stdout.write(self.style.WARNING(f"Requeued {requeued} stale job(s)"))
+        if failed:
+            self.stdout.write(
+                self.style.ERROR(f"Failed {failed} stale job(s) out of attempts")
+            )
+
+    def pulse(self, worker_prefix, stale_after, finished):
+        """
+        Keeps this process's running jobs alive and recovers those of dead
+        workers, every AUDIO_JOB_HEARTBEAT seconds
+        """
+
+        try:
+            while not finished.wait(settings.AUDIO_JOB_HEARTBEAT):
+                close_old_connections()
+                heartbeat(worker_prefix)
+                self.recover(stale_after)
+        finally:
+            connection.close()
+
+    def work(self, worker_id, poll_interval, once):
+        """Claims and runs jobs until stopped (or the queue is empty with --once)"""
+
+        try:
+            while not self.stop.is_set():
+                close_old_connections()
+                job = claim_next(worker_id)
+                if job is None:
+                    if once:
+                        return
+                    self.stop.wait(poll_interval)
+                    continue
+
+                job = run_job(job)
+                style = self.style.SUCCESS if job.status == "succeeded" else self.style.ERROR
+                self.stdout.write(style(f"[{worker_id}] {job}"))
+        finally:
+            connection.close()
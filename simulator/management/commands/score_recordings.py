@@ -0,0 +1,66 @@
+"""
+Django management command that (re)scores transcribed recordings.
+
+Usage:
+    python manage.py score_recordings --all
+    python manage.py score_recordings --simulation 3
+    python manage.py score_recordings --dialogue 12
+
+Scores compare each recording's transcript with its line text (see
+simulator.scoring); recordings without a transcript are skipped.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Avg
+
+from simulator.models import LineRecording
+from simulator.scoring import score_recordings
+
+
+class Command(BaseCommand):
+    help = "Scores recording transcripts against their dialogue lines"
+
+    def add_arguments(self, parser):
+        scope = parser.add_mutually_exclusive_group(required=True)
+        scope.add_argument("--simulation", type=int, help="Simulation id")
+        scope.add_argument("--dialogue", type=int, help="Dialogue id")
+        scope.add_argument("--all", action="store_true", help="Every recording")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Recordings scored and saved per batch",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+
+        recordings = LineRecording.objects.all()
+        if options["simulation"]:
+            recordings = recordings.filter(
+                dialogue_line__dialogue__simulation_id=options["simulation"]
+            )
+        elif options["dialogue"]:
+            recordings = recordings.filter(dialogue_line__dialogue_id=options["dialogue"])
+
+        started = time.monotonic()
+        scored = score_recordings(recordings, batch_size=options["batch_size"])
+        elapsed = time.monotonic() - started
+
+        averages = recordings.exclude(transcript="").aggregate(
+            char=Avg("char_score"), word=Avg("word_score")
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✓ Scored {scored} recording(s) in {elapsed:.2f}s "
+                f"({scored / elapsed if elapsed else 0:.0f}/s)"
+            )
+        )
+        if scored:
+            self.stdout.write(
+                f"  mean character score {averages['char']:.2f}, "
+                f"mean word score {averages['word']:.2f}"
+            )
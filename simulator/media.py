@@ -0,0 +1,239 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db.models import Q
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from .models import LineRecording
+
+MEDIA_CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+# ========================
+# Conditional Requests
+# ========================
+def media_etag(stat):
+    """Returns a strong ETag derived from a file's size and mtime"""
+
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def is_not_modified(request, etag, mtime):
+    """
+    Checks If-None-Match / If-Modified-Since against the current file
+
+    If-None-Match takes precedence, as required by RFC 9110.
+    """
+
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+
+    since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+    return since is not None and int(mtime) <= since
+
+
+def parse_range(header, size):
+    """
+    Parses a single-range Range header
+
+    Multiple ranges are not supported and fall back to the full file,
+    which RFC 9110 permits.
+
+    Args:
+        header (str): Value of the Range header
+        size (int): File size in bytes
+
+    Returns:
+        tuple: (start, end) inclusive byte positions, None to serve the whole
+        file, or False if the range cannot be satisfied
+    """
+
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+
+    if not start:
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+# ========================
+# Streaming
+# ========================
+def iter_file(path, start, length):
+    """Yields length bytes of a file from start in MEDIA_CHUNK_SIZE chunks"""
+
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(MEDIA_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def sendfile_response(path):
+    """
+    Hands the file to the front proxy when MEDIA_SENDFILE_BACKEND is set
+
+    The proxy then handles ranges and streaming itself.
+
+    Returns:
+        HttpResponse: Empty response carrying the offload header, or None
+    """
+
+    backend = settings.MEDIA_SENDFILE_BACKEND
+    if not backend:
+        return None
+
+    response = HttpResponse()
+    if backend == "x-accel-redirect":
+        response["X-Accel-Redirect"] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + quote(path)
+    elif backend == "x-sendfile":
+        response["X-Sendfile"] = safe_join(settings.MEDIA_ROOT, path)
+    else:
+        raise ValueError(f"Unknown MEDIA_SENDFILE_BACKEND: {backend}")
+
+    # Let the proxy set the type and length from the file it serves
+    del response["Content-Type"]
+    return response
+
+
+# ========================
+# Access
+# ========================
+def is_private(path):
+    return path.startswith(settings.MEDIA_PRIVATE_PREFIX)
+
+
+def can_access(request, path):
+    """
+    Checks whether the requester may download a media file
+
+    Generated audio (MEDIA_PUBLIC_PREFIXES) is public. A line recording is
+    only served to staff and to the user whose participant spoke the line,
+    looked up by the stored name of its original or normalized file.
+    Everything else is refused.
+    """
+
+    if path.startswith(settings.MEDIA_PUBLIC_PREFIXES):
+        return True
+    if not is_private(path) or not request.user.is_authenticated:
+        return False
+    if request.user.is_staff:
+        return True
+    return LineRecording.objects.filter(
+        Q(audio_file=path) | Q(normalized_audio=path),
+        dialogue_line__participant__user=request.user,
+    ).exists()
+
+
+# ========================
+# Media View
+# ========================
+@require_safe
+def serve_media(request, path):
+    """
+    Serves a file from MEDIA_ROOT with Range and conditional request support
+
+    Files are streamed in chunks, never read into memory. With
+    MEDIA_SENDFILE_BACKEND set, the transfer is offloaded to the front
+    proxy via X-Accel-Redirect (nginx) or X-Sendfile (Apache/lighttpd).
+    Files the requester may not access (see can_access) are reported
+    missing rather than forbidden, so recordings cannot be probed.
+
+    Args:
+        path (str): Path relative to MEDIA_ROOT
+
+    Returns:
+        HttpResponse: 200, 206, 304 or 416 response
+    """
+
+    # Hidden entries are storage internals: blobs, partial builds
+    if any(part.startswith(".") for part in path.replace("\\", "/").split("/")):
+        raise Http404("Media file not found")
+    if not can_access(request, path):
+        raise Http404("Media file not found")
+
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404("Media file not found")
+
+    if not os.path.isfile(full_path):
+        raise Http404("Media file not found")
+
+    etag = media_etag(stat)
+    validators = {
+        "ETag": etag,
+        "Last-Modified": http_date(stat.st_mtime),
+        "Accept-Ranges": "bytes",
+    }
+    if is_private(path):
+        # Never kept by shared caches
+        validators["Cache-Control"] = "private"
+
+    if is_not_modified(request, etag, stat.st_mtime):
+        response = HttpResponse(status=304)
+        for header, value in validators.items():
+            response[header] = value
+        return response
+
+    response = sendfile_response(path)
+    if response is not None:
+        for header, value in validators.items():
+            response[header] = value
+        return response
+
+    size = stat.st_size
+    byte_range = None
+    range_header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+    # A stale If-Range means the client's partial copy is outdated: send it all
+    if range_header and (not if_range or if_range in (etag, validators["Last-Modified"])):
+        byte_range = parse_range(range_header, size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return response
+
+    start, end = byte_range or (0, size - 1)
+    length = end - start + 1 if size else 0
+    body = iter_file(full_path, start, length) if request.method == "GET" else []
+
+    response = StreamingHttpResponse(body, status=206 if byte_range else 200)
+    content_type, _encoding = mimetypes.guess_type(full_path)
+    response["Content-Type"] = content_type or "application/octet-stream"
+    response["Content-Length"] = str(length)
+    if byte_range:
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    for header, value in validators.items():
+        response[header] = value
+    return response
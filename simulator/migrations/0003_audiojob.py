@@ -0,0 +1,36 @@
+# Generated by Django 5.2.9 on 2026-10-18 13:14
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulator', '0002_dialogue_complete_audio'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AudioJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('dialogue_audio', 'Dialogue Audio'), ('simulation_audio', 'Simulation Audio')], max_length=50)),
+                ('object_id', models.PositiveBigIntegerField(help_text='Primary key of the dialogue/simulation to process')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField(default=3)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, help_text='Not picked up before this time')),
+                ('result', models.CharField(blank=True, help_text='Media path of the generated audio', max_length=255)),
+                ('error', models.TextField(blank=True)),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'run_after'], name='simulator_a_status_055639_idx'), models.Index(fields=['kind', 'object_id', 'status'], name='simulator_a_kind_4dd071_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.9 on 2026-10-18 13:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulator', '0003_audiojob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='linerecording',
+            name='duration_ms',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='linerecording',
+            name='normalized_audio',
+            field=models.FileField(blank=True, help_text='Canonical rendition (fixed sample rate, mono, MP3) made at ingest', null=True, upload_to='simulations/lines/normalized/'),
+        ),
+        migrations.AlterField(
+            model_name='audiojob',
+            name='kind',
+            field=models.CharField(choices=[('dialogue_audio', 'Dialogue Audio'), ('simulation_audio', 'Simulation Audio'), ('normalize_recording', 'Normalize Recording')], max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='audiojob',
+            name='object_id',
+            field=models.PositiveBigIntegerField(help_text='Primary key of the dialogue/simulation/recording to process'),
+        ),
+    ]
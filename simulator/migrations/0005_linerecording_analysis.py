@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-18 13:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulator', '0004_linerecording_normalized_audio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='linerecording',
+            name='is_silent',
+            field=models.BooleanField(default=False, help_text='No speech detected at ingest'),
+        ),
+        migrations.AddField(
+            model_name='linerecording',
+            name='rms_dbfs',
+            field=models.FloatField(blank=True, help_text='Loudness of the voiced part before normalization', null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-18 13:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulator', '0005_linerecording_analysis'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dialogue',
+            name='audio_manifest',
+            field=models.JSONField(blank=True, help_text="Playlist of line recordings (AUDIO_OUTPUT_MODE = 'playlist')", null=True),
+        ),
+        migrations.AddField(
+            model_name='simulation',
+            name='audio_manifest',
+            field=models.JSONField(blank=True, help_text="Playlist of existing clips (AUDIO_OUTPUT_MODE = 'playlist')", null=True),
+        ),
+    ]
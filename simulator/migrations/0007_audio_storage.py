@@ -0,0 +1,34 @@
+# Generated by Django 5.2.9 on 2026-10-18 13:28
+
+import simulator.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulator', '0006_audio_manifest'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dialogue',
+            name='complete_audio',
+            field=models.FileField(blank=True, null=True, storage=simulator.storage.get_audio_storage, upload_to='dialogues/complete/'),
+        ),
+        migrations.AlterField(
+            model_name='linerecording',
+            name='audio_file',
+            field=models.FileField(storage=simulator.storage.get_audio_storage, upload_to='simulations/lines/'),
+        ),
+        migrations.AlterField(
+            model_name='linerecording',
+            name='normalized_audio',
+            field=models.FileField(blank=True, help_text='Canonical rendition (fixed sample rate, mono, MP3) made at ingest', null=True, storage=simulator.storage.get_audio_storage, upload_to='simulations/lines/normalized/'),
+        ),
+        migrations.AlterField(
+            model_name='simulation',
+            name='final_audio',
+            field=models.FileField(blank=True, null=True, storage=simulator.storage.get_audio_storage, upload_to='simulations/final/'),
+        ),
+    ]
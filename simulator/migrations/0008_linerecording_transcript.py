@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-18 13:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulator', '0007_audio_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='linerecording',
+            name='transcript',
+            field=models.TextField(blank=True, help_text='Speech recognized in the recording (ASR_ENABLED)'),
+        ),
+        migrations.AlterField(
+            model_name='audiojob',
+            name='kind',
+            field=models.CharField(choices=[('dialogue_audio', 'Dialogue Audio'), ('simulation_audio', 'Simulation Audio'), ('normalize_recording', 'Normalize Recording'), ('transcribe_recording', 'Transcribe Recording')], max_length=50),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-18 13:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulator', '0008_linerecording_transcript'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='linerecording',
+            name='char_score',
+            field=models.FloatField(blank=True, help_text='Character similarity of transcript and line (0-1)', null=True),
+        ),
+        migrations.AddField(
+            model_name='linerecording',
+            name='word_score',
+            field=models.FloatField(blank=True, help_text='Word similarity of transcript and line (0-1)', null=True),
+        ),
+    ]
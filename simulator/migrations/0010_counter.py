@@ -0,0 +1,72 @@
+# Generated by Django 5.2.9 on 2026-10-18 13:44
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def populate_counters(apps, schema_editor):
+    """Counts existing rows (same result as `manage.py recount`)"""
+
+    Counter = apps.get_model("simulator", "Counter")
+    Simulation = apps.get_model("simulator", "Simulation")
+    Dialogue = apps.get_model("simulator", "Dialogue")
+    Participant = apps.get_model("simulator", "Participant")
+
+    rows = []
+    totals = {"lines": 0, "recorded_lines": 0}
+    per_simulation = {
+        pk: {"dialogues": 0, "lines": 0, "recorded_lines": 0}
+        for pk in Simulation.objects.values_list("pk", flat=True)
+    }
+    dialogues = Dialogue.objects.annotate(
+        line_count=Count("lines"), recorded_count=Count("lines__recording")
+    ).values_list("pk", "simulation_id", "line_count", "recorded_count")
+    for pk, simulation_id, lines, recorded in dialogues:
+        rows.append(Counter(scope="dialogue", object_id=pk, name="lines", value=lines))
+        rows.append(Counter(scope="dialogue", object_id=pk, name="recorded_lines", value=recorded))
+        per_simulation[simulation_id]["dialogues"] += 1
+        per_simulation[simulation_id]["lines"] += lines
+        per_simulation[simulation_id]["recorded_lines"] += recorded
+        totals["lines"] += lines
+        totals["recorded_lines"] += recorded
+
+    for pk, counts in per_simulation.items():
+        rows += [
+            Counter(scope="simulation", object_id=pk, name=name, value=value)
+            for name, value in counts.items()
+        ]
+
+    simulations = Simulation.objects.aggregate(
+        simulations=Count("pk"), completed_simulations=Count("pk", filter=Q(status="completed"))
+    )
+    totals.update(
+        simulations,
+        dialogues=Dialogue.objects.count(),
+        participants=Participant.objects.count(),
+    )
+    rows += [Counter(scope="global", object_id=0, name=name, value=value) for name, value in totals.items()]
+    Counter.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulator', '0009_linerecording_scores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Counter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('global', 'Global'), ('simulation', 'Simulation'), ('dialogue', 'Dialogue')], max_length=20)),
+                ('object_id', models.PositiveBigIntegerField(default=0, help_text='Primary key of the simulation/dialogue (0 for global)')),
+                ('name', models.CharField(max_length=50)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('scope', 'object_id', 'name'), name='unique_counter')],
+            },
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
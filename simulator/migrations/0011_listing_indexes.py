@@ -0,0 +1,27 @@
+# Generated by Django 5.2.9 on 2026-10-18 13:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulator', '0010_counter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='participant',
+            index=models.Index(fields=['user', 'speaker_name', 'id'], name='simulator_p_user_id_e263f4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='simulation',
+            index=models.Index(fields=['created_at', 'id'], name='simulator_s_created_76874a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='simulation',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='simulator_s_status_a0c9ab_idx'),
+        ),
+    ]
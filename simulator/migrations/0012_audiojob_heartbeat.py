@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulator', '0011_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audiojob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, help_text='Last sign of life of the worker running the job', null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.9 on 2026-10-18 14:14
+
+from django.db import migrations, models
+
+
+def drop_duplicate_pending_jobs(apps, schema_editor):
+    """Keeps the oldest pending job of each target; the others did the same work"""
+
+    AudioJob = apps.get_model("simulator", "AudioJob")
+    seen = set()
+    duplicates = []
+    pending = AudioJob.objects.filter(status="pending").order_by("pk")
+    for pk, kind, object_id in pending.values_list("pk", "kind", "object_id"):
+        if (kind, object_id) in seen:
+            duplicates.append(pk)
+        seen.add((kind, object_id))
+    AudioJob.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulator', '0012_audiojob_heartbeat'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_pending_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='audiojob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('kind', 'object_id'), name='unique_pending_audio_job'),
+        ),
+    ]
@@ -1,9 +1,32 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.conf import settings
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 
+from .storage import get_audio_storage
 
-class Participant(models.Model):
+
+class CountedModel(models.Model):
+    """
+    Base of the models tallied by simulator.counters.
+
+    Django sends post_save after the save's own transaction has ended, so
+    the counter bump in the receiver would commit on its own in autocommit.
+    Saving inside atomic() makes the row and its bump commit or roll back
+    together. Deletes need nothing: Django runs them and their signals in
+    one transaction.
+    """
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get("using") or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
+
+class Participant(CountedModel):
     """A speaker/character that can be reused across dialogues."""
 
     user = models.ForeignKey(
@@ -19,12 +42,16 @@ class Participant(models.Model):
 
     class Meta:
         ordering = ["user", "speaker_name"]
+        indexes = [
+            # Keyset pagination of participant_list
+            models.Index(fields=["user", "speaker_name", "id"]),
+        ]
 
     def __str__(self):
         return f"{self.speaker_name} ({self.user.email})"
 
 
-class Simulation(models.Model):
+class Simulation(CountedModel):
     """Practice session with multiple dialogues."""
 
     STATUS_CHOICES = [
@@ -44,19 +71,36 @@ class Simulation(models.Model):
     )
     current_line = models.PositiveIntegerField(default=1)
     final_audio = models.FileField(
-        upload_to="simulations/final/", null=True, blank=True
+        upload_to="simulations/final/",
+        storage=get_audio_storage,
+        null=True,
+        blank=True,
+    )
+    audio_manifest = models.JSONField(
+        null=True,
+        blank=True,
+        help_text="Playlist of existing clips (AUDIO_OUTPUT_MODE = 'playlist')",
     )
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Keyset pagination of simulation_list, unfiltered and by status
+            models.Index(fields=["created_at", "id"]),
+            models.Index(fields=["status", "created_at", "id"]),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.status})"
 
+    @property
+    def has_audio(self):
+        return bool(self.final_audio or self.audio_manifest)
 
-class Dialogue(models.Model):
+
+class Dialogue(CountedModel):
     """Conversation template."""
 
     DIFFICULTY_CHOICES = [
@@ -78,7 +122,15 @@ class Dialogue(models.Model):
         validators=[MinValueValidator(1)], help_text="Order in simulation"
     )
     complete_audio = models.FileField(
-        upload_to="dialogues/complete/", null=True, blank=True
+        upload_to="dialogues/complete/",
+        storage=get_audio_storage,
+        null=True,
+        blank=True,
+    )
+    audio_manifest = models.JSONField(
+        null=True,
+        blank=True,
+        help_text="Playlist of line recordings (AUDIO_OUTPUT_MODE = 'playlist')",
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -92,16 +144,29 @@ class Dialogue(models.Model):
     def generate_complete_audio(self):
         """Generate complete dialogue audio by concatenating line recordings"""
         from .utils import concatenate_dialogue_audio
-        
+
+        if settings.AUDIO_OUTPUT_MODE == "playlist":
+            from .playlist import build_dialogue_manifest
+
+            manifest = build_dialogue_manifest(self)
+            if manifest:
+                # A file from an earlier build in file mode would be stale
+                self.audio_manifest = manifest
+                self.complete_audio = None
+                self.save(update_fields=["audio_manifest", "complete_audio"])
+                return True
+            return False
+
         audio_path = concatenate_dialogue_audio(self)
         if audio_path:
             self.complete_audio = audio_path
+            self.audio_manifest = None
             self.save()
             return True
         return False
 
 
-class DialogueLine(models.Model):
+class DialogueLine(CountedModel):
     """Individual speech line."""
 
     dialogue = models.ForeignKey(
@@ -121,7 +186,7 @@ class DialogueLine(models.Model):
         return f"{self.dialogue.title} - Line {self.order}"
 
 
-class LineRecording(models.Model):
+class LineRecording(CountedModel):
     """Audio recording for a dialogue line (one-to-one)."""
 
     dialogue_line = models.OneToOneField(
@@ -130,8 +195,123 @@ class LineRecording(models.Model):
         related_name="recording",
         primary_key=True,
     )
-    audio_file = models.FileField(upload_to="simulations/lines/")
+    audio_file = models.FileField(
+        upload_to="simulations/lines/", storage=get_audio_storage
+    )
+    normalized_audio = models.FileField(
+        upload_to="simulations/lines/normalized/",
+        storage=get_audio_storage,
+        null=True,
+        blank=True,
+        help_text="Canonical rendition (fixed sample rate, mono, MP3) made at ingest",
+    )
+    duration_ms = models.PositiveIntegerField(null=True, blank=True)
+    rms_dbfs = models.FloatField(
+        null=True, blank=True, help_text="Loudness of the voiced part before normalization"
+    )
+    is_silent = models.BooleanField(
+        default=False, help_text="No speech detected at ingest"
+    )
+    transcript = models.TextField(
+        blank=True, help_text="Speech recognized in the recording (ASR_ENABLED)"
+    )
+    char_score = models.FloatField(
+        null=True, blank=True, help_text="Character similarity of transcript and line (0-1)"
+    )
+    word_score = models.FloatField(
+        null=True, blank=True, help_text="Word similarity of transcript and line (0-1)"
+    )
     recorded_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"Recording: {self.dialogue_line}"
+
+    @property
+    def playback_file(self):
+        """Normalized rendition when available, otherwise the original upload"""
+        return self.normalized_audio or self.audio_file
+
+
+class AudioJob(models.Model):
+    """Background audio generation task processed by run_audio_worker."""
+
+    KIND_CHOICES = [
+        ("dialogue_audio", "Dialogue Audio"),
+        ("simulation_audio", "Simulation Audio"),
+        ("normalize_recording", "Normalize Recording"),
+        ("transcribe_recording", "Transcribe Recording"),
+    ]
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("succeeded", "Succeeded"),
+        ("failed", "Failed"),
+    ]
+
+    kind = models.CharField(max_length=50, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField(
+        help_text="Primary key of the dialogue/simulation/recording to process"
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(
+        default=timezone.now, help_text="Not picked up before this time"
+    )
+    result = models.CharField(
+        max_length=255, blank=True, help_text="Media path of the generated audio"
+    )
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(
+        null=True, blank=True, help_text="Last sign of life of the worker running the job"
+    )
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+            models.Index(fields=["kind", "object_id", "status"]),
+        ]
+        constraints = [
+            # enqueue() reuses the pending job of a target; this closes the race
+            models.UniqueConstraint(
+                fields=["kind", "object_id"],
+                condition=models.Q(status="pending"),
+                name="unique_pending_audio_job",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.object_id} ({self.status})"
+
+
+class Counter(models.Model):
+    """Denormalized count maintained by simulator.counters (see `manage.py recount`)."""
+
+    SCOPE_CHOICES = [
+        ("global", "Global"),
+        ("simulation", "Simulation"),
+        ("dialogue", "Dialogue"),
+    ]
+
+    scope = models.CharField(max_length=20, choices=SCOPE_CHOICES)
+    object_id = models.PositiveBigIntegerField(
+        default=0, help_text="Primary key of the simulation/dialogue (0 for global)"
+    )
+    name = models.CharField(max_length=50)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["scope", "object_id", "name"], name="unique_counter"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.scope}:{self.object_id}:{self.name} = {self.value}"
@@ -0,0 +1,157 @@
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import BadRequest, ValidationError
+from django.db.models import Q
+
+
+# ========================
+# Cursors
+# ========================
+def encode_cursor(values):
+    data = json.dumps(values, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, fields):
+    """
+    Decodes a cursor into one Python value per key field
+
+    Raises:
+        BadRequest: The cursor was not made by encode_cursor() for these keys
+    """
+
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise ValueError(cursor)
+        return [field.to_python(value) for field, value in zip(fields, values)]
+    except (ValueError, TypeError, ValidationError):
+        raise BadRequest("Invalid pagination cursor")
+
+
+def after_q(keys, values):
+    """
+    Filter selecting the rows that come after `values` in `keys` order
+
+    For keys (a, -b): a > va OR (a = va AND b < vb)
+    """
+
+    condition = Q()
+    for index in reversed(range(len(keys))):
+        name = keys[index].lstrip("-")
+        lookup = "lt" if keys[index].startswith("-") else "gt"
+        step = Q(**{f"{name}__{lookup}": values[index]})
+        if index < len(keys) - 1:
+            step |= Q(**{name: values[index]}) & condition
+        condition = step
+    return condition
+
+
+def reverse_keys(keys):
+    return [key[1:] if key.startswith("-") else f"-{key}" for key in keys]
+
+
+# ========================
+# Pages
+# ========================
+class KeysetPage:
+    """
+    One page of a keyset-paginated queryset
+
+    Attributes:
+        items (list): Rows of the page
+        next_cursor (str): Cursor of the following page, or None
+        previous_cursor (str): Cursor of the preceding page, or None
+    """
+
+    def __init__(self, items, keys, has_next, has_previous):
+        self.items = items
+        self.keys = keys
+        self.next_cursor = self.cursor_for(items[-1]) if has_next and items else None
+        self.previous_cursor = self.cursor_for(items[0]) if has_previous and items else None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def cursor_for(self, item):
+        return encode_cursor([getattr(item, key.lstrip("-")) for key in self.keys])
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def payload(self, serialize):
+        """
+        JSON-ready page
+
+        Args:
+            serialize (callable): Turns one row into a dict
+
+        Returns:
+            dict: results, next and previous cursors
+        """
+
+        return {
+            "results": [serialize(item) for item in self.items],
+            "next": self.next_cursor,
+            "previous": self.previous_cursor,
+        }
+
+
+def keyset_paginate(queryset, keys, after=None, before=None, per_page=None):
+    """
+    Returns the page of `queryset` following `after` or preceding `before`
+
+    Rows are located with a WHERE on the keys instead of OFFSET, so every page
+    costs one indexed range scan however deep it is. The last key must be
+    unique (usually "id") for the order to be total.
+
+    Args:
+        queryset (QuerySet): Rows to paginate (filtered, unordered)
+        keys (list): Ordering fields, "-" prefixed for descending
+        after (str): next_cursor of the previous page
+        before (str): previous_cursor of the following page
+        per_page (int): Rows per page (LIST_PAGE_SIZE)
+
+    Returns:
+        KeysetPage: The page
+    """
+
+    per_page = per_page or settings.LIST_PAGE_SIZE
+    fields = [queryset.model._meta.get_field(key.lstrip("-")) for key in keys]
+    backwards = bool(before) and not after
+
+    ordering = reverse_keys(keys) if backwards else keys
+    cursor = before if backwards else after
+    if cursor:
+        queryset = queryset.filter(after_q(ordering, decode_cursor(cursor, fields)))
+
+    items = list(queryset.order_by(*ordering)[: per_page + 1])
+    more = len(items) > per_page
+    items = items[:per_page]
+
+    if backwards:
+        items.reverse()
+        return KeysetPage(items, keys, has_next=True, has_previous=more)
+    return KeysetPage(items, keys, has_next=more, has_previous=bool(after))
+
+
+def paginate_request(request, queryset, keys, per_page=None):
+    """keyset_paginate() with the cursors of the `after` / `before` query parameters"""
+
+    return keyset_paginate(
+        queryset,
+        keys,
+        after=request.GET.get("after"),
+        before=request.GET.get("before"),
+        per_page=per_page,
+    )
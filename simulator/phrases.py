@@ -0,0 +1,193 @@
+import re
+import shutil
+import threading
+from collections import Counter
+
+from .audio import AudioStreamWriter
+from .tts_providers import get_tts_service
+
+# A phrase ends at punctuation followed by whitespace ("3.5" is not split)
+PHRASE_BOUNDARY_RE = re.compile(r"(?<=[,;:.!?…])\s+")
+
+# Abbreviations whose period does not end a phrase ("M. Dupont")
+ABBREVIATIONS = {"m.", "mm.", "mme.", "mmes.", "mlle.", "mlles.", "dr.", "st.", "ste.", "etc."}
+
+# Silence inserted after a phrase, by the punctuation that ended it
+PHRASE_PAUSES_MS = {",": 150, ";": 250, ":": 250, ".": 350, "!": 350, "?": 350, "…": 450}
+
+# What a line with nothing to say ("…") is rendered as
+EMPTY_LINE_SILENCE_MS = 500
+
+
+# ========================
+# Segmentation
+# ========================
+def split_phrases(text):
+    """
+    Splits a line into phrases at punctuation boundaries
+
+    Args:
+        text (str): Line text
+
+    Returns:
+        list: Phrases with their trailing punctuation, in order
+
+    Example:
+        >>> split_phrases("Merci beaucoup, monsieur.")
+        ['Merci beaucoup,', 'monsieur.']
+    """
+
+    phrases = []
+    for piece in PHRASE_BOUNDARY_RE.split(text.strip()):
+        if phrases and phrases[-1].split()[-1].casefold() in ABBREVIATIONS:
+            phrases[-1] = f"{phrases[-1]} {piece}"
+        elif piece:
+            phrases.append(piece)
+    return phrases
+
+
+def normalize_phrase(phrase):
+    """
+    Returns the cache key text of a phrase
+
+    Case, spacing, typographic apostrophes and the closing comma or period
+    are dropped, so "S’il vous plaît," and "s'il vous plaît." share one
+    clip. Question and exclamation marks are kept for their intonation.
+    The clip itself is synthesized from the phrase as written, so the TTS
+    engine still sees its capitals and punctuation. An empty result means
+    there is nothing to say.
+    """
+
+    text = phrase.replace("’", "'").casefold()
+    text = re.sub(r"\s+([?!])", r"\1", " ".join(text.split()))
+    return text.strip(" ,;:.…")
+
+
+def phrase_pause_ms(phrase):
+    return PHRASE_PAUSES_MS.get(phrase.rstrip()[-1:], 0)
+
+
+# ========================
+# Hit Rate Accounting
+# ========================
+class PhraseStats:
+    """
+    Counts phrase lookups, cache hits and the characters synthesized
+
+    A phrase missing from the cache is a miss only the first time it is
+    looked up: concurrent lookups wait for that one synthesis (TTSCache.fetch).
+    """
+
+    def __init__(self):
+        self.lookups = 0
+        self.hits = 0
+        self.chars = 0
+        self.chars_synthesized = 0
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def record(self, key, text, cached):
+        with self._lock:
+            self.lookups += 1
+            self.chars += len(text)
+            if cached or key in self._seen:
+                self.hits += 1
+            else:
+                self.chars_synthesized += len(text)
+                self._seen.add(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "chars": self.chars,
+                "chars_synthesized": self.chars_synthesized,
+            }
+
+
+phrase_stats = PhraseStats()
+
+
+# ========================
+# Assembly
+# ========================
+def phrase_clip(phrase, lang="fr", slow=False):
+    """Returns the cached clip of one phrase, synthesizing it on a miss"""
+
+    key_text = normalize_phrase(phrase)
+    service = get_tts_service()
+    path = service.cached_path(key_text, lang=lang, slow=slow)
+    phrase_stats.record((key_text, lang, slow), phrase, cached=path is not None)
+    return path or service.speech_path(phrase, lang=lang, slow=slow, key_text=key_text)
+
+
+def assemble_phrases(text, output_path, lang="fr", slow=False):
+    """
+    Writes speech for text, assembled from cached phrase clips
+
+    Each phrase is trimmed and loudness-normalized (simulator.analysis) so
+    the clips sound like one take, then joined with a pause that depends on
+    the punctuation between them. A single-phrase line is copied as is,
+    and a line with nothing to say ("…") becomes a short silence.
+
+    Args:
+        text (str): Line text
+        output_path (str): Where the MP3 is written
+        lang (str): Language code
+        slow (bool): Use the slower speaking rate
+
+    Returns:
+        str: output_path
+    """
+
+    phrases = [phrase for phrase in split_phrases(text) if normalize_phrase(phrase)]
+    if len(phrases) == 1:
+        shutil.copyfile(phrase_clip(phrases[0], lang, slow), output_path)
+        return output_path
+
+    clips = [phrase_clip(phrase, lang, slow) for phrase in phrases]
+    with AudioStreamWriter(output_path) as writer:
+        if not phrases:
+            writer.add_silence(EMPTY_LINE_SILENCE_MS)
+        for index, (phrase, clip) in enumerate(zip(phrases, clips)):
+            writer.add_cached_file(clip, process=True)
+            if index < len(phrases) - 1:
+                writer.add_silence(phrase_pause_ms(phrase))
+
+    return output_path
+
+
+def catalogue_report(texts):
+    """
+    Estimates phrase reuse across a set of lines without synthesizing anything
+
+    Args:
+        texts (iterable): Line texts
+
+    Returns:
+        dict: Line and phrase totals, distinct counts and the hit rates a
+        cold cache would reach with whole-line and with phrase caching
+    """
+
+    lines = Counter(" ".join(text.split()) for text in texts)
+    phrases = Counter()
+    for text, count in lines.items():
+        for phrase in split_phrases(text):
+            key_text = normalize_phrase(phrase)
+            if key_text:
+                phrases[key_text] += count
+
+    total_lines = sum(lines.values())
+    total_phrases = sum(phrases.values())
+    return {
+        "lines": total_lines,
+        "distinct_lines": len(lines),
+        "line_hit_rate": 1 - len(lines) / total_lines if total_lines else 0.0,
+        "phrases": total_phrases,
+        "distinct_phrases": len(phrases),
+        "phrase_hit_rate": 1 - len(phrases) / total_phrases if total_phrases else 0.0,
+        "chars_line_cache": sum(len(text) for text in lines),
+        "chars_phrase_cache": sum(len(phrase) for phrase in phrases),
+    }
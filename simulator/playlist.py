@@ -0,0 +1,255 @@
+import math
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+
+from .audio import AudioStreamWriter, get_pcm_cache, inputs_digest, pcm_format
+from .storage import get_audio_storage
+from .utils import SIMULATION_PAUSE_MS, cached_speech_path, line_pause_ms
+
+MANIFEST_VERSION = 1
+
+# Title clips and silences referenced by playlists, shared by every manifest
+SHARED_AUDIO_DIR = "audio/shared"
+
+
+# ========================
+# Shared Clips
+# ========================
+def _publish(relative_path, write):
+    """
+    Creates a media file once, via a temporary file in the same directory
+
+    Args:
+        relative_path (str): Path relative to MEDIA_ROOT
+        write (callable): Writes the file to the path it is given
+
+    Returns:
+        str: relative_path
+    """
+
+    output_path = os.path.join(settings.MEDIA_ROOT, relative_path)
+    if os.path.exists(output_path):
+        return relative_path
+
+    directory = os.path.dirname(output_path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".mp3", dir=directory, prefix=".partial-")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    return relative_path
+
+
+def shared_silence(duration_ms):
+    """
+    Returns the media path of a silence clip, encoding it the first time
+
+    One clip exists per pause length and output format, so every playlist
+    that pauses for the same time reuses the same file.
+    """
+
+    fmt = pcm_format()
+    digest = inputs_digest(
+        [duration_ms, fmt["frame_rate"], fmt["channels"], settings.AUDIO_BITRATE]
+    )
+    relative_path = f"{SHARED_AUDIO_DIR}/silence_{duration_ms}ms_{digest[:16]}.mp3"
+
+    def write(path):
+        with AudioStreamWriter(path) as writer:
+            writer.add_silence(duration_ms)
+
+    return _publish(relative_path, write)
+
+
+def shared_title(title):
+    """
+    Returns the media path of a spoken dialogue title
+
+    The clip is copied out of the TTS cache (which may evict it) and named
+    after its content, so equal titles share one file.
+    """
+
+    clip_path = cached_speech_path(title, lang="fr")
+    digest = get_pcm_cache().digest_for(clip_path)
+    relative_path = f"{SHARED_AUDIO_DIR}/title_{digest[:16]}.mp3"
+    return _publish(relative_path, lambda path: shutil.copyfile(clip_path, path))
+
+
+# ========================
+# Manifests
+# ========================
+class ManifestBuilder:
+    """Accumulates playlist segments and their timing offsets"""
+
+    def __init__(self):
+        self.segments = []
+        self.duration_ms = 0
+
+    def add(self, kind, path, duration_ms, **extra):
+        self.segments.append(
+            {
+                "kind": kind,
+                "path": path,
+                "start_ms": self.duration_ms,
+                "duration_ms": duration_ms,
+                **extra,
+            }
+        )
+        self.duration_ms += duration_ms
+
+    def add_pause(self, duration_ms):
+        self.add("pause", shared_silence(duration_ms), duration_ms)
+
+    def manifest(self):
+        if not self.segments:
+            return None
+        return {
+            "version": MANIFEST_VERSION,
+            "duration_ms": self.duration_ms,
+            "segments": self.segments,
+        }
+
+
+def build_dialogue_manifest(dialogue):
+    """
+    Describes a dialogue's audio as a list of existing files
+
+    Each line's normalized rendition is referenced where it is stored and
+    followed by a shared silence clip of the same deterministic length the
+    file output uses. Durations come from the database, so no recording is
+    decoded. Lines whose recording is not normalized yet are left out;
+    normalization drops the manifest so it is rebuilt with them (see
+    utils.invalidate_manifests).
+
+    Args:
+        dialogue: Dialogue model instance
+
+    Returns:
+        dict: Manifest with version, duration_ms and segments, or None if
+        no line has a normalized recording
+    """
+
+    lines = (
+        dialogue.lines.exclude(recording__normalized_audio="")
+        .filter(
+            recording__normalized_audio__isnull=False,
+            recording__duration_ms__isnull=False,
+        )
+        .select_related("recording")
+        .order_by("order")
+    )
+    pcm_cache = get_pcm_cache()
+    builder = ManifestBuilder()
+
+    for line in lines.iterator():
+        normalized = line.recording.normalized_audio
+        try:
+            pause_ms = line_pause_ms(pcm_cache.digest_for(normalized.path))
+        except OSError:
+            continue
+        builder.add("line", normalized.name, line.recording.duration_ms, line=line.id)
+        builder.add_pause(pause_ms)
+
+    return builder.manifest()
+
+
+def build_simulation_manifest(simulation):
+    """
+    Describes a simulation's audio by chaining its dialogue manifests
+
+    Every dialogue contributes its spoken title, a 2-second pause, its own
+    segments (or its complete_audio file if it was built as a file) and a
+    2-second pause. Cost is proportional to the number of segments.
+
+    Args:
+        simulation: Simulation model instance
+
+    Returns:
+        dict: Manifest, or None if no dialogue has audio
+    """
+
+    pcm_cache = get_pcm_cache()
+    builder = ManifestBuilder()
+
+    for dialogue in simulation.dialogues.order_by("order").iterator():
+        if dialogue.audio_manifest:
+            segments = dialogue.audio_manifest["segments"]
+        elif dialogue.complete_audio:
+            try:
+                duration_ms = pcm_cache.duration_ms(dialogue.complete_audio.path)
+            except Exception:
+                continue
+            segments = [
+                {
+                    "kind": "dialogue",
+                    "path": dialogue.complete_audio.name,
+                    "duration_ms": duration_ms,
+                }
+            ]
+        else:
+            continue
+
+        try:
+            title_path = shared_title(dialogue.title)
+            title_ms = pcm_cache.duration_ms(os.path.join(settings.MEDIA_ROOT, title_path))
+        except Exception:
+            continue
+
+        builder.add("title", title_path, title_ms, dialogue=dialogue.id)
+        builder.add_pause(SIMULATION_PAUSE_MS)
+        for segment in segments:
+            extra = {
+                key: value
+                for key, value in segment.items()
+                if key not in ("kind", "path", "start_ms", "duration_ms")
+            }
+            builder.add(segment["kind"], segment["path"], segment["duration_ms"], **extra)
+        builder.add_pause(SIMULATION_PAUSE_MS)
+
+    return builder.manifest()
+
+
+# ========================
+# Serialization
+# ========================
+def manifest_with_urls(manifest):
+    """Returns a copy of manifest with a playable url on every segment"""
+
+    return {
+        **manifest,
+        "segments": [
+            {**segment, "url": get_audio_storage().url(segment["path"])}
+            for segment in manifest["segments"]
+        ],
+    }
+
+
+def manifest_to_m3u8(manifest):
+    """
+    Renders a manifest as an HLS VOD media playlist of MP3 segments
+
+    Returns:
+        str: m3u8 playlist text
+    """
+
+    segments = manifest_with_urls(manifest)["segments"]
+    target = max(math.ceil(segment["duration_ms"] / 1000) for segment in segments)
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+        f"#EXT-X-TARGETDURATION:{max(target, 1)}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+    ]
+    for segment in segments:
+        lines.append(f"#EXTINF:{segment['duration_ms'] / 1000:.3f},")
+        lines.append(segment["url"])
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,146 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import Dialogue, DialogueLine
+from .utils import ensure_system_recording
+
+
+class SpeechPrefetcher:
+    """
+    Synthesizes system lines in the background before learners reach them
+
+    At most `max_workers` lines are synthesized at once. A line already
+    queued or being synthesized is not submitted again, and requests for it
+    can wait for that work instead of starting their own.
+    """
+
+    def __init__(self, max_workers):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="tts-prefetch"
+        )
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def submit(self, line_ids):
+        """
+        Queues lines for synthesis, skipping those already in flight
+
+        Returns:
+            int: Number of lines queued
+        """
+
+        queued = 0
+        with self._lock:
+            for line_id in line_ids:
+                if line_id in self._in_flight:
+                    continue
+                future = self._executor.submit(self._run, line_id)
+                self._in_flight[line_id] = future
+                future.add_done_callback(lambda _f, line_id=line_id: self._done(line_id))
+                queued += 1
+        return queued
+
+    def wait(self, line_id, timeout):
+        """Waits up to timeout seconds for an in-flight line; False if none finished"""
+
+        with self._lock:
+            future = self._in_flight.get(line_id)
+        if future is None:
+            return False
+        try:
+            future.result(timeout=timeout)
+        except TimeoutError:
+            return False
+        except Exception:
+            pass
+        return True
+
+    def _done(self, line_id):
+        with self._lock:
+            self._in_flight.pop(line_id, None)
+
+    @staticmethod
+    def _run(line_id):
+        # A failure stays on the future: the learner's own request retries
+        # the line and reports the error
+        try:
+            line = DialogueLine.objects.filter(pk=line_id).first()
+            if line is not None:
+                ensure_system_recording(line)
+        finally:
+            close_old_connections()
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher():
+    """Returns the process-wide prefetcher, or None if prefetching is disabled"""
+
+    global _prefetcher
+    if settings.TTS_PREFETCH_CONCURRENCY < 1:
+        return None
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = SpeechPrefetcher(settings.TTS_PREFETCH_CONCURRENCY)
+        return _prefetcher
+
+
+def lines_to_prefetch(dialogue):
+    """
+    Selects the system lines a learner running dialogue will reach next
+
+    Every system line of dialogue without a recording, in order, followed
+    by the first TTS_PREFETCH_NEXT_LINES of the next dialogue.
+
+    Returns:
+        list: DialogueLine ids
+    """
+
+    missing = DialogueLine.objects.filter(
+        participant__is_system=True, recording__isnull=True
+    ).order_by("order")
+    line_ids = list(missing.filter(dialogue=dialogue).values_list("pk", flat=True))
+
+    next_dialogue = (
+        Dialogue.objects.filter(
+            simulation_id=dialogue.simulation_id, order__gt=dialogue.order
+        )
+        .order_by("order")
+        .values_list("pk", flat=True)
+        .first()
+    )
+    if next_dialogue is not None and settings.TTS_PREFETCH_NEXT_LINES:
+        line_ids += missing.filter(dialogue_id=next_dialogue).values_list(
+            "pk", flat=True
+        )[: settings.TTS_PREFETCH_NEXT_LINES]
+    return line_ids
+
+
+def prefetch_for_run(dialogue):
+    """
+    Starts background synthesis for the lines ahead of a learner
+
+    Returns:
+        int: Number of lines queued
+    """
+
+    prefetcher = get_prefetcher()
+    if prefetcher is None:
+        return 0
+    return prefetcher.submit(lines_to_prefetch(dialogue))
+
+
+def wait_for_prefetch(line_id):
+    """Waits for an in-flight prefetch of line_id, bounded by the TTS timeouts"""
+
+    prefetcher = get_prefetcher()
+    if prefetcher is None:
+        return False
+    return prefetcher.wait(
+        line_id, settings.TTS_TIMEOUT * max(len(settings.TTS_PROVIDERS), 1)
+    )
@@ -0,0 +1,351 @@
+import asyncio
+import json
+import re
+import tempfile
+import time
+from importlib import import_module
+from urllib.parse import urlsplit
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import aget_user
+from django.core.files import File
+from django.http import HttpRequest
+from django.http.cookie import parse_cookie
+from django.http.request import split_domain_port, validate_host
+from pydub.utils import get_encoder_name
+
+from .analysis import frame_rms_batch, pcm_to_array, to_dbfs
+from .asr import SAMPLE_RATE, get_asr_pool
+from .models import DialogueLine, LineRecording
+from .scoring import score_transcript
+from .utils import save_line_recording
+
+RECORD_PATH_RE = re.compile(r"^/ws/line/(?P<line_id>\d+)/record/$")
+
+# Recognition never looks further back than Whisper's 30-second window
+PARTIAL_WINDOW_SECONDS = 30
+
+
+# ========================
+# End-of-speech Detection
+# ========================
+class EndpointDetector:
+    """
+    Detects the end of an utterance in a stream of samples
+
+    Speech has ended once at least one voiced frame was seen and the last
+    `silence_ms` of audio stayed below `threshold_dbfs`.
+    """
+
+    def __init__(self, frame_rate, silence_ms, threshold_dbfs):
+        self.frame_len = int(frame_rate * settings.AUDIO_ANALYSIS_FRAME_MS / 1000)
+        self.frames_needed = max(1, silence_ms // settings.AUDIO_ANALYSIS_FRAME_MS)
+        self.threshold_dbfs = threshold_dbfs
+        self.voiced = False
+        self.silent_frames = 0
+        self._pending = np.zeros(0, dtype=np.float32)
+
+    def push(self, samples):
+        """
+        Feeds samples
+
+        Returns:
+            bool: True if speech has ended
+        """
+
+        samples = np.concatenate([self._pending, samples])
+        whole = len(samples) // self.frame_len * self.frame_len
+        self._pending = samples[whole:]
+        if whole:
+            rms, _counts = frame_rms_batch([samples[:whole]], self.frame_len)
+            for level in to_dbfs(rms[0]):
+                if level >= self.threshold_dbfs:
+                    self.voiced = True
+                    self.silent_frames = 0
+                else:
+                    self.silent_frames += 1
+        return self.voiced and self.silent_frames >= self.frames_needed
+
+
+# ========================
+# Recording Session
+# ========================
+class RecordingSession:
+    """
+    One live take: stores the encoded chunks, decodes them as they arrive
+    and pushes partial transcripts and end-of-speech events to the client
+
+    Chunks are piped into a long-running ffmpeg that outputs mono PCM at the
+    ASR sample rate. Partial transcripts come from the resident ASR pool,
+    at most every ASR_PARTIAL_INTERVAL_MS, so concurrent sessions share
+    batches with each other and with recording transcription jobs. Each
+    partial only copies the last PARTIAL_WINDOW_SECONDS of samples, and a
+    take stops growing at REALTIME_MAX_TAKE_SECONDS of decoded audio.
+    """
+
+    def __init__(self, line, send):
+        self.line = line
+        self.send_json = lambda data: send({"type": "websocket.send", "text": json.dumps(data)})
+        self.raw = tempfile.TemporaryFile()
+        self.size = 0
+        self.pcm = bytearray()
+        self.detector = EndpointDetector(
+            SAMPLE_RATE, settings.ASR_ENDPOINT_SILENCE_MS, settings.AUDIO_SILENCE_DBFS
+        )
+        self.max_pcm_bytes = SAMPLE_RATE * 2 * settings.REALTIME_MAX_TAKE_SECONDS
+        self.too_long = False
+        self.ended = False
+        self.partial_text = ""
+        self.partial_task = None
+        self.last_partial = 0.0
+        self.recognizer_ok = True
+        self.decoder = None
+        self.reader = None
+
+    async def start(self):
+        self.decoder = await asyncio.create_subprocess_exec(
+            get_encoder_name(), "-hide_banner", "-loglevel", "error",
+            "-i", "pipe:0",
+            "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE),
+            "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        self.reader = asyncio.create_task(self.read_pcm())
+
+    async def feed(self, chunk):
+        """
+        Stores and decodes one encoded chunk
+
+        Returns:
+            bool: False if the take exceeds RECORDING_UPLOAD_MAX_BYTES or
+            REALTIME_MAX_TAKE_SECONDS
+        """
+
+        self.size += len(chunk)
+        if self.size > settings.RECORDING_UPLOAD_MAX_BYTES or self.too_long:
+            return False
+        self.raw.write(chunk)
+        try:
+            self.decoder.stdin.write(chunk)
+            await self.decoder.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # Undecodable input: the take is still saved, without live feedback
+            pass
+        return True
+
+    async def read_pcm(self):
+        while True:
+            data = await self.decoder.stdout.read(8192)
+            if not data:
+                return
+            room = self.max_pcm_bytes - len(self.pcm)
+            if len(data) > room:
+                # Past the limit: keep draining ffmpeg, refuse further chunks
+                self.too_long = True
+                data = data[: max(room, 0)]
+                if not data:
+                    continue
+            self.pcm += data
+            samples = pcm_to_array(data[: len(data) // 2 * 2])
+
+            if not self.ended and self.detector.push(samples):
+                self.ended = True
+                await self.send_json({"type": "end_of_speech"})
+
+            if (
+                self.recognizer_ok
+                and self.partial_task is None
+                and time.monotonic() - self.last_partial >= settings.ASR_PARTIAL_INTERVAL_MS / 1000
+            ):
+                self.last_partial = time.monotonic()
+                self.partial_task = asyncio.create_task(self.push_partial())
+
+    async def recognize(self, seconds=None):
+        """Transcribes the take, or only its last `seconds`"""
+
+        end = len(self.pcm) // 2 * 2
+        start = max(0, end - SAMPLE_RATE * 2 * seconds) if seconds else 0
+        samples = pcm_to_array(bytes(self.pcm[start:end]))
+        return await asyncio.to_thread(get_asr_pool().transcribe, samples)
+
+    async def push_partial(self):
+        try:
+            text = await self.recognize(PARTIAL_WINDOW_SECONDS)
+        except Exception:
+            self.recognizer_ok = False
+            await self.send_json({"type": "partial_unavailable"})
+            return
+        finally:
+            self.partial_task = None
+        if text != self.partial_text:
+            self.partial_text = text
+            await self.send_json({"type": "partial", "text": text})
+
+    async def finish(self):
+        """
+        Flushes the decoder, saves the take as the line's LineRecording and
+        sends the final transcript and scores
+
+        Returns:
+            dict: The result message
+        """
+
+        await self.close_decoder()
+        if self.partial_task is not None:
+            await asyncio.gather(self.partial_task, return_exceptions=True)
+
+        if not self.size:
+            message = {"type": "error", "error": "No audio data"}
+            await self.send_json(message)
+            return message
+
+        transcript = ""
+        if self.recognizer_ok and self.pcm:
+            try:
+                transcript = await self.recognize()
+            except Exception:
+                transcript = ""
+
+        recording = await sync_to_async(self.save)(transcript)
+        message = {
+            "type": "saved",
+            "audio_url": recording.audio_file.url,
+            "transcript": recording.transcript,
+            "char_score": recording.char_score,
+            "word_score": recording.word_score,
+        }
+        await self.send_json(message)
+        return message
+
+    def save(self, transcript):
+        self.raw.seek(0)
+        recording = save_line_recording(
+            self.line, File(self.raw, name=f"line_{self.line.pk}.webm")
+        )
+        if transcript:
+            scores = score_transcript(transcript, self.line.text)
+            recording.transcript = transcript
+            recording.char_score = scores["char_score"]
+            recording.word_score = scores["word_score"]
+            LineRecording.objects.filter(pk=recording.pk).update(
+                transcript=transcript, **scores
+            )
+        return recording
+
+    async def close_decoder(self):
+        if self.decoder is None or self.decoder.returncode is not None:
+            return
+        try:
+            self.decoder.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        await self.reader
+        await self.decoder.wait()
+
+    async def close(self):
+        if self.decoder is not None and self.decoder.returncode is None:
+            self.decoder.kill()
+            await self.decoder.wait()
+        if self.reader is not None:
+            self.reader.cancel()
+        self.raw.close()
+
+
+# ========================
+# Access Checks
+# ========================
+def headers_of(scope):
+    return {name.decode("latin-1"): value.decode("latin-1") for name, value in scope["headers"]}
+
+
+def origin_allowed(origin):
+    """
+    Accepts sockets opened by pages of this site only
+
+    Browsers always send Origin on WebSocket handshakes and cookies go with
+    it, so without this check any site could record over a learner's lines.
+    """
+
+    if not origin:
+        return False
+    if origin in settings.CSRF_TRUSTED_ORIGINS:
+        return True
+    domain, _ = split_domain_port(urlsplit(origin).netloc)
+    return bool(domain) and validate_host(domain, settings.ALLOWED_HOSTS)
+
+
+async def session_user(headers):
+    """Returns the user logged in with the handshake's session cookie"""
+
+    request = HttpRequest()
+    cookies = parse_cookie(headers.get("cookie", ""))
+    engine = import_module(settings.SESSION_ENGINE)
+    request.session = engine.SessionStore(cookies.get(settings.SESSION_COOKIE_NAME))
+    return await aget_user(request)
+
+
+# ========================
+# ASGI Application
+# ========================
+async def websocket_application(scope, receive, send):
+    """
+    Live recording endpoint: /ws/line/<id>/record/
+
+    Only pages of this site (Origin in ALLOWED_HOSTS or
+    CSRF_TRUSTED_ORIGINS) with a logged-in session may connect; others are
+    closed with 4403. The client sends MediaRecorder chunks as binary
+    messages and {"type": "stop"} when the take is over. The server sends
+    {"type": "partial", "text"}, {"type": "end_of_speech"} once the learner
+    stops speaking, and {"type": "saved", "audio_url", "transcript",
+    "char_score", "word_score"} after storing the take. A take is only
+    saved on "stop": closing the socket without it discards the take and
+    keeps the line's existing recording.
+    """
+
+    event = await receive()
+    if event["type"] != "websocket.connect":
+        return
+
+    headers = headers_of(scope)
+    if not origin_allowed(headers.get("origin")):
+        await send({"type": "websocket.close", "code": 4403})
+        return
+    user = await session_user(headers)
+    if not user.is_authenticated:
+        await send({"type": "websocket.close", "code": 4403})
+        return
+
+    match = RECORD_PATH_RE.match(scope["path"])
+    line = None
+    if match:
+        line = await DialogueLine.objects.filter(pk=match["line_id"]).afirst()
+    if line is None:
+        await send({"type": "websocket.close", "code": 4404})
+        return
+
+    await send({"type": "websocket.accept"})
+    session = RecordingSession(line, send)
+    await session.start()
+    try:
+        while True:
+            event = await receive()
+            if event["type"] == "websocket.disconnect":
+                # Unfinished take: never replace a recording with a fragment
+                return
+
+            if event.get("bytes"):
+                if not await session.feed(event["bytes"]):
+                    error = "Recording too long" if session.too_long else "Recording too large"
+                    await session.send_json({"type": "error", "error": error})
+                    await send({"type": "websocket.close", "code": 1009})
+                    return
+            elif event.get("text") and json.loads(event["text"]).get("type") == "stop":
+                await session.finish()
+                await send({"type": "websocket.close", "code": 1000})
+                return
+    finally:
+        await session.close()
@@ -0,0 +1,261 @@
+import os
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+from .models import Dialogue, LineRecording, Simulation
+from .storage import BLOB_DIR, get_audio_storage
+
+
+# ========================
+# References
+# ========================
+def file_fields():
+    """
+    Lists every FileField of the simulator app
+
+    Returns:
+        list: (model, field name) pairs
+    """
+
+    return [
+        (model, field.name)
+        for model in apps.get_app_config("simulator").get_models()
+        for field in model._meta.get_fields()
+        if isinstance(field, models.FileField)
+    ]
+
+
+def referenced_media_paths():
+    """
+    Collects every media path still in use
+
+    A path is in use when a FileField stores it or when a dialogue or
+    simulation playlist manifest lists it as a segment.
+
+    Returns:
+        set: Paths relative to MEDIA_ROOT
+    """
+
+    referenced = set()
+    for model, field in file_fields():
+        names = (
+            model.objects.exclude(**{field: ""})
+            .exclude(**{f"{field}__isnull": True})
+            .values_list(field, flat=True)
+        )
+        referenced.update(names.iterator())
+
+    for model in (Dialogue, Simulation):
+        manifests = model.objects.filter(audio_manifest__isnull=False).values_list(
+            "audio_manifest", flat=True
+        )
+        for manifest in manifests.iterator():
+            referenced.update(segment["path"] for segment in manifest.get("segments", []))
+
+    return referenced
+
+
+# ========================
+# Orphans
+# ========================
+def iter_media_files(root=None):
+    """
+    Walks MEDIA_ROOT, skipping the blob store of the deduplicating storage
+
+    Yields:
+        tuple: (path relative to root, os.stat_result)
+    """
+
+    root = str(root or settings.MEDIA_ROOT)
+    for directory, dirs, files in os.walk(root):
+        if directory == root and BLOB_DIR in dirs:
+            dirs.remove(BLOB_DIR)
+        for name in files:
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            yield os.path.relpath(path, root).replace(os.sep, "/"), stat
+
+
+def find_orphans(min_age):
+    """
+    Finds media files that nothing references
+
+    Files younger than min_age are skipped, so uploads and builds that have
+    not been saved to the database yet are never collected. Leftover
+    `.partial-*` files from crashed builds are orphans like any other.
+
+    Args:
+        min_age (int): Minimum file age in seconds
+
+    Returns:
+        list: (relative path, size in bytes) pairs
+    """
+
+    referenced = referenced_media_paths()
+    cutoff = time.time() - min_age
+    return [
+        (path, stat.st_size)
+        for path, stat in iter_media_files()
+        if path not in referenced and stat.st_mtime < cutoff
+    ]
+
+
+def find_unreferenced_blobs(min_age):
+    """
+    Finds blobs of the deduplicating storage that no file links to
+
+    Also returns interrupted `.incoming-*` writes older than min_age.
+
+    Returns:
+        list: (absolute path, size in bytes) pairs
+    """
+
+    storage = get_audio_storage()
+    if not hasattr(storage, "unreferenced_blobs"):
+        return []
+
+    cutoff = time.time() - min_age
+    found = [(path, os.path.getsize(path)) for path in storage.unreferenced_blobs()]
+
+    incoming_dir = os.path.join(storage.location, BLOB_DIR)
+    if os.path.isdir(incoming_dir):
+        for entry in os.scandir(incoming_dir):
+            if entry.name.startswith(".incoming-") and entry.stat().st_mtime < cutoff:
+                found.append((entry.path, entry.stat().st_size))
+    return found
+
+
+def deduplicate_media():
+    """
+    Moves files saved before content addressing was enabled into the blob store
+
+    Returns:
+        tuple: (files adopted, bytes freed by sharing an existing blob)
+    """
+
+    storage = get_audio_storage()
+    if not hasattr(storage, "adopt"):
+        return 0, 0
+
+    adopted = freed = 0
+    for model, field in file_fields():
+        names = (
+            model.objects.exclude(**{field: ""})
+            .exclude(**{f"{field}__isnull": True})
+            .values_list(field, flat=True)
+        )
+        for name in names.iterator():
+            try:
+                size = storage.size(name)
+                if storage.adopt(name):
+                    adopted += 1
+                    # A pre-existing blob means these bytes were stored twice
+                    if os.stat(storage.path(name)).st_nlink > 2:
+                        freed += size
+            except FileNotFoundError:
+                continue
+    return adopted, freed
+
+
+def delete_media_files(paths):
+    """
+    Deletes files under MEDIA_ROOT and prunes directories left empty
+
+    Returns:
+        int: Number of files removed
+    """
+
+    root = str(settings.MEDIA_ROOT)
+    removed = 0
+    for path in paths:
+        full_path = os.path.join(root, path)
+        try:
+            os.unlink(full_path)
+        except FileNotFoundError:
+            continue
+        removed += 1
+
+        directory = os.path.dirname(full_path)
+        while directory != root:
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break
+            directory = os.path.dirname(directory)
+    return removed
+
+
+# ========================
+# Retention
+# ========================
+def expired_recordings(days):
+    """
+    Selects line recordings that are kept only for completed simulations
+
+    A recording expires `days` after its simulation was completed, once the
+    simulation's final_audio exists (the recording survives in it). Lines
+    of dialogues served as a playlist are kept, since the playlist plays
+    the recording itself.
+
+    Args:
+        days (int): Retention period after completion
+
+    Returns:
+        QuerySet: Expired LineRecording objects
+    """
+
+    cutoff = timezone.now() - timedelta(days=days)
+    return (
+        LineRecording.objects.filter(
+            dialogue_line__dialogue__simulation__status="completed",
+            dialogue_line__dialogue__simulation__completed_at__lt=cutoff,
+            dialogue_line__dialogue__audio_manifest__isnull=True,
+        )
+        .exclude(dialogue_line__dialogue__simulation__final_audio="")
+        .exclude(dialogue_line__dialogue__simulation__final_audio__isnull=True)
+    )
+
+
+# ========================
+# Accounting
+# ========================
+def storage_by_user():
+    """
+    Sums the size of line recordings per participant owner
+
+    Generated dialogue/simulation audio and shared clips have no single
+    owner and are reported under None.
+
+    Returns:
+        dict: {user email or None: bytes}
+    """
+
+    files = {path: stat for path, stat in iter_media_files()}
+    usage = defaultdict(int)
+    # Deduplicated files share an inode: count each stored blob once
+    counted = set()
+
+    recordings = LineRecording.objects.values_list(
+        "audio_file", "normalized_audio", "dialogue_line__participant__user__email"
+    )
+    for audio_file, normalized_audio, email in recordings.iterator():
+        for path in (audio_file, normalized_audio):
+            stat = files.get(path)
+            if stat and (stat.st_dev, stat.st_ino) not in counted:
+                usage[email] += stat.st_size
+                counted.add((stat.st_dev, stat.st_ino))
+
+    for stat in files.values():
+        if (stat.st_dev, stat.st_ino) not in counted:
+            usage[None] += stat.st_size
+            counted.add((stat.st_dev, stat.st_ino))
+    return dict(usage)
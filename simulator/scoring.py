@@ -0,0 +1,159 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+from rapidfuzz.distance import Levenshtein
+from rapidfuzz.process import cpdist
+
+from .models import LineRecording
+
+# Letters NFKD does not decompose
+LIGATURES = str.maketrans({"œ": "oe", "æ": "ae", "ß": "ss"})
+
+# Apostrophes and hyphens separate words ("l'homme", "allez-vous")
+SEPARATORS_RE = re.compile(r"['’‘`´\-‐‑–—]")
+NON_WORD_RE = re.compile(r"[^a-z0-9\s]")
+
+
+# ========================
+# Normalization
+# ========================
+def normalize_text(text):
+    """
+    Reduces French text to comparable words
+
+    Case, accents, ligatures, apostrophes, hyphens and punctuation are
+    dropped, so "L’élève, a-t-il œuvré ?" and "l eleve a t il oeuvre"
+    compare equal.
+
+    Args:
+        text (str): Reference line or transcript
+
+    Returns:
+        str: Lowercase ASCII words separated by single spaces
+    """
+
+    text = text.casefold().translate(LIGATURES)
+    text = "".join(
+        char
+        for char in unicodedata.normalize("NFKD", text)
+        if not unicodedata.combining(char)
+    )
+    text = NON_WORD_RE.sub(" ", SEPARATORS_RE.sub(" ", text))
+    return " ".join(text.split())
+
+
+@lru_cache(maxsize=8192)
+def reference_for(text):
+    """
+    Returns the normalized reference of a line text and its words
+
+    Cached by text, so each line is normalized once per process however many
+    takes are scored against it.
+    """
+
+    normalized = normalize_text(text)
+    return normalized, tuple(normalized.split())
+
+
+# ========================
+# Scoring
+# ========================
+def score_many(transcripts, references):
+    """
+    Scores transcripts against reference line texts
+
+    Each score is rapidfuzz's normalized Levenshtein similarity,
+    1 - distance / length of the longer side, on characters and then on
+    word sequences. Both are computed pairwise for the whole batch by
+    rapidfuzz.process.cpdist in C++ across all cores, rather than one
+    Python call per pair; only the text normalization runs per transcript.
+
+    Args:
+        transcripts (list): Recognized texts
+        references (list): Line texts, in the same order
+
+    Returns:
+        tuple: (char_scores, word_scores) as NumPy arrays in [0, 1]
+    """
+
+    hyp_texts = [normalize_text(transcript) for transcript in transcripts]
+    references = [reference_for(reference) for reference in references]
+
+    # Two empty texts are a perfect match
+    char_scores = cpdist(
+        hyp_texts,
+        [text for text, _words in references],
+        scorer=Levenshtein.normalized_similarity,
+        dtype=np.float64,
+        workers=-1,
+    )
+    word_scores = cpdist(
+        [text.split() for text in hyp_texts],
+        [words for _text, words in references],
+        scorer=Levenshtein.normalized_similarity,
+        dtype=np.float64,
+        workers=-1,
+    )
+    return char_scores, word_scores
+
+
+def score_transcript(transcript, reference):
+    """
+    Scores one transcript against a line text
+
+    Returns:
+        dict: {"char_score", "word_score"} in [0, 1]
+    """
+
+    char_scores, word_scores = score_many([transcript], [reference])
+    return {"char_score": float(char_scores[0]), "word_score": float(word_scores[0])}
+
+
+def score_recordings(recordings, batch_size=1000):
+    """
+    Scores transcribed recordings against their lines and stores the scores
+
+    Args:
+        recordings (QuerySet): LineRecording objects; those without a
+            transcript are skipped
+        batch_size (int): Recordings loaded and updated per query
+
+    Returns:
+        int: Number of recordings scored
+    """
+
+    recordings = (
+        recordings.exclude(transcript="")
+        .select_related("dialogue_line")
+        .only("pk", "transcript", "dialogue_line__text")
+        .order_by("pk")
+    )
+
+    scored = 0
+    last_pk = None
+    while True:
+        page = recordings if last_pk is None else recordings.filter(pk__gt=last_pk)
+        batch = list(page[:batch_size])
+        if not batch:
+            return scored
+        last_pk = batch[-1].pk
+
+        char_scores, word_scores = score_many(
+            [recording.transcript for recording in batch],
+            [recording.dialogue_line.text for recording in batch],
+        )
+        for recording, char_score, word_score in zip(batch, char_scores, word_scores):
+            recording.char_score = float(char_score)
+            recording.word_score = float(word_score)
+        LineRecording.objects.bulk_update(batch, ["char_score", "word_score"])
+        scored += len(batch)
+
+
+def score_dialogue(dialogue):
+    """Scores every transcribed recording of a dialogue's lines"""
+
+    return score_recordings(
+        LineRecording.objects.filter(dialogue_line__dialogue=dialogue)
+    )
@@ -0,0 +1,207 @@
+import threading
+
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import counters
+from .audio import get_pcm_cache
+from .models import Dialogue, DialogueLine, LineRecording, Participant, Simulation
+from .utils import invalidate_manifests
+
+RECORDING_FILE_FIELDS = ("audio_file", "normalized_audio")
+
+
+def invalidate_pcm(field_file):
+    """Drops the decoded samples cached for a stored file, if it still exists"""
+
+    if not field_file:
+        return
+    try:
+        get_pcm_cache().invalidate(field_file.path)
+    except (NotImplementedError, ValueError):
+        pass
+
+
+@receiver(pre_save, sender=LineRecording)
+def invalidate_replaced_recording_pcm(sender, instance, raw=False, **kwargs):
+    """Evicts cached PCM of recording files that are about to be replaced"""
+
+    if raw or instance._state.adding:
+        return
+
+    previous = LineRecording.objects.filter(pk=instance.pk).first()
+    if previous is None:
+        return
+
+    for field in RECORDING_FILE_FIELDS:
+        old_file = getattr(previous, field)
+        if old_file and old_file.name != getattr(instance, field).name:
+            invalidate_pcm(old_file)
+
+
+@receiver(post_delete, sender=LineRecording)
+def invalidate_deleted_recording_pcm(sender, instance, **kwargs):
+    """Evicts cached PCM of a deleted recording"""
+
+    for field in RECORDING_FILE_FIELDS:
+        invalidate_pcm(getattr(instance, field))
+
+
+# ========================
+# Counters
+# ========================
+# Objects whose deletion is in progress on this thread. Django sends every
+# pre_delete of a cascade before the first post_delete, so children can tell
+# that their parent's counters are about to be dropped as a whole.
+_deleting = threading.local()
+
+
+def _deleting_ids(name):
+    if not hasattr(_deleting, name):
+        setattr(_deleting, name, {})
+    return getattr(_deleting, name)
+
+
+@receiver(pre_save, sender=Simulation)
+def remember_simulation_status(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and "status" not in update_fields:
+        instance._counted_status = instance.status
+        return
+    instance._counted_status = (
+        Simulation.objects.filter(pk=instance.pk).values_list("status", flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Simulation)
+def count_saved_simulation(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    completed = instance.status == "completed"
+    if created:
+        counters.create_counters("simulation", instance.pk)
+        counters.bump("global", 0, simulations=1, completed_simulations=int(completed))
+        return
+    was_completed = getattr(instance, "_counted_status", instance.status) == "completed"
+    if completed != was_completed:
+        counters.bump("global", 0, completed_simulations=1 if completed else -1)
+    instance._counted_status = instance.status
+
+
+@receiver(pre_delete, sender=Simulation)
+def mark_deleting_simulation(sender, instance, **kwargs):
+    _deleting_ids("simulations")[instance.pk] = True
+
+
+@receiver(post_delete, sender=Simulation)
+def count_deleted_simulation(sender, instance, **kwargs):
+    _deleting_ids("simulations").pop(instance.pk, None)
+    counters.bump(
+        "global",
+        0,
+        simulations=-1,
+        completed_simulations=-int(instance.status == "completed"),
+    )
+    counters.delete_counters("simulation", [instance.pk])
+
+
+@receiver(post_save, sender=Dialogue)
+def count_created_dialogue(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        return
+    counters.create_counters("dialogue", instance.pk)
+    counters.bump("simulation", instance.simulation_id, dialogues=1)
+    counters.bump("global", 0, dialogues=1)
+
+
+@receiver(pre_delete, sender=Dialogue)
+def mark_deleting_dialogue(sender, instance, **kwargs):
+    _deleting_ids("dialogues")[instance.pk] = True
+
+
+@receiver(post_delete, sender=Dialogue)
+def count_deleted_dialogue(sender, instance, **kwargs):
+    """Removes the dialogue's lines from its simulation and the totals at once"""
+
+    _deleting_ids("dialogues").pop(instance.pk, None)
+    own = counters.read("dialogue", [instance.pk])[instance.pk]
+    deltas = {name: -value for name, value in own.items()}
+    if instance.simulation_id not in _deleting_ids("simulations"):
+        counters.bump("simulation", instance.simulation_id, dialogues=-1, **deltas)
+    counters.bump("global", 0, dialogues=-1, **deltas)
+    counters.delete_counters("dialogue", [instance.pk])
+
+
+@receiver(post_save, sender=DialogueLine)
+def count_created_line(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        return
+    counters.line_changed(instance.dialogue_id, lines=1)
+
+
+@receiver(pre_delete, sender=DialogueLine)
+def mark_deleting_line(sender, instance, **kwargs):
+    _deleting_ids("lines")[instance.pk] = instance.dialogue_id
+
+
+@receiver(post_delete, sender=DialogueLine)
+def count_deleted_line(sender, instance, **kwargs):
+    _deleting_ids("lines").pop(instance.pk, None)
+    if instance.dialogue_id not in _deleting_ids("dialogues"):
+        counters.line_changed(instance.dialogue_id, lines=-1)
+
+
+@receiver(post_save, sender=LineRecording)
+def count_created_recording(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        return
+    counters.line_changed(counters.dialogue_of_line(instance.dialogue_line_id), recorded_lines=1)
+
+
+@receiver(post_delete, sender=LineRecording)
+def count_deleted_recording(sender, instance, **kwargs):
+    dialogue_id = _deleting_ids("lines").get(instance.dialogue_line_id)
+    if dialogue_id is None:
+        # Recording deleted on its own: its line still exists
+        dialogue_id = counters.dialogue_of_line(instance.dialogue_line_id)
+    elif dialogue_id in _deleting_ids("dialogues"):
+        return
+    counters.line_changed(dialogue_id, recorded_lines=-1)
+
+
+@receiver(post_save, sender=Participant)
+def count_created_participant(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        return
+    counters.bump("global", 0, participants=1)
+
+
+@receiver(post_delete, sender=Participant)
+def count_deleted_participant(sender, instance, **kwargs):
+    counters.bump("global", 0, participants=-1)
+
+
+# ========================
+# Playlists
+# ========================
+@receiver(post_delete, sender=LineRecording)
+def invalidate_manifests_of_deleted_recording(sender, instance, **kwargs):
+    """Manifests must not list the deleted file"""
+
+    if instance.dialogue_line_id in _deleting_ids("lines"):
+        # The line goes too; see invalidate_manifests_of_deleted_line
+        return
+    dialogue_id = (
+        DialogueLine.objects.filter(pk=instance.dialogue_line_id)
+        .values_list("dialogue_id", flat=True)
+        .first()
+    )
+    if dialogue_id is not None:
+        invalidate_manifests(dialogue_id)
+
+
+@receiver(post_delete, sender=DialogueLine)
+def invalidate_manifests_of_deleted_line(sender, instance, **kwargs):
+    if instance.dialogue_id not in _deleting_ids("dialogues"):
+        invalidate_manifests(instance.dialogue_id)
@@ -0,0 +1,177 @@
+import errno
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, default_storage
+
+from .audio import CHUNK_SIZE, file_digest
+
+BLOB_DIR = ".blobs"
+
+
+# ========================
+# Content-Addressed Storage
+# ========================
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that keeps one copy of identical files.
+
+    Every saved file is written once to `.blobs/<aa>/<sha256>` under the
+    storage root, and the name Django asked for (from `upload_to`) becomes a
+    hard link to that blob. Saving bytes that already exist only adds a
+    link. The blob's link count is its reference count: deleting the last
+    name that points at a blob deletes the blob.
+
+    Names behave exactly as with FileSystemStorage, so the storage is a
+    drop-in replacement. Files must never be modified in place, since every
+    name linked to the blob would change with them.
+    """
+
+    def blob_path(self, digest):
+        return os.path.join(self.location, BLOB_DIR, digest[:2], digest)
+
+    def _save(self, name, content):
+        directory = os.path.join(self.location, BLOB_DIR)
+        os.makedirs(directory, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".incoming-")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                for chunk in content.chunks(CHUNK_SIZE):
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            return self._link(name, tmp_path, digest.hexdigest())
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def _link(self, name, source_path, digest):
+        """
+        Links name to the blob for digest, creating the blob from source_path
+
+        Returns:
+            str: The name actually used (a suffix is added if name is taken)
+        """
+
+        blob = self.blob_path(digest)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+
+        while True:
+            try:
+                os.link(source_path, blob)
+            except FileExistsError:
+                pass
+            except OSError as exc:
+                if exc.errno not in (errno.EXDEV, errno.EPERM, errno.ENOTSUP):
+                    raise
+                # No hard links on this file system: store a private copy
+                with open(source_path, "rb") as f:
+                    return super()._save(name, File(f))
+
+            full_path = self.path(name)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            try:
+                os.link(blob, full_path)
+            except FileExistsError:
+                name = self.get_available_name(name)
+                continue
+            except FileNotFoundError:
+                # The blob lost its last reference meanwhile: recreate it
+                continue
+            break
+
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        return os.path.relpath(full_path, self.location).replace("\\", "/")
+
+    def delete(self, name):
+        """Deletes name, and its blob if no other name references it"""
+
+        full_path = self.path(name)
+        try:
+            stat = os.stat(full_path)
+        except FileNotFoundError:
+            return
+
+        # Hashing is only needed when this is the blob's last other link
+        blob = None
+        if stat.st_nlink == 2:
+            blob = self.blob_path(file_digest(full_path))
+
+        super().delete(name)
+
+        if blob:
+            try:
+                if os.stat(blob).st_nlink == 1:
+                    os.unlink(blob)
+            except FileNotFoundError:
+                pass
+
+    def adopt(self, name):
+        """
+        Moves an existing plain file under content addressing
+
+        Used to deduplicate files stored before this backend was enabled.
+
+        Returns:
+            bool: True if the file now shares a blob (False if it already did)
+        """
+
+        full_path = self.path(name)
+        if os.stat(full_path).st_nlink > 1:
+            return False
+
+        digest = file_digest(full_path)
+        blob = self.blob_path(digest)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        try:
+            os.link(full_path, blob)
+        except FileExistsError:
+            # Same bytes already stored: point the name at the existing blob
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(full_path), prefix=".adopt-")
+            os.close(fd)
+            os.unlink(tmp_path)
+            os.link(blob, tmp_path)
+            os.replace(tmp_path, full_path)
+        return True
+
+    def unreferenced_blobs(self):
+        """
+        Lists blobs no name links to any more
+
+        These are left behind when the last two names of a blob are deleted
+        concurrently.
+
+        Yields:
+            str: Blob paths
+        """
+
+        for directory, _dirs, files in os.walk(os.path.join(self.location, BLOB_DIR)):
+            for blob in files:
+                path = os.path.join(directory, blob)
+                try:
+                    if not blob.startswith(".") and os.stat(path).st_nlink == 1:
+                        yield path
+                except FileNotFoundError:
+                    continue
+
+
+audio_storage = ContentAddressedStorage()
+
+
+def get_audio_storage():
+    """
+    Returns the storage used by the simulator's audio FileFields
+
+    Content-addressed unless AUDIO_DEDUP_STORAGE is off.
+    """
+
+    if settings.AUDIO_DEDUP_STORAGE:
+        return audio_storage
+    return default_storage
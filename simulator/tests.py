@@ -1,3 +1,1706 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+import numpy as np
+from pydub.generators import Sine
+
+from users.models import CustomUser
+
+from . import counters, jobs
+from .analysis import analyze_batch, array_to_pcm, pcm_to_array, process_pcm, process_samples
+from .asr import SAMPLE_RATE, ASRPool, StubBackend, get_asr_pool
+from .audio import AudioStreamWriter, file_digest, get_pcm_cache, get_segment_cache
+from .models import AudioJob, Dialogue, DialogueLine, LineRecording, Participant, Simulation
+from .phrases import PhraseStats, assemble_phrases, catalogue_report, split_phrases
+from .playlist import (
+    build_dialogue_manifest,
+    build_simulation_manifest,
+    manifest_to_m3u8,
+    shared_silence,
+)
+from .prefetch import SpeechPrefetcher, get_prefetcher, wait_for_prefetch
+from .realtime import PARTIAL_WINDOW_SECONDS, RecordingSession, websocket_application
+from .retention import storage_by_user
+from .scoring import normalize_text, score_recordings, score_transcript
+from .storage import BLOB_DIR, ContentAddressedStorage, get_audio_storage
+from .tts import TTSCache
+from .tts_providers import GTTSProvider, SyntheticProvider, TTSService, get_tts_service
+from .utils import (
+    SIMULATION_PAUSE_MS,
+    concatenate_dialogue_audio,
+    line_pause_ms,
+    stream_simulation_audio,
+)
+
+DIALOGUES = 50
+LINES_PER_DIALOGUE = 50
+
+
+# ========================
+# Query Budgets
+# ========================
+class ViewQueryBudgetTests(TestCase):
+    """
+    Pins the number of queries each page runs on a large simulation
+
+    The counts must not depend on the number of dialogues, lines or
+    participants: a budget failure usually means a template started
+    touching a relation per row. Speech prefetching stays enabled so its
+    queries are counted; only the background synthesis is not started.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email="learner@example.com", password="x")
+        cls.system = Participant.objects.create(
+            user=cls.user, speaker_name="Serveur", is_system=True
+        )
+        cls.learner = Participant.objects.create(user=cls.user, speaker_name="Client")
+
+        cls.simulation = Simulation.objects.create(title="Grande simulation")
+        dialogues = Dialogue.objects.bulk_create(
+            Dialogue(simulation=cls.simulation, title=f"Dialogue {i}", order=i)
+            for i in range(1, DIALOGUES + 1)
+        )
+        for dialogue in dialogues:
+            dialogue.participants.add(cls.system, cls.learner)
+
+        lines = DialogueLine.objects.bulk_create(
+            DialogueLine(
+                dialogue=dialogue,
+                participant=cls.system if order % 2 else cls.learner,
+                order=order,
+                text=f"Ligne {order} du {dialogue.title}",
+            )
+            for dialogue in dialogues
+            for order in range(1, LINES_PER_DIALOGUE + 1)
+        )
+        LineRecording.objects.bulk_create(
+            LineRecording(dialogue_line=line, audio_file=f"simulations/lines/line_{line.pk}.webm")
+            for line in lines[::3]
+        )
+
+        # bulk_create() bypasses the counter signals
+        counters.recount()
+
+        cls.dialogue = dialogues[0]
+        cls.simulation.current_dialogue = cls.dialogue
+        cls.simulation.status = "in_progress"
+        cls.simulation.save()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        prefetcher = get_prefetcher()
+        self.addCleanup(prefetcher._in_flight.clear)
+        patcher = mock.patch.object(prefetcher._executor, "submit")
+        self.submit = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertMaxQueries(self, budget, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(queries),
+            budget,
+            f"{url} ran {len(queries)} queries (budget {budget}):\n"
+            + "\n".join(query["sql"] for query in queries.captured_queries),
+        )
+        return response
+
+    def test_home(self):
+        response = self.assertMaxQueries(2, reverse("simulator:home"))
+        self.assertEqual(response.context["stats"]["dialogues"], DIALOGUES)
+
+    def test_simulation_list(self):
+        self.assertMaxQueries(1, reverse("simulator:simulation_list"))
+
+    def test_simulation_detail(self):
+        response = self.assertMaxQueries(
+            4, reverse("simulator:simulation_detail", args=[self.simulation.pk])
+        )
+        dialogue = response.context["dialogues"][0]
+        self.assertEqual(dialogue.line_count, LINES_PER_DIALOGUE)
+        self.assertEqual(dialogue.recorded_count, 17)
+
+    def test_simulation_run(self):
+        response = self.assertMaxQueries(
+            7, reverse("simulator:simulation_run", args=[self.simulation.pk])
+        )
+        # The unrecorded system lines of this dialogue and the next one's first
+        self.assertEqual(self.submit.call_count, 19)
+        self.assertEqual(len(response.context["lines"]), LINES_PER_DIALOGUE)
+        self.assertEqual(len(response.context["dialogues"]), DIALOGUES)
+        self.assertEqual(response.context["progress"]["lines"], DIALOGUES * LINES_PER_DIALOGUE)
+
+    def test_dialogue_edit(self):
+        self.assertMaxQueries(6, reverse("simulator:dialogue_edit", args=[self.dialogue.pk]))
+
+    def test_participant_list(self):
+        self.assertMaxQueries(3, reverse("simulator:participant_list"))
+
+
+# ========================
+# Counters
+# ========================
+class CounterTests(TestCase):
+    """Counters follow creates and deletes without needing a recount"""
+
+    def setUp(self):
+        user = CustomUser.objects.create_user(email="learner@example.com", password="x")
+        self.participant = Participant.objects.create(user=user, speaker_name="Client")
+        self.simulation = Simulation.objects.create(title="Simulation")
+        self.dialogues = [
+            Dialogue.objects.create(simulation=self.simulation, title=f"D{i}", order=i)
+            for i in (1, 2)
+        ]
+        self.lines = [
+            DialogueLine.objects.create(
+                dialogue=dialogue, participant=self.participant, order=order, text="Bonjour"
+            )
+            for dialogue in self.dialogues
+            for order in (1, 2, 3)
+        ]
+        for line in self.lines[:4]:
+            LineRecording.objects.create(dialogue_line=line, audio_file="line.webm")
+
+    def assertConsistent(self):
+        self.assertEqual(counters.recount(dry_run=True), [])
+
+    def test_creates(self):
+        self.assertEqual(
+            counters.read("dialogue", [self.dialogues[0].pk])[self.dialogues[0].pk],
+            {"lines": 3, "recorded_lines": 3},
+        )
+        self.assertEqual(
+            counters.read("simulation", [self.simulation.pk])[self.simulation.pk],
+            {"dialogues": 2, "lines": 6, "recorded_lines": 4},
+        )
+        self.assertConsistent()
+
+    def test_deletes(self):
+        self.lines[3].recording.delete()
+        self.lines[0].delete()
+        self.assertEqual(counters.global_counts()["recorded_lines"], 2)
+        self.dialogues[1].delete()
+        self.assertEqual(counters.global_counts()["lines"], 2)
+        self.assertConsistent()
+
+        self.simulation.delete()
+        self.participant.delete()
+        self.assertEqual(set(counters.global_counts().values()), {0})
+        self.assertConsistent()
+
+    def test_completion(self):
+        self.simulation.status = "completed"
+        self.simulation.save(update_fields=["status"])
+        self.simulation.save()
+        self.assertEqual(counters.global_counts()["completed_simulations"], 1)
+        self.assertConsistent()
+
+    def test_failed_bump_rolls_back_the_write(self):
+        bump = counters.bump
+        calls = []
+
+        def failing_bump(*args, **kwargs):
+            # The dialogue counter is bumped, then the simulation's fails
+            calls.append(args)
+            if len(calls) > 1:
+                raise IntegrityError("counter update failed")
+            bump(*args, **kwargs)
+
+        with mock.patch("simulator.counters.bump", side_effect=failing_bump):
+            with self.assertRaises(IntegrityError):
+                DialogueLine.objects.create(
+                    dialogue=self.dialogues[0],
+                    participant=self.participant,
+                    order=4,
+                    text="Au revoir",
+                )
+
+        self.assertEqual(len(calls), 2)
+        self.assertFalse(DialogueLine.objects.filter(order=4).exists())
+        self.assertEqual(
+            counters.read("dialogue", [self.dialogues[0].pk])[self.dialogues[0].pk]["lines"], 3
+        )
+        self.assertConsistent()
+
+
+# ========================
+# Pagination
+# ========================
+@override_settings(LIST_PAGE_SIZE=7)
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(email="learner@example.com", password="x")
+        Simulation.objects.bulk_create(
+            Simulation(title=f"Simulation {i}", status="completed" if i % 3 else "pending")
+            for i in range(30)
+        )
+        # Ties on created_at are broken by id
+        Simulation.objects.filter(pk__in=Simulation.objects.values("pk")[:12]).update(
+            created_at=timezone.now()
+        )
+        Participant.objects.bulk_create(
+            Participant(user=cls.user, speaker_name=f"Speaker {i % 4}") for i in range(10)
+        )
+
+    def walk(self, url, **params):
+        """Follows next cursors to the end, then previous cursors back"""
+
+        pages = []
+        while True:
+            data = self.client.get(url, {**params, "format": "json"}).json()
+            pages.append([row["id"] for row in data["results"]])
+            if not data["next"]:
+                break
+            params["after"] = data["next"]
+        params.pop("after", None)
+        backwards = [pages[-1]]
+        while data["previous"]:
+            params["before"] = data["previous"]
+            data = self.client.get(url, {**params, "format": "json"}).json()
+            backwards.insert(0, [row["id"] for row in data["results"]])
+        self.assertEqual(backwards, pages)
+        return [pk for page in pages for pk in page]
+
+    def test_simulations(self):
+        url = reverse("simulator:simulation_list")
+        expected = list(
+            Simulation.objects.order_by("-created_at", "-id").values_list("pk", flat=True)
+        )
+        self.assertEqual(self.walk(url), expected)
+        pending = list(
+            Simulation.objects.filter(status="pending")
+            .order_by("-created_at", "-id")
+            .values_list("pk", flat=True)
+        )
+        self.assertEqual(self.walk(url, status="pending"), pending)
+
+    def test_participants(self):
+        self.client.force_login(self.user)
+        expected = list(
+            Participant.objects.order_by("speaker_name", "id").values_list("pk", flat=True)
+        )
+        self.assertEqual(self.walk(reverse("simulator:participant_list")), expected)
+
+    def test_deep_pages_cost_the_same(self):
+        url = reverse("simulator:simulation_list")
+        data = self.client.get(url, {"format": "json"}).json()
+        for _ in range(3):
+            with CaptureQueriesContext(connection) as queries:
+                data = self.client.get(url, {"format": "json", "after": data["next"]}).json()
+            self.assertEqual(len(queries), 1)
+            self.assertNotIn("OFFSET", queries[0]["sql"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("simulator:simulation_list"), {"after": "nope"})
+        self.assertEqual(response.status_code, 400)
+
+
+# ========================
+# Scale Data
+# ========================
+class GenerateScaleDataTests(TestCase):
+    def test_ratios_and_counters(self):
+        call_command("generate_scale_data", scale=403, batch_size=100, stdout=StringIO())
+
+        self.assertEqual(DialogueLine.objects.count(), 403)
+        self.assertEqual(Dialogue.objects.count(), 51)
+        self.assertEqual(Simulation.objects.count(), 11)
+        self.assertEqual(CustomUser.objects.count(), 3)
+        self.assertFalse(
+            LineRecording.objects.filter(dialogue_line__participant__is_system=True).exists()
+        )
+        self.assertEqual(counters.recount(dry_run=True), [])
+
+
+# ========================
+# Audio Pipeline
+# ========================
+def tone(frequency=440, duration=400):
+    """A short MP3 clip, as an uploaded file"""
+
+    buffer = BytesIO()
+    Sine(frequency).to_audio_segment(duration=duration).export(buffer, format="mp3")
+    return ContentFile(buffer.getvalue(), name="tone.mp3")
+
+
+class AudioTestCase(TestCase):
+    """
+    Runs the audio pipeline on a throwaway media root and caches
+
+    Speech comes from the offline "synthetic" provider and jobs run eagerly.
+    The process-wide caches and TTS service are rebuilt for each test.
+    """
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        overrides = override_settings(
+            MEDIA_ROOT=f"{root}/media",
+            TTS_CACHE_DIR=f"{root}/cache/tts",
+            AUDIO_PCM_CACHE_DIR=f"{root}/cache/pcm",
+            AUDIO_SEGMENT_CACHE_DIR=f"{root}/cache/segments",
+            TTS_PROVIDERS=["synthetic"],
+            AUDIO_JOBS_EAGER=True,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        for singleton in (
+            "simulator.tts._tts_cache",
+            "simulator.tts_providers._tts_service",
+            "simulator.audio._pcm_cache",
+            "simulator.audio._segment_cache",
+        ):
+            patcher = mock.patch(singleton, None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.user = CustomUser.objects.create_user(email="learner@example.com", password="x")
+        self.learner = Participant.objects.create(user=self.user, speaker_name="Client")
+        self.simulation = Simulation.objects.create(title="Simulation", status="completed")
+
+
+class StreamingBuildTests(AudioTestCase):
+    def test_stream_starts_before_the_build_finishes(self):
+        for order in (1, 2, 3):
+            dialogue = Dialogue.objects.create(
+                simulation=self.simulation, title=f"Dialogue {order}", order=order
+            )
+            dialogue.complete_audio.save("complete.mp3", tone(300 + order * 100))
+
+        cache = get_segment_cache()
+        stream = stream_simulation_audio(self.simulation)
+        with mock.patch.object(cache, "ensure_segment", wraps=cache.ensure_segment) as ensure:
+            first = next(stream)
+
+            # Only the first title is encoded and nothing is stored yet
+            self.assertTrue(first)
+            self.assertEqual(ensure.call_count, 1)
+            self.simulation.refresh_from_db()
+            self.assertFalse(self.simulation.final_audio)
+
+            rest = b"".join(stream)
+
+        # A title and a dialogue per dialogue
+        self.assertEqual(ensure.call_count, 6)
+        self.simulation.refresh_from_db()
+        with self.simulation.final_audio.open("rb") as stored:
+            self.assertEqual(stored.read(), first + rest)
+
+
+@override_settings(
+    AUDIO_ANALYSIS_FRAME_MS=20,
+    AUDIO_SILENCE_DBFS=-45.0,
+    AUDIO_TRIM_PADDING_MS=100,
+    AUDIO_TARGET_DBFS=-20.0,
+    AUDIO_PEAK_CEILING_DBFS=-1.0,
+)
+class AnalysisTests(SimpleTestCase):
+    RATE = 16000
+
+    def sine(self, seconds, amplitude, frequency=440):
+        t = np.arange(int(self.RATE * seconds), dtype=np.float32) / self.RATE
+        return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+    def silence(self, seconds):
+        return np.zeros(int(self.RATE * seconds), dtype=np.float32)
+
+    def rms_dbfs(self, samples):
+        return 20 * np.log10(np.sqrt(np.mean(samples.astype(np.float64) ** 2)))
+
+    def assertReportAlmostEqual(self, report, expected):
+        """Reports match, up to float32 rounding in the measurements"""
+
+        self.assertEqual(report.keys(), expected.keys())
+        for key, value in expected.items():
+            if isinstance(value, float):
+                self.assertAlmostEqual(report[key], value, places=2, msg=key)
+            else:
+                self.assertEqual(report[key], value, key)
+
+    def test_silence_is_trimmed_around_the_tone(self):
+        samples = np.concatenate([self.silence(1), self.sine(0.5, 0.1), self.silence(1)])
+
+        processed, report = process_samples(samples, self.RATE)
+
+        # 100 ms of padding is kept on both sides of the tone
+        pad = self.RATE // 10
+        self.assertEqual(report["start"], self.RATE - pad)
+        self.assertEqual(report["end"], self.RATE * 3 // 2 + pad)
+        self.assertEqual(len(processed), self.RATE // 2 + 2 * pad)
+        gain = np.float32(10 ** (report["gain_db"] / 20))
+        tone = samples[self.RATE : self.RATE * 3 // 2]
+        np.testing.assert_allclose(processed[pad:-pad], tone * gain)
+        self.assertEqual(np.abs(processed[:pad]).max(), 0)
+        self.assertEqual(np.abs(processed[-pad:]).max(), 0)
+
+    def test_gain_reaches_the_target_loudness(self):
+        quiet = np.concatenate([self.silence(0.5), self.sine(1, 0.05)])
+
+        processed, report = process_samples(quiet, self.RATE)
+
+        self.assertAlmostEqual(report["rms_dbfs"], self.rms_dbfs(self.sine(1, 0.05)), places=1)
+        self.assertAlmostEqual(self.rms_dbfs(processed[self.RATE // 10 :]), -20.0, places=1)
+        self.assertFalse(report["is_silent"])
+
+    def test_gain_stops_at_the_peak_ceiling(self):
+        # A crest factor of 20 dB: reaching -20 dBFS RMS would clip
+        clicks = self.silence(1)
+        clicks[:: self.RATE // 50] = 0.5
+
+        processed, report = process_samples(clicks, self.RATE)
+
+        self.assertAlmostEqual(report["gain_db"], -1.0 - 20 * np.log10(0.5), places=3)
+        self.assertAlmostEqual(20 * np.log10(np.abs(processed).max()), -1.0, places=3)
+
+    def test_silent_takes_are_flagged_and_left_alone(self):
+        rng = np.random.default_rng(0)
+        hiss = (rng.standard_normal(self.RATE) * 10 ** (-60 / 20)).astype(np.float32)
+
+        for samples in (self.silence(1), hiss, self.silence(0)):
+            processed, report = process_samples(samples, self.RATE)
+            self.assertTrue(report["is_silent"])
+            self.assertIsNone(report["rms_dbfs"])
+            self.assertEqual(report["gain_db"], 0.0)
+            self.assertIs(processed, samples)
+
+    def test_batch_matches_single_takes(self):
+        takes = [
+            np.concatenate([self.silence(0.3), self.sine(0.2, 0.3)]),
+            self.silence(0.7),
+            self.sine(1.1, 0.02, frequency=220),
+        ]
+
+        for report, take in zip(analyze_batch(takes, self.RATE), takes):
+            self.assertReportAlmostEqual(report, analyze_batch([take], self.RATE)[0])
+
+    def test_pcm_round_trip(self):
+        samples = np.concatenate([self.silence(1), self.sine(0.5, 0.1)])
+
+        data, report = process_pcm(array_to_pcm(samples), self.RATE)
+
+        processed, expected = process_samples(samples, self.RATE)
+        self.assertReportAlmostEqual(report, expected)
+        np.testing.assert_allclose(pcm_to_array(data), processed, atol=1e-3)
+
+
+class AudioStreamWriterTests(AudioTestCase):
+    def setUp(self):
+        super().setUp()
+        self.output = os.path.join(settings.MEDIA_ROOT, "out.mp3")
+        self.source = get_audio_storage().path(
+            get_audio_storage().save("audio/shared/tone.mp3", tone())
+        )
+
+    def test_evicted_pcm_is_decoded_again(self):
+        cache = get_pcm_cache()
+        expected = cache.duration_ms(self.source)
+        get = cache.get
+
+        def evicted_after_lookup(source_path):
+            # Another build evicts the entry right after it is found
+            path = get(source_path)
+            if cache.get.call_count == 1:
+                os.unlink(path)
+            return path
+
+        with mock.patch.object(cache, "get", side_effect=evicted_after_lookup):
+            self.assertEqual(cache.duration_ms(self.source), expected)
+        with mock.patch.object(cache, "get", side_effect=evicted_after_lookup):
+            with AudioStreamWriter(self.output) as writer:
+                writer.add_cached_file(self.source)
+        self.assertEqual(writer.duration_ms, expected)
+
+    def test_writes_after_the_encoder_exits_report_its_error(self):
+        with self.assertRaisesRegex(RuntimeError, "Audio encoding failed: .*no_such_option"):
+            with AudioStreamWriter(self.output, encoder_args=["-no_such_option"]) as writer:
+                for _ in range(600):
+                    writer.add_silence(1000)
+
+        self.assertFalse(os.path.exists(self.output))
+        self.assertFalse(
+            [name for name in os.listdir(settings.MEDIA_ROOT) if name.startswith(".partial-")]
+        )
+
+
+class PlaylistTests(AudioTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dialogue = Dialogue.objects.create(
+            simulation=self.simulation, title="Au café", order=1
+        )
+        self.lines = []
+        for order, frequency in ((2, 500), (1, 300)):
+            line = DialogueLine.objects.create(
+                dialogue=self.dialogue, participant=self.learner, order=order, text="Bonjour"
+            )
+            normalized = get_audio_storage().save(
+                f"simulations/lines/normalized/line_{order}.mp3", tone(frequency)
+            )
+            LineRecording.objects.create(
+                dialogue_line=line,
+                audio_file=normalized,
+                normalized_audio=normalized,
+                duration_ms=400,
+            )
+            self.lines.append(line)
+        # Line 3 is not normalized yet and is left out
+        DialogueLine.objects.create(
+            dialogue=self.dialogue, participant=self.learner, order=3, text="Merci"
+        )
+        self.lines.sort(key=lambda line: line.order)
+
+    def test_dialogue_manifest(self):
+        manifest = build_dialogue_manifest(self.dialogue)
+
+        segments = manifest["segments"]
+        self.assertEqual([s["kind"] for s in segments], ["line", "pause", "line", "pause"])
+        self.assertEqual(
+            [segments[0]["line"], segments[2]["line"]], [line.pk for line in self.lines]
+        )
+        for line, pause in zip(self.lines, segments[1::2]):
+            pause_ms = line_pause_ms(file_digest(line.recording.normalized_audio.path))
+            self.assertEqual(pause["duration_ms"], pause_ms)
+            self.assertEqual(pause["path"], shared_silence(pause_ms))
+        self.assertEqual(
+            [s["start_ms"] for s in segments],
+            [0, 400, 400 + segments[1]["duration_ms"], 800 + segments[1]["duration_ms"]],
+        )
+        self.assertEqual(manifest["duration_ms"], sum(s["duration_ms"] for s in segments))
+
+    def test_simulation_manifest_shares_titles_and_silences(self):
+        self.dialogue.audio_manifest = build_dialogue_manifest(self.dialogue)
+        self.dialogue.save(update_fields=["audio_manifest"])
+        encoded = Dialogue.objects.create(simulation=self.simulation, title="Au café", order=2)
+        encoded.complete_audio.save("complete.mp3", tone(700, duration=1000))
+
+        manifest = build_simulation_manifest(self.simulation)
+
+        segments = manifest["segments"]
+        self.assertEqual(
+            [s["kind"] for s in segments],
+            ["title", "pause", "line", "pause", "line", "pause", "pause"]
+            + ["title", "pause", "dialogue", "pause"],
+        )
+        titles = [s for s in segments if s["kind"] == "title"]
+        self.assertEqual([s["dialogue"] for s in titles], [self.dialogue.pk, encoded.pk])
+        # Equal titles and equal pauses are one file each
+        self.assertEqual(titles[0]["path"], titles[1]["path"])
+        self.assertTrue(titles[0]["path"].startswith("audio/shared/title_"))
+        simulation_pauses = [segments[i] for i in (1, 6, 8, 10)]
+        self.assertEqual({s["duration_ms"] for s in simulation_pauses}, {SIMULATION_PAUSE_MS})
+        self.assertEqual(len({s["path"] for s in simulation_pauses}), 1)
+        # The dialogue's own segments follow its title, shifted in time
+        self.assertEqual(
+            [(s["kind"], s["path"], s["duration_ms"]) for s in segments[2:6]],
+            [
+                (s["kind"], s["path"], s["duration_ms"])
+                for s in self.dialogue.audio_manifest["segments"]
+            ],
+        )
+        self.assertEqual(segments[2]["start_ms"], segments[1]["start_ms"] + SIMULATION_PAUSE_MS)
+
+        shared = {s["path"] for s in segments if s["kind"] in ("title", "pause")}
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(settings.MEDIA_ROOT, "audio/shared"))),
+            sorted(os.path.basename(path) for path in shared),
+        )
+
+        playlist = manifest_to_m3u8(manifest).splitlines()
+        self.assertEqual(
+            playlist[:5],
+            [
+                "#EXTM3U",
+                "#EXT-X-VERSION:3",
+                "#EXT-X-PLAYLIST-TYPE:VOD",
+                "#EXT-X-TARGETDURATION:2",
+                "#EXT-X-MEDIA-SEQUENCE:0",
+            ],
+        )
+        self.assertEqual(playlist[-1], "#EXT-X-ENDLIST")
+        self.assertEqual(
+            playlist[5:-1:2], [f"#EXTINF:{s['duration_ms'] / 1000:.3f}," for s in segments]
+        )
+        self.assertEqual(
+            playlist[6:-1:2], [f"{settings.MEDIA_URL}{s['path']}" for s in segments]
+        )
+
+
+class TTSCacheTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.cache = TTSCache(root, max_bytes=10**9)
+        self.key = TTSCache.make_key("Bonjour")
+
+    def fetch_in_thread(self, synthesize):
+        """Starts cache.fetch in a thread; returns the thread and its outcome"""
+
+        outcome = {}
+
+        def run():
+            try:
+                outcome["path"] = self.cache.fetch(self.key, synthesize)
+            except Exception as exc:
+                outcome["error"] = exc
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        return thread, outcome
+
+    def wait_for_users(self, count):
+        """Waits until count threads hold or wait for the key's lock"""
+
+        for _ in range(500):
+            with self.cache._lock:
+                entry = self.cache._key_locks.get(self.key)
+                if entry and entry[1] == count:
+                    return
+            time.sleep(0.01)
+        self.fail(f"{count} threads never reached the key lock")
+
+    def synthesizer(self, fail=False):
+        """A synthesize callable that blocks until released, recording its calls"""
+
+        synthesize = mock.Mock()
+        synthesize.started = threading.Event()
+        synthesize.release = threading.Event()
+        self.addCleanup(synthesize.release.set)
+
+        def write(path):
+            synthesize.started.set()
+            synthesize.release.wait(5)
+            if fail:
+                raise ConnectionError("down")
+            with open(path, "wb") as f:
+                f.write(b"clip")
+
+        synthesize.side_effect = write
+        return synthesize
+
+    def test_concurrent_misses_synthesize_once(self):
+        synthesize = self.synthesizer()
+        fetches = [self.fetch_in_thread(synthesize) for _ in range(4)]
+        self.wait_for_users(4)
+        synthesize.release.set()
+        for thread, _outcome in fetches:
+            thread.join(5)
+
+        self.assertEqual(synthesize.call_count, 1)
+        paths = {outcome["path"] for _thread, outcome in fetches}
+        self.assertEqual(paths, {self.cache.path_for(self.key)})
+        self.assertEqual(self.cache._key_locks, {})
+
+    def test_misses_after_a_failure_still_share_one_lock(self):
+        failing, retry, late = self.synthesizer(fail=True), self.synthesizer(), self.synthesizer()
+
+        first, first_outcome = self.fetch_in_thread(failing)
+        self.assertTrue(failing.started.wait(5))
+        second, second_outcome = self.fetch_in_thread(retry)
+        self.wait_for_users(2)
+
+        # The waiter retries; a miss arriving meanwhile waits for that retry
+        failing.release.set()
+        first.join(5)
+        self.assertTrue(retry.started.wait(5))
+        third, third_outcome = self.fetch_in_thread(late)
+        self.wait_for_users(2)
+        retry.release.set()
+        second.join(5)
+        third.join(5)
+
+        self.assertIsInstance(first_outcome["error"], ConnectionError)
+        self.assertEqual(second_outcome["path"], third_outcome["path"])
+        self.assertEqual((failing.call_count, retry.call_count, late.call_count), (1, 1, 0))
+        self.assertEqual(self.cache._key_locks, {})
+
+
+class TTSFailoverTests(AudioTestCase):
+    def test_failover_and_circuit_breaker(self):
+        service = TTSService(
+            ["gtts", "synthetic"],
+            timeout=5,
+            breaker_threshold=2,
+            breaker_reset=30,
+            max_workers=1,
+        )
+        breaker = service.breakers["gtts"]
+
+        with mock.patch.object(
+            GTTSProvider, "synthesize", side_effect=ConnectionError("down")
+        ) as gtts:
+            fallback = service.speech_path("Bonjour")
+            service.speech_path("Merci")
+            self.assertEqual(gtts.call_count, 2)
+            self.assertEqual(breaker.state, "open")
+
+            # An open circuit is skipped without calling the provider
+            service.speech_path("Au revoir")
+            self.assertEqual(gtts.call_count, 2)
+
+            # Half-open: one trial call, whose failure opens the circuit again
+            breaker.opened_at -= 30
+            self.assertEqual(breaker.state, "half-open")
+            service.speech_path("Bonsoir")
+            self.assertEqual(gtts.call_count, 3)
+            self.assertEqual(breaker.state, "open")
+
+        breaker.opened_at -= 30
+        with mock.patch.object(
+            GTTSProvider, "synthesize", side_effect=SyntheticProvider().synthesize
+        ) as gtts:
+            recovered = service.speech_path("Bonjour")
+        self.assertEqual(gtts.call_count, 1)
+        self.assertEqual(breaker.state, "closed")
+        # The preferred provider's clip replaces the fallback in the cache
+        self.assertNotEqual(recovered, fallback)
+        self.assertEqual(service.speech_path("Bonjour"), recovered)
+
+        stats = service.stats()
+        self.assertEqual(stats["gtts"]["failures"], 3)
+        self.assertEqual(stats["synthetic"]["calls"], 4)
+
+
+class SpeechPrefetchTests(AudioTestCase):
+    TEXTS = {1: "Bonjour", 2: "Merci"}
+
+    def setUp(self):
+        super().setUp()
+        self.prefetcher = SpeechPrefetcher(max_workers=2)
+        self.addCleanup(self.prefetcher._executor.shutdown)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+        def synthesize(line_id):
+            self.started.set()
+            self.release.wait(5)
+            get_tts_service().speech_path(self.TEXTS[line_id])
+
+        # Stands in for ensure_system_recording, which needs the database
+        for patcher in (
+            mock.patch("simulator.prefetch.get_prefetcher", return_value=self.prefetcher),
+            mock.patch.object(SpeechPrefetcher, "_run", side_effect=synthesize),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.release.set)
+
+    def test_in_flight_lines_are_queued_once(self):
+        self.assertEqual(self.prefetcher.submit([1, 2, 1]), 2)
+        self.assertEqual(self.prefetcher.submit([2, 1]), 0)
+
+        self.release.set()
+        self.prefetcher._executor.shutdown(wait=True)
+        queued = [call.args[0] for call in SpeechPrefetcher._run.call_args_list]
+        self.assertEqual(sorted(queued), [1, 2])
+        self.assertEqual(self.prefetcher._in_flight, {})
+
+    def test_wait_for_prefetch_returns_once_the_clip_is_cached(self):
+        self.assertFalse(wait_for_prefetch(1))
+
+        self.prefetcher.submit([1])
+        self.assertTrue(self.started.wait(5))
+        with override_settings(TTS_TIMEOUT=0.05):
+            self.assertFalse(wait_for_prefetch(1))
+        self.assertIsNone(get_tts_service().cached_path(self.TEXTS[1]))
+
+        self.release.set()
+        self.assertTrue(wait_for_prefetch(1))
+        self.assertIsNotNone(get_tts_service().cached_path(self.TEXTS[1]))
+
+
+class PhraseTests(AudioTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch("simulator.phrases.phrase_stats", PhraseStats())
+        self.stats = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.output = os.path.join(settings.MEDIA_ROOT, "line.mp3")
+        os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+
+    def synthesized(self, *texts):
+        """Assembles each text, returning what the provider was asked to say"""
+
+        with mock.patch.object(
+            SyntheticProvider, "synthesize", side_effect=SyntheticProvider().synthesize
+        ) as synthesize:
+            for text in texts:
+                assemble_phrases(text, self.output)
+        return [call.args[0] for call in synthesize.call_args_list]
+
+    def test_split_phrases(self):
+        self.assertEqual(
+            split_phrases("Bonjour M. Dupont, ça coûte 3.5 euros ! Merci…  Au revoir."),
+            ["Bonjour M. Dupont,", "ça coûte 3.5 euros !", "Merci…", "Au revoir."],
+        )
+        self.assertEqual(split_phrases("  "), [])
+
+    def test_phrases_share_clips_but_keep_their_text(self):
+        spoken = self.synthesized(
+            "S’il vous plaît, un café.",
+            "s'il vous plaît. Un thé ?",
+        )
+
+        # The first spelling is synthesized as written and reused for the second
+        self.assertEqual(spoken, ["S’il vous plaît,", "un café.", "Un thé ?"])
+        self.assertEqual(self.stats.stats()["lookups"], 4)
+        self.assertEqual(self.stats.stats()["hits"], 1)
+        self.assertGreater(os.path.getsize(self.output), 0)
+
+    def test_empty_lines_are_not_synthesized(self):
+        self.assertEqual(self.synthesized("…", ", .", "Oui. …"), ["Oui."])
+        self.assertGreater(os.path.getsize(self.output), 0)
+
+    def test_catalogue_report(self):
+        report = catalogue_report(
+            ["Bonjour, madame.", "Bonjour,  madame.", "Bonjour, monsieur.", "…"]
+        )
+
+        self.assertEqual(report["lines"], 4)
+        self.assertEqual(report["distinct_lines"], 3)
+        self.assertAlmostEqual(report["line_hit_rate"], 1 / 4)
+        # bonjour x3, madame x2, monsieur x1
+        self.assertEqual(report["phrases"], 6)
+        self.assertEqual(report["distinct_phrases"], 3)
+        self.assertAlmostEqual(report["phrase_hit_rate"], 1 / 2)
+        self.assertEqual(report["chars_phrase_cache"], len("bonjourmadamemonsieur"))
+        self.assertEqual(catalogue_report([])["phrase_hit_rate"], 0.0)
+
+
+class PregenerateTTSTests(AudioTestCase):
+    def setUp(self):
+        super().setUp()
+        system = Participant.objects.create(user=self.user, speaker_name="Serveur", is_system=True)
+        dialogue = Dialogue.objects.create(simulation=self.simulation, title="Café", order=1)
+        self.lines = [
+            DialogueLine.objects.create(
+                dialogue=dialogue, participant=system, order=order, text=text
+            )
+            for order, text in ((1, "Bonjour !"), (2, "Et avec ceci ?"))
+        ]
+
+    def pregenerate(self):
+        """Runs pregenerate_tts --all, returning the names it synthesized"""
+
+        from .management.commands import pregenerate_tts
+
+        with mock.patch.object(
+            pregenerate_tts,
+            "synthesize_system_line",
+            side_effect=pregenerate_tts.synthesize_system_line,
+        ) as synthesize:
+            call_command("pregenerate_tts", "--all", stdout=StringIO(), stderr=StringIO())
+        return [call.args[0].pk for call in synthesize.call_args_list]
+
+    def test_all_is_idempotent(self):
+        self.assertEqual(sorted(self.pregenerate()), [line.pk for line in self.lines])
+        self.assertEqual(LineRecording.objects.count(), 2)
+
+        self.assertEqual(self.pregenerate(), [])
+        self.assertEqual(LineRecording.objects.count(), 2)
+
+    def test_lines_recorded_meanwhile_keep_their_recording(self):
+        rival = get_audio_storage().save("simulations/lines/rival.mp3", tone())
+        bulk_create = LineRecording.objects.bulk_create
+
+        def recorded_meanwhile(recordings, **kwargs):
+            LineRecording.objects.create(dialogue_line=self.lines[0], audio_file=rival)
+            return bulk_create(recordings, **kwargs)
+
+        with mock.patch.object(
+            LineRecording.objects, "bulk_create", side_effect=recorded_meanwhile
+        ):
+            self.pregenerate()
+
+        first, second = (LineRecording.objects.get(pk=line.pk) for line in self.lines)
+        self.assertEqual(first.audio_file.name, rival)
+        self.assertTrue(second.audio_file.storage.exists(second.audio_file.name))
+        # The losing clip is gone; only the two recordings remain
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(settings.MEDIA_ROOT, "simulations/lines"))),
+            sorted(["rival.mp3", os.path.basename(second.audio_file.name), "normalized"]),
+        )
+
+
+class ASRBatchingTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        patcher = mock.patch.dict(StubBackend.transcripts)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.paths = []
+        for index, text in enumerate(["bonjour", "merci", "au revoir", "bonsoir"]):
+            path = f"{directory}/take_{index}.mp3"
+            with open(path, "wb") as f:
+                f.write(tone(300 + index * 100).read())
+            StubBackend.expect(path, text)
+            self.paths.append(path)
+
+    def test_requests_arriving_together_share_a_batch(self):
+        # A long wait: the batch is only cut short by reaching batch_size
+        pool = ASRPool("stub", batch_size=4, batch_wait=5)
+        futures = [pool.submit(path) for path in self.paths]
+
+        texts = [future.result(timeout=5) for future in futures]
+        self.assertEqual(texts, ["bonjour", "merci", "au revoir", "bonsoir"])
+        self.assertEqual(pool.stats()["batches"], 1)
+        self.assertEqual(pool.stats()["mean_batch_size"], 4)
+
+    def test_models_are_loaded_once_and_batched_apart(self):
+        pool = ASRPool("stub", batch_size=4, batch_wait=5)
+        futures = [
+            pool.submit(path, model_name=model)
+            for path, model in zip(self.paths, ["small", "base", "small", "base"])
+        ]
+
+        self.assertEqual(
+            [future.result(timeout=5) for future in futures],
+            ["bonjour", "merci", "au revoir", "bonsoir"],
+        )
+        stats = pool.stats()
+        self.assertEqual(stats["models"], ["base", "small"])
+        self.assertEqual(stats["batches"], 2)
+        self.assertEqual(stats["requests"], 4)
+
+
+class RecordingUploadTests(AudioTestCase):
+    def setUp(self):
+        super().setUp()
+        dialogue = Dialogue.objects.create(simulation=self.simulation, title="Café", order=1)
+        self.line = DialogueLine.objects.create(
+            dialogue=dialogue, participant=self.learner, order=1, text="Un café, s'il vous plaît"
+        )
+        self.url = reverse("simulator:upload_line_recording", args=[self.line.pk])
+        self.audio = tone().read()
+        self.client.force_login(self.user)
+
+    def test_raw_body(self):
+        response = self.client.post(self.url, self.audio, content_type="audio/webm")
+
+        self.assertEqual(response.status_code, 200)
+        recording = LineRecording.objects.get(pk=self.line.pk)
+        self.assertEqual(response.json()["audio_url"], recording.audio_file.url)
+        self.assertTrue(recording.audio_file.name.endswith(".webm"))
+        with recording.audio_file.open("rb") as stored:
+            self.assertEqual(stored.read(), self.audio)
+
+    def test_multipart(self):
+        upload = SimpleUploadedFile("take", self.audio, content_type="audio/ogg; codecs=opus")
+        response = self.client.post(self.url, {"audio": upload})
+
+        self.assertEqual(response.status_code, 200)
+        recording = LineRecording.objects.get(pk=self.line.pk)
+        self.assertTrue(recording.audio_file.name.endswith(".ogg"))
+        with recording.audio_file.open("rb") as stored:
+            self.assertEqual(stored.read(), self.audio)
+
+    def test_rejections(self):
+        with override_settings(RECORDING_UPLOAD_MAX_BYTES=len(self.audio) - 1):
+            response = self.client.post(self.url, self.audio, content_type="audio/webm")
+            self.assertEqual(response.status_code, 413)
+        self.assertEqual(
+            self.client.post(self.url, self.audio, content_type="text/plain").status_code, 415
+        )
+        upload = SimpleUploadedFile("take.txt", self.audio, content_type="text/plain")
+        self.assertEqual(self.client.post(self.url, {"audio": upload}).status_code, 415)
+        # The test client drops the content type of an empty body
+        response = self.client.generic("POST", self.url, b"", CONTENT_TYPE="audio/webm")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(LineRecording.objects.exists())
+
+    def test_other_users_lines_are_rejected(self):
+        self.client.force_login(
+            CustomUser.objects.create_user(email="other@example.com", password="x")
+        )
+        response = self.client.post(self.url, self.audio, content_type="audio/webm")
+        self.assertEqual(response.status_code, 404)
+
+        self.client.logout()
+        response = self.client.post(self.url, self.audio, content_type="audio/webm")
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(LineRecording.objects.exists())
+
+    def test_new_take_resets_the_analysis(self):
+        LineRecording.objects.create(
+            dialogue_line=self.line,
+            audio_file=get_audio_storage().save("simulations/lines/old.mp3", tone(300)),
+            normalized_audio="simulations/lines/normalized/old.mp3",
+            duration_ms=400,
+            rms_dbfs=-20.0,
+            is_silent=True,
+            transcript="un cafe",
+            char_score=0.5,
+            word_score=0.5,
+        )
+
+        with mock.patch("simulator.utils.enqueue") as enqueue:
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = self.client.post(self.url, self.audio, content_type="audio/webm")
+                self.assertEqual(response.status_code, 200)
+            # Normalization is queued once the new file is committed
+            enqueue.assert_not_called()
+            for callback in callbacks:
+                callback()
+        enqueue.assert_called_once_with("normalize_recording", self.line.pk)
+
+        recording = LineRecording.objects.get(pk=self.line.pk)
+        self.assertTrue(recording.audio_file.name.endswith(".webm"))
+        self.assertFalse(recording.normalized_audio)
+        self.assertIsNone(recording.duration_ms)
+        self.assertIsNone(recording.rms_dbfs)
+        self.assertFalse(recording.is_silent)
+        self.assertEqual(recording.transcript, "")
+        self.assertIsNone(recording.char_score)
+        self.assertIsNone(recording.word_score)
+
+
+@override_settings(ASR_BACKEND="stub")
+class LiveRecordingTests(AudioTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch("simulator.asr._asr_pool", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(StubBackend, "stream_text", "bonjour madame")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        dialogue = Dialogue.objects.create(simulation=self.simulation, title="Dialogue", order=1)
+        self.line = DialogueLine.objects.create(
+            dialogue=dialogue, participant=self.learner, order=1, text="Bonjour, madame !"
+        )
+        self.client.force_login(self.user)
+        self.headers = [
+            (b"origin", b"http://localhost"),
+            (b"cookie", f"sessionid={self.client.cookies['sessionid'].value}".encode()),
+        ]
+
+    async def record(self, events, headers=None):
+        """Runs one socket through websocket_application, returning what it sent"""
+
+        events = [{"type": "websocket.connect"}, *events]
+        sent = []
+
+        async def receive():
+            return events.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "websocket",
+            "path": f"/ws/line/{self.line.pk}/record/",
+            "headers": self.headers if headers is None else headers,
+        }
+        await websocket_application(scope, receive, send)
+        return sent
+
+    def chunks(self):
+        take = tone(duration=2000).read()
+        return [
+            {"type": "websocket.receive", "bytes": take[start : start + 4096]}
+            for start in range(0, len(take), 4096)
+        ]
+
+    async def test_stop_saves_the_take(self):
+        sent = await self.record(
+            [*self.chunks(), {"type": "websocket.receive", "text": json.dumps({"type": "stop"})}]
+        )
+
+        self.assertEqual(sent[0], {"type": "websocket.accept"})
+        self.assertEqual(sent[-1], {"type": "websocket.close", "code": 1000})
+        messages = [json.loads(message["text"]) for message in sent if "text" in message]
+        saved = messages[-1]
+        self.assertEqual(saved["type"], "saved")
+        self.assertEqual(saved["transcript"], "bonjour madame")
+        self.assertEqual(saved["char_score"], 1.0)
+
+        recording = await LineRecording.objects.aget(dialogue_line=self.line)
+        self.assertEqual(recording.transcript, "bonjour madame")
+        self.assertEqual(recording.audio_file.url, saved["audio_url"])
+
+    async def test_disconnect_discards_the_take(self):
+        sent = await self.record([*self.chunks(), {"type": "websocket.disconnect", "code": 1001}])
+
+        self.assertEqual(sent[0], {"type": "websocket.accept"})
+        self.assertFalse(await LineRecording.objects.filter(dialogue_line=self.line).aexists())
+
+    async def test_foreign_origin_and_anonymous_sockets_are_refused(self):
+        refused = {"type": "websocket.close", "code": 4403}
+        foreign = [(b"origin", b"https://example.org"), self.headers[1]]
+        self.assertEqual(await self.record([], headers=foreign), [refused])
+        self.assertEqual(await self.record([], headers=self.headers[:1]), [refused])
+
+    async def session(self):
+        async def send(message):
+            pass
+
+        session = RecordingSession(self.line, send)
+        self.addCleanup(session.raw.close)
+        return session
+
+    async def test_partials_only_copy_the_recent_window(self):
+        session = await self.session()
+        session.pcm = bytearray(SAMPLE_RATE * 2 * (PARTIAL_WINDOW_SECONDS + 10) + 1)
+
+        with mock.patch.object(get_asr_pool(), "transcribe", return_value="") as transcribe:
+            await session.recognize(PARTIAL_WINDOW_SECONDS)
+            window = transcribe.call_args.args[0]
+            self.assertEqual(len(window), SAMPLE_RATE * PARTIAL_WINDOW_SECONDS)
+            await session.recognize()
+            self.assertEqual(len(transcribe.call_args.args[0]), len(session.pcm) // 2)
+
+    @override_settings(REALTIME_MAX_TAKE_SECONDS=1)
+    async def test_takes_stop_growing_at_the_limit(self):
+        session = await self.session()
+        session.decoder = mock.Mock(stdout=asyncio.StreamReader())
+        session.decoder.stdout.feed_data(bytes(SAMPLE_RATE * 2 * 3))
+        session.decoder.stdout.feed_eof()
+
+        await session.read_pcm()
+        self.assertEqual(len(session.pcm), SAMPLE_RATE * 2)
+        self.assertTrue(session.too_long)
+        self.assertFalse(await session.feed(b"more"))
+
+
+class MediaServingTests(AudioTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dialogue = Dialogue.objects.create(
+            simulation=self.simulation, title="Dialogue", order=1
+        )
+        self.dialogue.complete_audio.save("complete.mp3", tone())
+        self.url = self.dialogue.complete_audio.url
+        with open(self.dialogue.complete_audio.path, "rb") as f:
+            self.body = f.read()
+
+    def get(self, url=None, **headers):
+        response = self.client.get(url or self.url, headers=headers)
+        if response.streaming:
+            response.content_bytes = b"".join(response.streaming_content)
+        return response
+
+    def test_hidden_storage_files_are_not_served(self):
+        self.assertEqual(self.get().status_code, 200)
+
+        # The blob behind that name, and a build still being written
+        partial = "simulations/final/.partial-build.mp3"
+        storage = self.dialogue.complete_audio.storage
+        storage.save(partial, tone())
+        blob = storage.blob_path(file_digest(self.dialogue.complete_audio.path))
+        for path in (os.path.relpath(blob, settings.MEDIA_ROOT), partial):
+            self.assertTrue(os.path.isfile(os.path.join(settings.MEDIA_ROOT, path)))
+            response = self.client.get(f"{settings.MEDIA_URL}{path}")
+            self.assertEqual(response.status_code, 404, path)
+
+    def test_recordings_are_served_to_their_owner_only(self):
+        line = DialogueLine.objects.create(
+            dialogue=self.dialogue, participant=self.learner, order=1, text="Bonjour"
+        )
+        recording = LineRecording.objects.create(dialogue_line=line)
+        recording.audio_file.save("take.mp3", tone())
+        url = recording.audio_file.url
+
+        self.assertEqual(self.get(url).status_code, 404)
+        stranger = CustomUser.objects.create_user(email="other@example.com", password="x")
+        self.client.force_login(stranger)
+        self.assertEqual(self.get(url).status_code, 404)
+
+        self.client.force_login(self.user)
+        response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"], "private")
+
+        staff = CustomUser.objects.create_user(
+            email="staff@example.com", password="x", is_staff=True
+        )
+        self.client.force_login(staff)
+        self.assertEqual(self.get(url).status_code, 200)
+
+        # Paths outside the known prefixes are never served
+        other = self.dialogue.complete_audio.storage.save("exports/report.mp3", tone())
+        self.assertEqual(self.get(f"{settings.MEDIA_URL}{other}").status_code, 404)
+
+    def test_ranges(self):
+        size = len(self.body)
+
+        response = self.get(Range="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 10-19/{size}")
+        self.assertEqual(response["Content-Length"], "10")
+        self.assertEqual(response.content_bytes, self.body[10:20])
+
+        response = self.get(Range="bytes=-100")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes {size - 100}-{size - 1}/{size}")
+        self.assertEqual(response.content_bytes, self.body[-100:])
+
+        response = self.get(Range=f"bytes={size}-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{size}")
+
+    def test_conditional_requests(self):
+        response = self.get()
+        etag, last_modified = response["ETag"], response["Last-Modified"]
+        self.assertEqual(response.content_bytes, self.body)
+
+        self.assertEqual(self.get(If_None_Match=etag).status_code, 304)
+        self.assertEqual(self.get(If_Modified_Since=last_modified).status_code, 304)
+        self.assertEqual(self.get(If_None_Match='"stale"').status_code, 200)
+
+        # A partial copy of an older version must be replaced entirely
+        response = self.get(Range="bytes=0-9", If_Range='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content_bytes, self.body)
+        self.assertEqual(self.get(Range="bytes=0-9", If_Range=etag).status_code, 206)
+
+    def test_sendfile_offload(self):
+        name = self.dialogue.complete_audio.name
+        with override_settings(
+            MEDIA_SENDFILE_BACKEND="x-accel-redirect", MEDIA_ACCEL_REDIRECT_PREFIX="/internal/"
+        ):
+            response = self.get()
+        self.assertEqual(response["X-Accel-Redirect"], f"/internal/{name}")
+        self.assertEqual(response.content, b"")
+        self.assertIn("ETag", response)
+
+        with override_settings(MEDIA_SENDFILE_BACKEND="x-sendfile"):
+            response = self.get()
+        self.assertEqual(
+            response["X-Sendfile"], os.path.join(settings.MEDIA_ROOT, name)
+        )
+
+
+class ImmutableMediaTests(AudioTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dialogue = Dialogue.objects.create(
+            simulation=self.simulation, title="Dialogue", order=1
+        )
+        for order, frequency in ((1, 300), (2, 500)):
+            line = DialogueLine.objects.create(
+                dialogue=self.dialogue, participant=self.learner, order=order, text="Bonjour"
+            )
+            recording = LineRecording.objects.create(dialogue_line=line)
+            recording.audio_file.save(f"take_{order}.mp3", tone(frequency))
+        self.client.force_login(self.user)
+
+    def build(self):
+        """Builds the dialogue from cold caches, returning its name and bytes"""
+
+        shutil.rmtree(settings.AUDIO_SEGMENT_CACHE_DIR, ignore_errors=True)
+        shutil.rmtree(settings.AUDIO_PCM_CACHE_DIR, ignore_errors=True)
+        with mock.patch("simulator.audio._segment_cache", None), mock.patch(
+            "simulator.audio._pcm_cache", None
+        ):
+            relative_path = concatenate_dialogue_audio(self.dialogue)
+        path = os.path.join(settings.MEDIA_ROOT, relative_path)
+        with open(path, "rb") as f:
+            body = f.read()
+        os.unlink(path)
+        return relative_path, body
+
+    def cache_control(self, path, **headers):
+        response = self.client.get(f"{settings.MEDIA_URL}{path}", headers=headers)
+        return response.status_code, response.get("Cache-Control")
+
+    def test_digest_named_outputs_are_immutable(self):
+        relative_path = concatenate_dialogue_audio(self.dialogue)
+        immutable = f"public, max-age={settings.IMMUTABLE_MEDIA_MAX_AGE}, immutable"
+
+        self.assertRegex(relative_path, settings.IMMUTABLE_MEDIA_PATTERN)
+        status, cache_control = self.cache_control(relative_path)
+        self.assertEqual((status, cache_control), (200, immutable))
+        etag = self.client.get(f"{settings.MEDIA_URL}{relative_path}")["ETag"]
+        self.assertEqual(self.cache_control(relative_path, if_none_match=etag), (304, immutable))
+
+        # Recordings and files not named after their inputs can change
+        recording = LineRecording.objects.first()
+        status, cache_control = self.cache_control(recording.audio_file.name)
+        self.assertEqual(status, 200)
+        self.assertNotIn("immutable", cache_control or "")
+        self.dialogue.complete_audio.save("complete.mp3", tone())
+        status, cache_control = self.cache_control(self.dialogue.complete_audio.name)
+        self.assertEqual(status, 200)
+        self.assertNotIn("immutable", cache_control or "")
+
+    def test_same_inputs_reproduce_the_same_output(self):
+        name, body = self.build()
+        self.assertEqual(self.build(), (name, body))
+
+        recording = LineRecording.objects.first()
+        recording.audio_file.save("take_1.mp3", tone(700))
+        changed_name, changed_body = self.build()
+        self.assertNotEqual(changed_name, name)
+        self.assertNotEqual(changed_body, body)
+
+
+# ========================
+# Scoring
+# ========================
+class ScoringTests(TestCase):
+    def test_normalize_text(self):
+        cases = {
+            "L’élève, a-t-il œuvré ?": "l eleve a t il oeuvre",
+            "Ça  coûte   ÉNORMÉMENT !": "ca coute enormement",
+            "aujourd'hui — peut‑être": "aujourd hui peut etre",
+            "Cæsar, Straße… 3,50 €": "caesar strasse 3 50",
+            "": "",
+        }
+        for text, expected in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(normalize_text(text), expected)
+
+    def test_scores(self):
+        self.assertEqual(
+            score_transcript("", ""), {"char_score": 1.0, "word_score": 1.0}
+        )
+        self.assertEqual(
+            score_transcript("l eleve a t il oeuvre", "L’élève a-t-il œuvré ?"),
+            {"char_score": 1.0, "word_score": 1.0},
+        )
+        self.assertEqual(
+            score_transcript("", "Bonjour"), {"char_score": 0.0, "word_score": 0.0}
+        )
+        scores = score_transcript("bonjour madame", "Bonjour, monsieur.")
+        self.assertAlmostEqual(scores["word_score"], 0.5)
+        self.assertLess(scores["char_score"], 1.0)
+
+    def test_score_recordings_in_batches(self):
+        user = CustomUser.objects.create_user(email="learner@example.com", password="x")
+        participant = Participant.objects.create(user=user, speaker_name="Client")
+        dialogue = Dialogue.objects.create(
+            simulation=Simulation.objects.create(title="Simulation"), title="D", order=1
+        )
+        transcripts = ["bonjour", "merci", "", "au revoir", "bonsoir madame"]
+        for order, transcript in enumerate(transcripts, start=1):
+            line = DialogueLine.objects.create(
+                dialogue=dialogue, participant=participant, order=order, text="Bonjour"
+            )
+            LineRecording.objects.create(
+                dialogue_line=line, audio_file="line.webm", transcript=transcript
+            )
+
+        # Per batch of two: one SELECT and one bulk UPDATE; then the empty page
+        with self.assertNumQueries(2 * 2 + 1):
+            self.assertEqual(score_recordings(LineRecording.objects.all(), batch_size=2), 4)
+
+        scores = dict(
+            LineRecording.objects.order_by("dialogue_line__order").values_list(
+                "transcript", "word_score"
+            )
+        )
+        self.assertEqual(scores["bonjour"], 1.0)
+        self.assertEqual(scores["merci"], 0.0)
+        self.assertIsNone(scores[""])
+        self.assertEqual(scores["au revoir"], 0.0)
+        self.assertEqual(scores["bonsoir madame"], 0.0)
+
+
+# ========================
+# Content-Addressed Storage
+# ========================
+class ContentAddressedStorageTests(SimpleTestCase):
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        self.storage = ContentAddressedStorage(location=location)
+
+    def blob_of(self, name):
+        return self.storage.blob_path(file_digest(self.storage.path(name)))
+
+    def test_identical_files_share_one_blob(self):
+        first = self.storage.save("lines/a.mp3", ContentFile(b"same bytes"))
+        second = self.storage.save("lines/b.mp3", ContentFile(b"same bytes"))
+        blob = self.blob_of(first)
+
+        self.assertEqual(os.stat(self.storage.path(first)).st_ino, os.stat(blob).st_ino)
+        self.assertEqual(os.stat(self.storage.path(second)).st_ino, os.stat(blob).st_ino)
+        self.assertEqual(os.stat(blob).st_nlink, 3)
+
+        # The blob lives as long as one name links to it
+        self.storage.delete(first)
+        self.assertTrue(os.path.exists(blob))
+        with self.storage.open(second) as f:
+            self.assertEqual(f.read(), b"same bytes")
+
+        self.storage.delete(second)
+        self.assertFalse(os.path.exists(blob))
+        self.assertEqual(list(self.storage.unreferenced_blobs()), [])
+
+    def test_taken_names_get_a_suffix(self):
+        first = self.storage.save("lines/a.mp3", ContentFile(b"one"))
+        second = self.storage.save("lines/a.mp3", ContentFile(b"two"))
+        self.assertNotEqual(first, second)
+        with self.storage.open(first) as f:
+            self.assertEqual(f.read(), b"one")
+
+    def test_adopt_existing_files(self):
+        plain = FileSystemStorage(location=self.storage.location)
+        old = plain.save("lines/old.mp3", ContentFile(b"legacy"))
+        twin = plain.save("lines/twin.mp3", ContentFile(b"legacy"))
+
+        self.assertTrue(self.storage.adopt(old))
+        self.assertEqual(os.stat(self.storage.path(old)).st_nlink, 2)
+        self.assertFalse(self.storage.adopt(old))
+
+        # Same bytes as an adopted file: the name now points at that blob
+        self.assertTrue(self.storage.adopt(twin))
+        blob = self.blob_of(old)
+        self.assertEqual(os.stat(blob).st_nlink, 3)
+        self.assertEqual(os.stat(self.storage.path(twin)).st_ino, os.stat(blob).st_ino)
+        with self.storage.open(twin) as f:
+            self.assertEqual(f.read(), b"legacy")
+
+    def test_crash_between_blob_and_link_leaves_an_unreferenced_blob(self):
+        kept = self.storage.save("lines/kept.mp3", ContentFile(b"kept"))
+        link = os.link
+
+        def crash_on_name(source, target):
+            if BLOB_DIR not in target:
+                raise KeyboardInterrupt
+            link(source, target)
+
+        with mock.patch("simulator.storage.os.link", crash_on_name):
+            with self.assertRaises(KeyboardInterrupt):
+                self.storage.save("lines/lost.mp3", ContentFile(b"lost"))
+
+        self.assertFalse(self.storage.exists("lines/lost.mp3"))
+        orphans = list(self.storage.unreferenced_blobs())
+        self.assertEqual(len(orphans), 1)
+        with open(orphans[0], "rb") as f:
+            self.assertEqual(f.read(), b"lost")
+        self.assertNotEqual(orphans[0], self.blob_of(kept))
+
+
+# ========================
+# Media Retention
+# ========================
+class MediaGCTests(AudioTestCase):
+    def setUp(self):
+        super().setUp()
+        self.simulation.completed_at = timezone.now() - timedelta(days=60)
+        self.simulation.final_audio.save("final.mp3", tone(200))
+        self.ongoing = Simulation.objects.create(title="En cours", status="in_progress")
+
+        self.expired = self.record(self.simulation, 300)
+        self.kept = self.record(self.ongoing, 400)
+        # Only the ongoing simulation's playlist references this clip
+        self.segment = self.media_file("audio/shared/silence_500ms.mp3")
+        Dialogue.objects.filter(pk=self.kept.dialogue_line.dialogue_id).update(
+            audio_manifest={"segments": [{"path": self.segment}]}
+        )
+        self.orphan = self.media_file("simulations/final/old_build.mp3")
+        self.young_orphan = self.media_file("simulations/final/.partial-build.mp3")
+
+        # Everything but the young orphan is old enough to be collected
+        for path in self.files():
+            if path != self.young_orphan:
+                os.utime(os.path.join(settings.MEDIA_ROOT, path), (0, 0))
+
+    def record(self, simulation, frequency):
+        dialogue = Dialogue.objects.create(
+            simulation=simulation, title=f"Dialogue {frequency}", order=frequency
+        )
+        line = DialogueLine.objects.create(
+            dialogue=dialogue, participant=self.learner, order=1, text="Bonjour"
+        )
+        recording = LineRecording.objects.create(dialogue_line=line)
+        recording.audio_file.save("take.mp3", tone(frequency))
+        return recording
+
+    def media_file(self, path):
+        full_path = os.path.join(settings.MEDIA_ROOT, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "wb") as f:
+            f.write(tone().read())
+        return path
+
+    def files(self):
+        """Every file under MEDIA_ROOT, blobs included"""
+
+        return {
+            os.path.relpath(os.path.join(directory, name), settings.MEDIA_ROOT)
+            for directory, _dirs, names in os.walk(settings.MEDIA_ROOT)
+            for name in names
+        }
+
+    def gc(self, **options):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("media_gc", retention_days=30, stdout=StringIO(), **options)
+
+    def test_dry_run_deletes_nothing(self):
+        before = self.files()
+        self.gc(dry_run=True)
+        self.assertEqual(self.files(), before)
+        self.assertEqual(LineRecording.objects.count(), 2)
+
+    def test_collects_orphans_and_expired_recordings_only(self):
+        expired_file = self.expired.audio_file.name
+        expired_blob = os.path.relpath(
+            self.expired.audio_file.storage.blob_path(file_digest(self.expired.audio_file.path)),
+            settings.MEDIA_ROOT,
+        )
+        before = self.files()
+        self.gc()
+        after = self.files()
+
+        self.assertEqual(before - after, {self.orphan, expired_file, expired_blob})
+        self.assertIn(self.young_orphan, after)
+        self.assertIn(self.segment, after)
+        self.assertIn(self.kept.audio_file.name, after)
+        self.assertIn(self.simulation.final_audio.name, after)
+        self.assertTrue(any(path.startswith(".blobs/") for path in after))
+        self.assertEqual(
+            list(LineRecording.objects.values_list("pk", flat=True)), [self.kept.pk]
+        )
+
+    def test_usage_counts_linked_files_once(self):
+        # Same bytes as the first take: the storage links both names to one blob
+        line = DialogueLine.objects.create(
+            dialogue=self.kept.dialogue_line.dialogue,
+            participant=self.learner,
+            order=2,
+            text="Merci",
+        )
+        copy = LineRecording.objects.create(dialogue_line=line)
+        copy.audio_file.save("copy.mp3", tone(300))
+        self.assertNotEqual(copy.audio_file.name, self.expired.audio_file.name)
+
+        usage = storage_by_user()
+        self.assertEqual(
+            usage[self.user.email],
+            self.expired.audio_file.size + self.kept.audio_file.size,
+        )
+        # Shared and generated files, each stored file counted once overall
+        sizes = {}
+        for name in self.files():
+            stat = os.stat(os.path.join(settings.MEDIA_ROOT, name))
+            if not name.startswith(".blobs/"):
+                sizes[stat.st_ino] = stat.st_size
+        self.assertEqual(sum(usage.values()), sum(sizes.values()))
+
+
+# ========================
+# Background Jobs
+# ========================
+@override_settings(AUDIO_JOBS_EAGER=False, AUDIO_JOB_RETRY_DELAY=10)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.handler = mock.Mock(return_value="simulations/final/built.mp3")
+        patcher = mock.patch.dict(jobs.HANDLERS, {"dialogue_audio": self.handler})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_a_job_is_claimed_once(self):
+        job = jobs.enqueue("dialogue_audio", 1)
+
+        self.assertTrue(jobs.claim(job.pk, "worker-a"))
+        self.assertFalse(jobs.claim(job.pk, "worker-b"))
+        self.assertIsNone(jobs.claim_next("worker-b"))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker, job.attempts), ("running", "worker-a", 1))
+
+    def test_pending_jobs_are_deduplicated(self):
+        job = jobs.enqueue("dialogue_audio", 1)
+        self.assertEqual(jobs.enqueue("dialogue_audio", 1).pk, job.pk)
+        jobs.enqueue_many("dialogue_audio", [1, 2, 2])
+        self.assertEqual(AudioJob.objects.filter(status="pending").count(), 2)
+
+        # The database refuses a second pending job even past the lookup
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            AudioJob.objects.create(kind="dialogue_audio", object_id=1)
+
+        # A running job does not stop the target from being queued again
+        jobs.claim(job.pk, "worker")
+        self.assertNotEqual(jobs.enqueue("dialogue_audio", 1).pk, job.pk)
+
+    def test_enqueue_racing_another_process(self):
+        existing = jobs.enqueue("dialogue_audio", 1)
+        first = mock.Mock(side_effect=[None, existing])
+        with mock.patch("django.db.models.query.QuerySet.first", first):
+            self.assertEqual(jobs.enqueue("dialogue_audio", 1), existing)
+        self.assertEqual(AudioJob.objects.count(), 1)
+
+    def test_failures_back_off_then_fail(self):
+        self.handler.side_effect = RuntimeError("ffmpeg crashed")
+        job = jobs.enqueue("dialogue_audio", 1)
+
+        for attempt, delay in ((1, 10), (2, 20)):
+            before = timezone.now()
+            job = jobs.run_job(jobs.claim_next("worker"))
+            self.assertEqual((job.status, job.attempts), ("pending", attempt))
+            self.assertGreaterEqual(job.run_after, before + timedelta(seconds=delay))
+            self.assertLess(job.run_after, before + timedelta(seconds=delay + 5))
+            # Not runnable before the delay
+            self.assertIsNone(jobs.claim_next("worker"))
+            AudioJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+
+        job = jobs.run_job(jobs.claim_next("worker"))
+        self.assertEqual((job.status, job.attempts), ("failed", 3))
+        self.assertIn("ffmpeg crashed", jobs.job_payload(job)["error"])
+
+    def test_a_failure_is_not_retried_when_queued_again(self):
+        self.handler.side_effect = RuntimeError("ffmpeg crashed")
+        jobs.enqueue("dialogue_audio", 1)
+        job = jobs.claim_next("worker")
+        newer = jobs.enqueue("dialogue_audio", 1)
+
+        self.assertEqual(jobs.run_job(job).status, "failed")
+        newer.refresh_from_db()
+        self.assertEqual(newer.status, "pending")
+
+    def test_stale_jobs_are_requeued_or_failed(self):
+        live, lost, exhausted, superseded = (
+            jobs.enqueue("dialogue_audio", object_id) for object_id in (1, 2, 3, 4)
+        )
+        for job in (live, lost, exhausted, superseded):
+            jobs.claim(job.pk, "worker")
+        AudioJob.objects.filter(pk=exhausted.pk).update(attempts=3)
+        long_ago = timezone.now() - timedelta(minutes=10)
+        AudioJob.objects.exclude(pk=live.pk).update(heartbeat_at=long_ago, started_at=long_ago)
+        jobs.enqueue("dialogue_audio", 4)
+
+        self.assertEqual(jobs.requeue_stale(60), (1, 2))
+        statuses = dict(AudioJob.objects.values_list("pk", "status"))
+        self.assertEqual(statuses[live.pk], "running")
+        self.assertEqual(statuses[lost.pk], "pending")
+        self.assertEqual(statuses[exhausted.pk], "failed")
+        self.assertEqual(statuses[superseded.pk], "failed")
+
+
+@override_settings(AUDIO_JOBS_EAGER=False)
+class AudioWorkerTests(TransactionTestCase):
+    def test_once_drains_the_queue(self):
+        handler = mock.Mock(return_value="")
+        with mock.patch.dict(jobs.HANDLERS, {"dialogue_audio": handler}):
+            jobs.enqueue_many("dialogue_audio", [1, 2, 3])
+            # One slot: the in-memory test database locks whole tables
+            call_command("run_audio_worker", once=True, concurrency=1, stdout=StringIO())
+
+        self.assertEqual(sorted(call.args[0] for call in handler.call_args_list), [1, 2, 3])
+        self.assertEqual(set(AudioJob.objects.values_list("status", flat=True)), {"succeeded"})
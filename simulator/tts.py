@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+
+
+# ========================
+# Disk LRU Helpers
+# ========================
+def evict_lru(directory, max_bytes, suffix=""):
+    """
+    Removes least recently used files until the directory fits in max_bytes
+
+    Recency is the file mtime, which cache hits refresh with os.utime.
+
+    Args:
+        directory (str): Directory holding the cached files
+        max_bytes (int): Size budget for the directory
+        suffix (str): Only consider files ending with this suffix
+
+    Returns:
+        int: Number of bytes removed
+    """
+
+    entries = []
+    total = 0
+    for root, _dirs, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(suffix) or name.startswith("."):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+    removed = 0
+    if total <= max_bytes:
+        return removed
+
+    entries.sort()
+    for _mtime, size, path in entries:
+        if total - removed <= max_bytes:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            continue
+        removed += size
+
+    return removed
+
+
+def directory_size(directory, suffix=""):
+    """Total size of the files evict_lru() would consider"""
+
+    total = 0
+    for root, _dirs, files in os.walk(directory):
+        for name in files:
+            if name.endswith(suffix) and not name.startswith("."):
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+    return total
+
+
+class DiskBudget:
+    """
+    Running size of a cache directory bounded by max_bytes.
+
+    The directory is walked once, then every stored file adds its size and
+    every removed one subtracts it. Only when the total goes over max_bytes
+    is the directory walked again: evict_lru() brings it down to
+    EVICT_TO of the budget, so the next walks are many stores away, and
+    the size is rescanned to pick up files other processes added.
+    """
+
+    EVICT_TO = 0.9
+
+    def __init__(self, directory, max_bytes, suffix=""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._size = None
+        self._lock = threading.Lock()
+
+    def size(self):
+        with self._lock:
+            if self._size is None:
+                self._size = directory_size(self.directory, self.suffix)
+            return self._size
+
+    def added(self, path):
+        """Accounts for a file just stored, evicting old files if over budget"""
+
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if self._size is None:
+                # The first scan already includes the new file
+                self._size = directory_size(self.directory, self.suffix)
+            else:
+                self._size += size
+            over_budget = self._size > self.max_bytes
+
+        if over_budget:
+            evict_lru(self.directory, int(self.max_bytes * self.EVICT_TO), self.suffix)
+            with self._lock:
+                self._size = directory_size(self.directory, self.suffix)
+
+    def removed(self, size):
+        with self._lock:
+            if self._size is not None:
+                self._size = max(0, self._size - size)
+
+
+# ========================
+# Text-to-Speech Cache
+# ========================
+class TTSCache:
+    """
+    Content-addressed store of synthesized speech clips.
+
+    Clips are keyed by a hash of (text, lang, slow, engine), so every call
+    site that synthesizes the same sentence shares a single file. The engine
+    is the name of the TTS provider that made the clip. The
+    directory is bounded by max_bytes with least-recently-used eviction.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._budget = DiskBudget(self.directory, max_bytes, suffix=".mp3")
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    @staticmethod
+    def make_key(text, lang="fr", slow=False, engine="gtts"):
+        payload = json.dumps(
+            [text, lang, bool(slow), engine], ensure_ascii=False, separators=(",", ":")
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.mp3")
+
+    def get(self, key):
+        """
+        Returns the cached clip path for key, or None on a miss
+
+        A hit refreshes the clip's mtime so eviction keeps it.
+        """
+
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def peek(self, key):
+        """Returns the cached clip path for key without counting a miss"""
+
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            return None
+        return self.get(key)
+
+    def fetch(self, key, synthesize):
+        """
+        Returns the cached clip for key, calling synthesize(path) on a miss
+
+        Concurrent misses on the same key wait for a single synthesis.
+
+        Args:
+            key (str): Cache key from make_key()
+            synthesize (callable): Writes the clip to the path it is given
+
+        Returns:
+            str: Path to the cached clip
+        """
+
+        path = self.get(key)
+        if path:
+            return path
+
+        # [lock, number of threads using it]: the entry is dropped by the
+        # last user, so a later miss can never get a second lock for a key
+        # that is still being synthesized
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+
+        try:
+            with entry[0]:
+                path = self.path_for(key)
+                if not os.path.exists(path):
+                    self._store(path, synthesize)
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+        return path
+
+    def _store(self, path, synthesize):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".mp3", dir=os.path.dirname(path))
+        os.close(fd)
+        try:
+            synthesize(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        self._budget.added(path)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size_bytes": self._budget.size(),
+                "max_bytes": self.max_bytes,
+            }
+
+
+_tts_cache = None
+_tts_cache_lock = threading.Lock()
+
+
+def get_tts_cache():
+    """Returns the process-wide TTS cache configured from settings"""
+
+    global _tts_cache
+    with _tts_cache_lock:
+        if _tts_cache is None:
+            _tts_cache = TTSCache(settings.TTS_CACHE_DIR, settings.TTS_CACHE_MAX_BYTES)
+        return _tts_cache
@@ -0,0 +1,334 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from gtts import gTTS
+
+from .analysis import array_to_pcm
+from .audio import AudioStreamWriter, pcm_format
+from .tts import get_tts_cache
+
+
+class TTSUnavailable(Exception):
+    """Raised when no configured TTS provider could synthesize the text"""
+
+
+# ========================
+# Providers
+# ========================
+PROVIDERS = {}
+
+
+def register(name):
+    """Registers a provider class under the name used in TTS_PROVIDERS"""
+
+    def decorator(cls):
+        cls.name = name
+        PROVIDERS[name] = cls
+        return cls
+
+    return decorator
+
+
+class TTSProvider:
+    """
+    A speech synthesis engine.
+
+    synthesize() writes an MP3 clip to path; it should honour timeout
+    itself where the engine allows it (the service enforces it as well).
+    """
+
+    name = ""
+
+    def synthesize(self, text, lang, slow, path, timeout):
+        raise NotImplementedError
+
+
+@register("gtts")
+class GTTSProvider(TTSProvider):
+    """Google Translate text-to-speech (needs network access)"""
+
+    def synthesize(self, text, lang, slow, path, timeout):
+        gTTS(text=text, lang=lang, slow=slow, timeout=timeout).save(path)
+
+
+@register("espeak")
+class EspeakProvider(TTSProvider):
+    """Local espeak-ng / espeak engine, converted to the pipeline MP3 format"""
+
+    def __init__(self):
+        self.binary = shutil.which("espeak-ng") or shutil.which("espeak")
+
+    def synthesize(self, text, lang, slow, path, timeout):
+        if not self.binary:
+            raise RuntimeError("espeak-ng is not installed")
+
+        with tempfile.NamedTemporaryFile(suffix=".wav") as wav:
+            subprocess.run(
+                [self.binary, "-v", lang, "-s", "120" if slow else "160", "-w", wav.name, text],
+                check=True,
+                timeout=timeout,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+            )
+            with AudioStreamWriter(path) as writer:
+                writer.add_file(wav.name)
+
+
+@register("synthetic")
+class SyntheticProvider(TTSProvider):
+    """
+    Deterministic offline stand-in: one tone per word
+
+    Produces the same bytes for the same text, with a duration that grows
+    with its length, so builds and tests run without any speech engine.
+    """
+
+    def synthesize(self, text, lang, slow, path, timeout):
+        frame_rate = pcm_format()["frame_rate"]
+        scale = 1.5 if slow else 1.0
+        gap = np.zeros(int(frame_rate * 0.04 * scale), dtype=np.float32)
+
+        pieces = []
+        for word in text.split() or [""]:
+            seed = int(hashlib.sha256(f"{lang}:{word}".encode()).hexdigest()[:8], 16)
+            frequency = 180 + seed % 240
+            seconds = max(0.12, 0.06 * len(word)) * scale
+            t = np.arange(int(frame_rate * seconds), dtype=np.float32) / frame_rate
+            pieces += [0.3 * np.sin(2 * np.pi * frequency * t).astype(np.float32), gap]
+
+        with AudioStreamWriter(path) as writer:
+            writer.write_pcm(array_to_pcm(np.concatenate(pieces)))
+
+
+# ========================
+# Circuit Breaker & Metrics
+# ========================
+class CircuitBreaker:
+    """
+    Stops calling a provider after repeated failures.
+
+    After `threshold` consecutive failures the breaker opens and calls are
+    skipped for `reset_after` seconds. Then one trial call is let through
+    (half-open): success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, threshold, reset_after):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+class ProviderMetrics:
+    """Call counts and a window of recent latencies for one provider"""
+
+    def __init__(self, window=1000):
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds, error=None):
+        with self._lock:
+            self.calls += 1
+            self.latencies.append(seconds * 1000)
+            if error is not None:
+                self.failures += 1
+                if isinstance(error, TimeoutError):
+                    self.timeouts += 1
+
+    def stats(self):
+        with self._lock:
+            latencies = np.array(self.latencies) if self.latencies else np.zeros(1)
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            return {
+                "calls": self.calls,
+                "failures": self.failures,
+                "timeouts": self.timeouts,
+                "p50_ms": float(p50),
+                "p95_ms": float(p95),
+                "p99_ms": float(p99),
+            }
+
+
+# ========================
+# Service
+# ========================
+class TTSService:
+    """
+    Synthesizes speech through an ordered list of providers.
+
+    The first provider whose circuit is closed is used; on failure or
+    timeout the next one is tried, so a degraded upstream costs at most
+    `timeout` per request. Clips are cached per provider: once the
+    preferred provider recovers, cache lookups return its clip again.
+    Files already stored from a fallback clip (e.g. a LineRecording) are
+    not replaced.
+
+    Each provider runs in its own thread pool, so calls to a hung provider
+    that outlive their timeout cannot starve the fallbacks.
+    """
+
+    def __init__(self, names, timeout, breaker_threshold, breaker_reset, max_workers):
+        unknown = [name for name in names if name not in PROVIDERS]
+        if unknown or not names:
+            raise ValueError(f"Unknown TTS providers: {unknown or names}")
+
+        self.providers = [PROVIDERS[name]() for name in names]
+        self.timeout = timeout
+        self.breakers = {
+            name: CircuitBreaker(breaker_threshold, breaker_reset) for name in names
+        }
+        self.metrics = {name: ProviderMetrics() for name in names}
+        self._executors = {
+            name: ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"tts-{name}")
+            for name in names
+        }
+
+    def speech_path(self, text, lang="fr", slow=False, key_text=None):
+        """
+        Returns the path of a cached clip for text, synthesizing it on a miss
+
+        The clip is cached under key_text when given, so texts that sound the
+        same can share it (simulator.phrases); text is what gets synthesized.
+
+        Raises:
+            TTSUnavailable: If every provider failed or is switched off
+        """
+
+        cache = get_tts_cache()
+        errors = []
+
+        for provider in self.providers:
+            key = cache.make_key(key_text or text, lang=lang, slow=slow, engine=provider.name)
+            if not self.breakers[provider.name].allow():
+                # The provider is failing, but what it made before is still good
+                path = cache.peek(key)
+                if path:
+                    return path
+                errors.append(f"{provider.name}: circuit open")
+                continue
+
+            try:
+                return cache.fetch(
+                    key, lambda path: self.call(provider, text, lang, slow, path)
+                )
+            except Exception as exc:
+                errors.append(f"{provider.name}: {exc!r}")
+
+        raise TTSUnavailable("; ".join(errors))
+
+    def cached_path(self, text, lang="fr", slow=False):
+        """Returns an already cached clip for text from any provider, or None"""
+
+        cache = get_tts_cache()
+        for provider in self.providers:
+            path = cache.peek(cache.make_key(text, lang=lang, slow=slow, engine=provider.name))
+            if path:
+                return path
+        return None
+
+    def call(self, provider, text, lang, slow, path):
+        """Runs one synthesis with the timeout, recording metrics and breaker state"""
+
+        # The provider writes to a private file: a call that times out keeps
+        # running in the pool and must not touch the cache entry afterwards
+        fd, own_path = tempfile.mkstemp(suffix=".mp3", prefix="tts-")
+        os.close(fd)
+
+        started = time.monotonic()
+        future = self._executors[provider.name].submit(
+            provider.synthesize, text, lang, slow, own_path, self.timeout
+        )
+        try:
+            future.result(timeout=self.timeout)
+            shutil.copyfile(own_path, path)
+            _unlink(own_path)
+        except Exception as exc:
+            future.cancel()
+            # Runs at once if the call is over, else when it finally returns
+            future.add_done_callback(lambda _future: _unlink(own_path))
+            self.metrics[provider.name].record(time.monotonic() - started, exc)
+            self.breakers[provider.name].record_failure()
+            raise
+        self.metrics[provider.name].record(time.monotonic() - started)
+        self.breakers[provider.name].record_success()
+
+    def stats(self):
+        return {
+            provider.name: {
+                **self.metrics[provider.name].stats(),
+                "circuit": self.breakers[provider.name].state,
+            }
+            for provider in self.providers
+        }
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+_tts_service = None
+_tts_service_lock = threading.Lock()
+
+
+def get_tts_service():
+    """Returns the process-wide TTS service configured from settings"""
+
+    global _tts_service
+    with _tts_service_lock:
+        if _tts_service is None:
+            _tts_service = TTSService(
+                settings.TTS_PROVIDERS,
+                timeout=settings.TTS_TIMEOUT,
+                breaker_threshold=settings.TTS_BREAKER_THRESHOLD,
+                breaker_reset=settings.TTS_BREAKER_RESET,
+                max_workers=settings.TTS_MAX_CONCURRENCY,
+            )
+        return _tts_service
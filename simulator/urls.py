@@ -49,6 +49,11 @@ urlpatterns = [
     path("line/<int:pk>/delete/", views.line_delete, name="line_delete"),
     # API
     path("api/line/<int:line_id>/record/", views.record_line, name="record_line"),
+    path(
+        "api/line/<int:line_id>/upload/",
+        views.upload_line_recording,
+        name="upload_line_recording",
+    ),
     path(
         "api/line/<int:line_id>/generate/",
         views.generate_system_audio,
@@ -64,6 +69,34 @@ urlpatterns = [
         views.generate_simulation_audio_view,
         name="generate_simulation_audio",
     ),
+    path(
+        "api/simulation/<int:pk>/stream-audio/",
+        views.stream_simulation_audio_view,
+        name="stream_simulation_audio",
+    ),
+    path(
+        "api/dialogue/<int:dialogue_id>/playlist/",
+        views.dialogue_playlist,
+        name="dialogue_playlist",
+    ),
+    path(
+        "api/dialogue/<int:dialogue_id>/playlist.m3u8",
+        views.dialogue_playlist,
+        {"fmt": "m3u8"},
+        name="dialogue_playlist_m3u8",
+    ),
+    path(
+        "api/simulation/<int:pk>/playlist/",
+        views.simulation_playlist,
+        name="simulation_playlist",
+    ),
+    path(
+        "api/simulation/<int:pk>/playlist.m3u8",
+        views.simulation_playlist,
+        {"fmt": "m3u8"},
+        name="simulation_playlist_m3u8",
+    ),
+    path("api/job/<int:job_id>/", views.audio_job_status, name="audio_job_status"),
     path(
         "dialogue/<int:pk>/participant/create/",
         views.participant_create_inline,
@@ -1,12 +1,36 @@
 import os
-import random
+import shutil
+import tempfile
 import uuid
 
-# import whisper
 from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
 from pydub import AudioSegment
-from gtts import gTTS
+
+from .analysis import process_pcm
+from .asr import get_asr_pool
+from .audio import (
+    AudioStreamWriter,
+    decode_pcm,
+    get_pcm_cache,
+    get_segment_cache,
+    inputs_digest,
+    pcm_format,
+)
+from .jobs import enqueue
+from .models import Dialogue, LineRecording, Simulation
+from .phrases import assemble_phrases
+from .storage import get_audio_storage
+from .tts_providers import get_tts_service
+
+# Pauses inserted after each line; the choice is derived from the recording
+PAUSE_CHOICES_MS = tuple(range(500, 1001, 50))
+
+# Pause after each title and dialogue in the simulation audio
+SIMULATION_PAUSE_MS = 2000
 
 
 def generate_id():
@@ -58,33 +82,41 @@ def convert_audio(input_path, output_format="mp3", bitrate=None, mpeg_layer=None
 # ========================
 
 
-# def transcribe_audio(file_path: str) -> str:
-#     """
-#     Converts speech to text using OpenAI's Whisper
+def transcribe_audio(file_path: str, lang: str = "fr") -> str:
+    """
+    Converts speech to text with the resident ASR model pool
 
-#     Args:
-#     file_path (str): Path to audio file
+    The model is loaded once per process (see simulator.asr) and concurrent
+    calls are transcribed together in micro-batches.
 
-#     Returns:
-#     str: Transcribed text (lowercase, no punctuation)
+    Args:
+        file_path (str): Path to audio file
+        lang (str): Language code
 
-#     Reference: Radford et al. (2022) Robust Speech Recognition
-#     via Large-Scale Weak Supervision
-#     """
-#     model = whisper.load_model(name="small")
-#     result = model.transcribe(audio=file_path, verbose=True, language="fr")
-#     print(f"===> Detected Language: {result['language']} <====")
-#     return str(result["text"]).strip()
+    Returns:
+        str: Transcribed text
 
+    Raises:
+        ASRUnavailable: If the ASR backend cannot be loaded
+    """
 
-def text_to_speech(text: str, output_path: str = ".", lang: str = "fr") -> str:
+    return get_asr_pool().transcribe(file_path, lang=lang)
+
+
+def text_to_speech(
+    text: str, output_path: str = ".", lang: str = "fr", slow: bool = False
+) -> str:
     """
-    Converts text to speech audio file using Google Text-to-Speech
+    Converts text to speech audio file using the configured TTS providers
+
+    Synthesis goes through the shared TTS cache, so a sentence is only sent
+    to a provider the first time it is seen.
 
     Args:
         text (str): Text to convert to speech
         output_path (str): Path where audio file will be saved
         lang (str): Language code (default: "fr" for French)
+        slow (bool): Use the slower speaking rate
 
     Returns:
         str: Path to the generated audio file
@@ -93,17 +125,231 @@ def text_to_speech(text: str, output_path: str = ".", lang: str = "fr") -> str:
         >>> text_to_speech("Bonjour, comment allez-vous?", "/path/to/output.mp3")
     """
 
-    # Create TTS object and save to file
-    tts = gTTS(text=text, lang=lang, slow=False)
-    tts.save(output_path)
+    cached_path = cached_speech_path(text, lang=lang, slow=slow)
+    shutil.copyfile(cached_path, output_path)
 
     return output_path
 
 
+def cached_speech_path(text: str, lang: str = "fr", slow: bool = False) -> str:
+    """
+    Returns the path of the cached TTS clip for text, synthesizing it on a miss
+
+    Synthesis goes through the configured TTS providers (TTS_PROVIDERS),
+    failing over to the next one on errors and timeouts. The returned file
+    belongs to the cache; callers must copy it rather than modify or delete it.
+
+    Args:
+        text (str): Text to convert to speech
+        lang (str): Language code (default: "fr" for French)
+        slow (bool): Use the slower speaking rate
+
+    Returns:
+        str: Path to the cached audio file
+    """
+
+    return get_tts_service().speech_path(text, lang=lang, slow=slow)
+
+
+def save_line_recording(line, audio_file):
+    """
+    Creates or replaces the recording of a dialogue line
+
+    Args:
+        line: DialogueLine model instance
+        audio_file: Django File (or ContentFile) with the audio; the storage
+            backend copies it in chunks
+
+    Returns:
+        LineRecording: The saved recording
+    """
+
+    recording, created = LineRecording.objects.update_or_create(
+        dialogue_line=line,
+        defaults={
+            "audio_file": audio_file,
+            "normalized_audio": None,
+            "duration_ms": None,
+            "rms_dbfs": None,
+            "is_silent": False,
+            "transcript": "",
+            "char_score": None,
+            "word_score": None,
+        },
+    )
+    transaction.on_commit(lambda: enqueue("normalize_recording", recording.pk))
+    invalidate_manifests(line.dialogue_id)
+    return recording
+
+
+def invalidate_manifests(dialogue_id):
+    """
+    Drops the playlist manifests that list a dialogue's recordings
+
+    Manifests point at recording files, which are deleted when a recording
+    is replaced. In playlist mode a dialogue that had a manifest is rebuilt
+    in the background (and its simulation after it, see jobs).
+
+    Args:
+        dialogue_id (int): Dialogue whose recordings changed
+    """
+
+    had_manifest = Dialogue.objects.filter(
+        pk=dialogue_id, audio_manifest__isnull=False
+    ).update(audio_manifest=None)
+    Simulation.objects.filter(
+        dialogues=dialogue_id, audio_manifest__isnull=False
+    ).update(audio_manifest=None)
+
+    if had_manifest and settings.AUDIO_OUTPUT_MODE == "playlist":
+        transaction.on_commit(lambda: enqueue("dialogue_audio", dialogue_id))
+
+
+def normalize_line_recording(recording):
+    """
+    Transcodes a recording once to the canonical pipeline format
+
+    Browser takes (webm, any rate/channels) and TTS clips are re-encoded to
+    AUDIO_SAMPLE_RATE / AUDIO_CHANNELS MP3 at AUDIO_BITRATE, so later builds
+    work on uniform inputs. Leading/trailing silence is trimmed and loudness
+    normalized on the way (see simulator.analysis). The rendition is
+    discarded if the recording was replaced while it was being made.
+
+    Args:
+        recording: LineRecording model instance
+
+    Returns:
+        str: Media path of the normalized rendition, or None if it was discarded
+    """
+
+    source_name = recording.audio_file.name
+
+    fmt = pcm_format()
+    samples, report = process_pcm(
+        decode_pcm(recording.audio_file.path), fmt["frame_rate"], fmt["sample_width"]
+    )
+    if not samples:
+        raise RuntimeError(f"Recording {recording.pk} has no audio")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = os.path.join(tmp_dir, "normalized.mp3")
+        with AudioStreamWriter(tmp_path) as writer:
+            writer.write_pcm(samples)
+
+        with open(tmp_path, "rb") as f:
+            storage = recording.normalized_audio.storage
+            name = storage.save(
+                f"simulations/lines/normalized/line_{recording.pk}.mp3", File(f)
+            )
+
+    updated = LineRecording.objects.filter(
+        pk=recording.pk, audio_file=source_name
+    ).update(
+        normalized_audio=name,
+        duration_ms=writer.duration_ms,
+        rms_dbfs=report["rms_dbfs"],
+        is_silent=report["is_silent"],
+    )
+
+    if not updated:
+        storage.delete(name)
+        return None
+
+    if recording.normalized_audio and recording.normalized_audio.name != name:
+        get_pcm_cache().invalidate(recording.normalized_audio.path)
+        recording.normalized_audio.delete(save=False)
+
+    recording.normalized_audio = name
+    recording.duration_ms = writer.duration_ms
+    recording.rms_dbfs = report["rms_dbfs"]
+    recording.is_silent = report["is_silent"]
+    # Playlists now play the normalized rendition
+    invalidate_manifests(recording.dialogue_line.dialogue_id)
+    return name
+
+
+def synthesize_system_line(line) -> str:
+    """
+    Writes the TTS audio for a system participant's line into media storage
+
+    Does not touch the database, so it is safe to call from worker threads.
+    Lines with the same text share one stored blob (see simulator.storage).
+    With TTS_PHRASE_SEGMENTATION the line is assembled from phrase clips.
+
+    Args:
+        line: DialogueLine model instance
+
+    Returns:
+        str: Media-relative path for the line's LineRecording
+    """
+
+    name = f"simulations/lines/system_{line.id}.mp3"
+    if settings.TTS_PHRASE_SEGMENTATION:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            clip_path = assemble_phrases(
+                line.text, os.path.join(tmp_dir, "line.mp3"), lang="fr"
+            )
+            with open(clip_path, "rb") as f:
+                return get_audio_storage().save(name, File(f))
+
+    clip_path = cached_speech_path(line.text, lang="fr")
+    with open(clip_path, "rb") as f:
+        return get_audio_storage().save(name, File(f))
+
+
+def ensure_system_recording(line):
+    """
+    Returns the recording of a system line, synthesizing it if there is none
+
+    Args:
+        line: DialogueLine model instance of a system participant
+
+    Returns:
+        LineRecording: The existing or newly created recording
+
+    Raises:
+        TTSUnavailable: If no TTS provider could synthesize the line
+    """
+
+    recording = LineRecording.objects.filter(dialogue_line=line).first()
+    if recording is not None:
+        return recording
+
+    recording, created = LineRecording.objects.get_or_create(
+        dialogue_line=line, defaults={"audio_file": synthesize_system_line(line)}
+    )
+    if created:
+        enqueue("normalize_recording", recording.pk)
+    return recording
+
+
+def line_pause_ms(source_digest: str) -> int:
+    """
+    Picks the pause after a line from its recording's content digest
+
+    The same recording always gets the same pause, so identical inputs
+    produce byte-identical dialogue audio.
+
+    Args:
+        source_digest (str): sha256 hex digest of the recording
+
+    Returns:
+        int: Pause length in milliseconds (500-1000)
+    """
+
+    return PAUSE_CHOICES_MS[int(source_digest[:8], 16) % len(PAUSE_CHOICES_MS)]
+
+
 def concatenate_dialogue_audio(dialogue):
     """
     Concatenates all line recordings for a dialogue into one audio file
 
+    Each recording and its trailing pause is encoded once into the segment
+    cache. Rebuilds only encode lines whose recording changed and splice
+    the cached segments together without decoding them. The output name
+    is derived from a hash of the segments, so an unchanged dialogue maps
+    to the file that already exists.
+
     Args:
         dialogue: Dialogue model instance
 
@@ -111,34 +357,110 @@ def concatenate_dialogue_audio(dialogue):
         str: Path to concatenated audio file or None if no recordings
     """
 
-    lines = dialogue.lines.filter(recording__isnull=False).order_by("order")
+    lines = (
+        dialogue.lines.filter(recording__isnull=False)
+        .select_related("recording")
+        .order_by("order")
+    )
 
     if not lines.exists():
         return None
 
-    combined = AudioSegment.empty()
+    cache = get_segment_cache()
+    previous = cache.load_manifest(dialogue.id)
+    entries = []
+    segment_paths = []
 
-    for line in lines:
+    for line in lines.iterator():
         try:
-            audio_path = line.recording.audio_file.path
-            audio = AudioSegment.from_file(audio_path)
-            combined += audio + AudioSegment.silent(duration=random.randint(500, 1000))
+            source_path = line.recording.playback_file.path
+            entry = cache.make_entry(
+                line.id,
+                source_path,
+                line_pause_ms,
+                previous.get(line.id),
+                # Normalized renditions were already processed at ingest
+                process=settings.AUDIO_ANALYSIS_ON_CONCAT
+                and not line.recording.normalized_audio,
+            )
+            segment_path, _encoded = cache.ensure_segment(entry, source_path)
         except Exception:
             continue
+        entries.append(entry)
+        segment_paths.append(segment_path)
+
+    cache.save_manifest(dialogue.id, entries)
 
-    if len(combined) == 0:
+    if not segment_paths:
         return None
 
-    output_path = os.path.join(
-        settings.MEDIA_ROOT,
-        "dialogues",
-        "complete",
-        f"dialogue_{dialogue.id}_{dialogue.title}.mp3",
+    digest = inputs_digest([entry["key"] for entry in entries])
+    relative_path = f"dialogues/complete/dialogue_{dialogue.id}_{digest[:16]}.mp3"
+    output_path = os.path.join(settings.MEDIA_ROOT, relative_path)
+
+    if not os.path.exists(output_path):
+        cache.splice(segment_paths, output_path)
+
+    return relative_path
+
+
+def dialogues_with_audio(simulation):
+    """
+    Returns the simulation's dialogues whose complete audio has been built
+
+    In playlist mode a dialogue manifest counts as well as an encoded file.
+    """
+
+    dialogues = simulation.dialogues.all()
+    has_file = Q(complete_audio__isnull=False) & ~Q(complete_audio="")
+    if settings.AUDIO_OUTPUT_MODE == "playlist":
+        return dialogues.filter(has_file | Q(audio_manifest__isnull=False))
+    return dialogues.filter(has_file)
+
+
+def simulation_segments(simulation):
+    """
+    Yields the segments making up a simulation's audio, in order
+
+    Each dialogue contributes its title clip and its complete audio, both
+    followed by a 2-second pause. Titles are synthesized lazily, so a
+    streaming build can start before later titles exist.
+
+    Args:
+        simulation: Simulation model instance
+
+    Yields:
+        tuple: (segment cache entry, source path)
+    """
+
+    cache = get_segment_cache()
+    dialogues = (
+        simulation.dialogues.filter(complete_audio__isnull=False)
+        .exclude(complete_audio="")
+        .order_by("order")
     )
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
-    combined.export(output_path, format="mp3")
-    return f"dialogues/complete/dialogue_{dialogue.id}_{dialogue.title}.mp3"
+    for dialogue in dialogues.iterator():
+        try:
+            # Dialogue titles repeat across rebuilds, so read them from the TTS cache
+            sources = [
+                cached_speech_path(dialogue.title, lang="fr"),
+                dialogue.complete_audio.path,
+            ]
+            pieces = [
+                (cache.make_entry(None, path, lambda _source: SIMULATION_PAUSE_MS), path)
+                for path in sources
+            ]
+        except Exception:
+            continue
+        yield from pieces
+
+
+def simulation_audio_name(simulation, entries):
+    """Returns the content-hashed media path for a simulation built from entries"""
+
+    digest = inputs_digest([entry["key"] for entry in entries])
+    return f"simulations/final/simulation_{simulation.id}_{digest[:16]}.mp3"
 
 
 def generate_simulation_audio(simulation):
@@ -146,51 +468,85 @@ def generate_simulation_audio(simulation):
     Generates complete simulation audio by concatenating all dialogue audios
     with TTS title transitions and 2-second pauses
 
+    Titles and dialogues are encoded once into the segment cache and
+    spliced, so a rebuild only re-encodes dialogues that changed. The
+    output name is derived from a hash of the segments, and an existing
+    output is reused.
+
     Args:
         simulation: Simulation model instance
 
     Returns:
         str: Path to simulation audio file or None if no dialogue audios
     """
-    import tempfile
 
-    dialogues = simulation.dialogues.filter(complete_audio__isnull=False).order_by(
-        "order"
-    )
-
-    if not dialogues.exists():
-        return None
-
-    combined = AudioSegment.empty()
+    cache = get_segment_cache()
+    entries = []
+    segment_paths = []
 
-    for dialogue in dialogues:
+    for entry, source_path in simulation_segments(simulation):
         try:
-            # Generate TTS for dialogue title
-            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as tmp:
-                title_audio_path = tmp.name
-            text_to_speech(dialogue.title, title_audio_path, lang="fr")
-            title_audio = AudioSegment.from_file(title_audio_path)
-
-            # Add title + 2s pause + dialogue audio + 2s pause
-            combined += title_audio + AudioSegment.silent(duration=2000)
-            dialogue_audio = AudioSegment.from_file(dialogue.complete_audio.path)
-            combined += dialogue_audio + AudioSegment.silent(duration=2000)
-
-            # Cleanup temp file
-            os.unlink(title_audio_path)
+            segment_path, _encoded = cache.ensure_segment(entry, source_path)
         except Exception:
             continue
+        entries.append(entry)
+        segment_paths.append(segment_path)
 
-    if len(combined) == 0:
+    if not segment_paths:
         return None
 
-    output_path = os.path.join(
-        settings.MEDIA_ROOT,
-        "simulations",
-        "final",
-        f"simulation_{simulation.id}_{simulation.title}.mp3",
-    )
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    relative_path = simulation_audio_name(simulation, entries)
+    output_path = os.path.join(settings.MEDIA_ROOT, relative_path)
+
+    if not os.path.exists(output_path):
+        cache.splice(segment_paths, output_path)
+
+    return relative_path
+
+
+def stream_simulation_audio(simulation):
+    """
+    Yields the simulation MP3 while it is being built
+
+    Every segment is sent as soon as it is encoded, so playback can start
+    after the first title. The bytes are also written to disk and stored
+    as the simulation's final_audio once the last segment is sent; if the
+    iteration is abandoned, nothing is kept.
+
+    Args:
+        simulation: Simulation model instance
+
+    Yields:
+        bytes: Encoded MP3 chunks
+    """
 
-    combined.export(output_path, format="mp3")
-    return f"simulations/final/simulation_{simulation.id}_{simulation.title}.mp3"
+    cache = get_segment_cache()
+    directory = os.path.join(settings.MEDIA_ROOT, "simulations", "final")
+    os.makedirs(directory, exist_ok=True)
+    entries = []
+
+    def segment_paths():
+        for entry, source_path in simulation_segments(simulation):
+            try:
+                segment_path, _encoded = cache.ensure_segment(entry, source_path)
+            except Exception:
+                continue
+            entries.append(entry)
+            yield segment_path
+
+    fd, tmp_path = tempfile.mkstemp(suffix=".mp3", dir=directory, prefix=".partial-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            yield from cache.iter_splice(segment_paths(), out)
+
+        if entries:
+            relative_path = simulation_audio_name(simulation, entries)
+            output_path = os.path.join(settings.MEDIA_ROOT, relative_path)
+            if not os.path.exists(output_path):
+                os.replace(tmp_path, output_path)
+            simulation.final_audio = relative_path
+            simulation.audio_manifest = None
+            simulation.save(update_fields=["final_audio", "audio_manifest"])
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
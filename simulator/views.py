@@ -2,23 +2,41 @@
 
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.core.files.base import ContentFile, File
 from django.utils import timezone
 import base64
-import os
-from .models import Simulation, Dialogue, Participant, DialogueLine, LineRecording
-from .utils import text_to_speech, generate_simulation_audio
+import tempfile
+from . import counters
+from .jobs import enqueue, job_payload
+from .models import (
+    AudioJob,
+    Simulation,
+    Dialogue,
+    Participant,
+    DialogueLine,
+)
+from .pagination import paginate_request
+from .playlist import manifest_to_m3u8, manifest_with_urls
+from .prefetch import prefetch_for_run, wait_for_prefetch
+from .tts_providers import TTSUnavailable
+from .utils import (
+    dialogues_with_audio,
+    ensure_system_recording,
+    save_line_recording,
+    stream_simulation_audio,
+)
+
+# Bytes read from the request per iteration when streaming an upload
+UPLOAD_CHUNK_SIZE = 64 * 1024
 
 
 def home(request):
-    stats = {
-        "simulations": Simulation.objects.count(),
-        "dialogues": Dialogue.objects.count(),
-        "participants": Participant.objects.count(),
-        "completed": Simulation.objects.filter(status="completed").count(),
-    }
+    stats = counters.global_counts()
 
     recent_simulations = Simulation.objects.all()[:5]
 
@@ -31,19 +49,86 @@ def home(request):
 
 
 def simulation_list(request):
+    """
+    Simulations, newest first, a page at a time
+
+    Query parameters: status, difficulty (simulations with at least one
+    dialogue at that level), after/before (page cursors) and format=json.
+    """
+
     simulations = Simulation.objects.all()
+    status = request.GET.get("status")
+    if status in dict(Simulation.STATUS_CHOICES):
+        simulations = simulations.filter(status=status)
+    difficulty = request.GET.get("difficulty")
+    if difficulty in dict(Dialogue.DIFFICULTY_CHOICES):
+        simulations = simulations.filter(
+            Exists(
+                Dialogue.objects.filter(
+                    simulation=OuterRef("pk"), difficulty_level=difficulty
+                )
+            )
+        )
+
+    page = paginate_request(request, simulations, ["-created_at", "-id"])
+
+    if request.GET.get("format") == "json":
+        return JsonResponse(
+            {
+                "success": True,
+                **page.payload(
+                    lambda sim: {
+                        "id": sim.pk,
+                        "title": sim.title,
+                        "status": sim.status,
+                        "created_at": sim.created_at.isoformat(),
+                    }
+                ),
+            }
+        )
+
     return render(
-        request, "simulator/simulation_list.html", {"simulations": simulations}
+        request,
+        "simulator/simulation_list.html",
+        {
+            "simulations": page,
+            "page": page,
+            "status": status,
+            "difficulty": difficulty,
+            "status_choices": Simulation.STATUS_CHOICES,
+            "difficulty_choices": Dialogue.DIFFICULTY_CHOICES,
+        },
     )
 
 
+def with_line_counts(dialogues):
+    """Sets line_count and recorded_count on dialogues from their counters"""
+
+    dialogues = list(dialogues)
+    counts = counters.read("dialogue", [dialogue.pk for dialogue in dialogues])
+    for dialogue in dialogues:
+        dialogue.line_count = counts[dialogue.pk]["lines"]
+        dialogue.recorded_count = counts[dialogue.pk]["recorded_lines"]
+    return dialogues
+
+
 def simulation_detail(request, pk):
     simulation = get_object_or_404(Simulation, pk=pk)
-    dialogues = simulation.dialogues.all()
+    dialogues = with_line_counts(
+        simulation.dialogues.prefetch_related("participants")
+    )
+    playlist_mode = settings.AUDIO_OUTPUT_MODE == "playlist"
     return render(
         request,
         "simulator/simulation_detail.html",
-        {"simulation": simulation, "dialogues": dialogues},
+        {
+            "simulation": simulation,
+            "dialogues": dialogues,
+            "playlist_mode": playlist_mode,
+            # A file left from a build in file mode must not shadow the playlist
+            "show_playlist": bool(simulation.audio_manifest)
+            and (playlist_mode or not simulation.final_audio),
+        },
     )
 
 
@@ -58,20 +143,24 @@ def simulation_create(request):
 
 
 def simulation_run(request, pk):
-    simulation = get_object_or_404(Simulation, pk=pk)
+    simulation = get_object_or_404(
+        Simulation.objects.select_related("current_dialogue"), pk=pk
+    )
 
     if simulation.status == "pending":
         simulation.status = "in_progress"
-        simulation.save()
+        simulation.save(update_fields=["status"])
+
+    # The sidebar only needs order and title; evaluated once for the template
+    dialogues = list(simulation.dialogues.only("pk", "order", "title", "simulation_id"))
+    current_dialogue = simulation.current_dialogue or (dialogues[0] if dialogues else None)
 
-    dialogues = simulation.dialogues.all()
-    current_dialogue = simulation.current_dialogue or dialogues.first()
-    
     if current_dialogue:
         if not simulation.current_dialogue:
             simulation.current_dialogue = current_dialogue
-            simulation.save()
-        lines = current_dialogue.lines.select_related("participant").all()
+            simulation.save(update_fields=["current_dialogue"])
+        lines = list(current_dialogue.lines.select_related("participant"))
+        prefetch_for_run(current_dialogue)
     else:
         lines = []
 
@@ -83,6 +172,8 @@ def simulation_run(request, pk):
             "current_dialogue": current_dialogue,
             "dialogues": dialogues,
             "lines": lines,
+            "progress": counters.read("simulation", [simulation.pk])[simulation.pk],
+            "realtime_recognition": settings.REALTIME_RECOGNITION,
         },
     )
 
@@ -90,7 +181,7 @@ def simulation_run(request, pk):
 @csrf_exempt
 def record_line(request, line_id):
     if request.method == "POST":
-        line = get_object_or_404(DialogueLine, pk=line_id)
+        line = get_object_or_404(DialogueLine, pk=line_id, participant__user_id=request.user.pk)
         audio_data = request.POST.get("audio_data")
 
         if audio_data:
@@ -100,9 +191,7 @@ def record_line(request, line_id):
                 base64.b64decode(audiostr), name=f"line_{line_id}.{ext}"
             )
 
-            recording, created = LineRecording.objects.update_or_create(
-                dialogue_line=line, defaults={"audio_file": audio_file}
-            )
+            recording = save_line_recording(line, audio_file)
 
             return JsonResponse(
                 {"success": True, "audio_url": recording.audio_file.url}
@@ -113,53 +202,170 @@ def record_line(request, line_id):
     return JsonResponse({"success": False, "error": "Invalid method"})
 
 
-def generate_system_audio(request, line_id):
-    line = get_object_or_404(DialogueLine, pk=line_id)
+@csrf_exempt
+def upload_line_recording(request, line_id):
+    """
+    Receives a recording as the raw request body (or a multipart "audio" file)
 
-    if not line.participant.is_system:
-        return JsonResponse({"success": False, "error": "Not a system line"})
+    Only the owner of the line's participant may record it; other lines are
+    a 404. Content type and declared size are checked before any of the body
+    is read, then the body is streamed to a temporary file in chunks.
+    """
+
+    if request.method != "POST":
+        return JsonResponse({"success": False, "error": "Invalid method"}, status=405)
+
+    line = get_object_or_404(DialogueLine, pk=line_id, participant__user_id=request.user.pk)
+    max_bytes = settings.RECORDING_UPLOAD_MAX_BYTES
+    content_type = request.content_type
 
     try:
-        recording = LineRecording.objects.get(dialogue_line=line)
+        content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        content_length = 0
+    if content_length > max_bytes:
+        return JsonResponse({"success": False, "error": "Recording too large"}, status=413)
+
+    upload = None
+    if content_type == "multipart/form-data":
+        upload = request.FILES.get("audio")
+        if upload is None:
+            return JsonResponse({"success": False, "error": "No audio data"}, status=400)
+        content_type = upload.content_type.split(";")[0].strip()
+        if upload.size > max_bytes:
+            return JsonResponse({"success": False, "error": "Recording too large"}, status=413)
+
+    ext = settings.RECORDING_UPLOAD_CONTENT_TYPES.get(content_type)
+    if ext is None:
+        return JsonResponse(
+            {"success": False, "error": f"Unsupported content type: {content_type}"},
+            status=415,
+        )
+
+    if upload is not None:
+        upload.name = f"line_{line_id}.{ext}"
+        recording = save_line_recording(line, upload)
         return JsonResponse({"success": True, "audio_url": recording.audio_file.url})
-    except LineRecording.DoesNotExist:
-        pass
 
-    from django.conf import settings
+    with tempfile.TemporaryFile() as tmp:
+        received = 0
+        for chunk in iter(lambda: request.read(UPLOAD_CHUNK_SIZE), b""):
+            received += len(chunk)
+            if received > max_bytes:
+                return JsonResponse(
+                    {"success": False, "error": "Recording too large"}, status=413
+                )
+            tmp.write(chunk)
 
-    output_path = os.path.join(
-        settings.MEDIA_ROOT, "simulations", "lines", f"system_{line_id}.mp3"
-    )
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        if not received:
+            return JsonResponse({"success": False, "error": "No audio data"}, status=400)
 
-    text_to_speech(line.text, output_path, lang="fr")
+        tmp.seek(0)
+        recording = save_line_recording(line, File(tmp, name=f"line_{line_id}.{ext}"))
 
-    recording = LineRecording.objects.create(
-        dialogue_line=line, audio_file=f"simulations/lines/system_{line_id}.mp3"
-    )
+    return JsonResponse({"success": True, "audio_url": recording.audio_file.url})
+
+
+def generate_system_audio(request, line_id):
+    line = get_object_or_404(DialogueLine, pk=line_id)
+
+    if not line.participant.is_system:
+        return JsonResponse({"success": False, "error": "Not a system line"})
+
+    # A prefetch already synthesizing this line is waited for, not repeated
+    wait_for_prefetch(line.pk)
+
+    try:
+        recording = ensure_system_recording(line)
+    except TTSUnavailable:
+        return JsonResponse(
+            {"success": False, "error": "Speech synthesis unavailable"}, status=503
+        )
 
     return JsonResponse({"success": True, "audio_url": recording.audio_file.url})
 
 
 def generate_complete_dialogue_audio(request, dialogue_id):
     dialogue = get_object_or_404(Dialogue, pk=dialogue_id)
-    
-    if dialogue.generate_complete_audio():
-        return JsonResponse({"success": True, "audio_url": dialogue.complete_audio.url})
-    
-    return JsonResponse({"success": False, "error": "No recordings found"})
+
+    if not dialogue.lines.filter(recording__isnull=False).exists():
+        return JsonResponse({"success": False, "error": "No recordings found"})
+
+    job = enqueue("dialogue_audio", dialogue.pk)
+    return JsonResponse(audio_job_payload(job))
 
 
 def generate_simulation_audio_view(request, pk):
     simulation = get_object_or_404(Simulation, pk=pk)
-    
-    audio_path = generate_simulation_audio(simulation)
-    if audio_path:
-        simulation.final_audio = audio_path
-        simulation.save()
-        return JsonResponse({"success": True, "audio_url": simulation.final_audio.url})
-    
-    return JsonResponse({"success": False, "error": "No dialogue audios found"})
+
+    if not dialogues_with_audio(simulation).exists():
+        return JsonResponse({"success": False, "error": "No dialogue audios found"})
+
+    job = enqueue("simulation_audio", simulation.pk)
+    return JsonResponse(audio_job_payload(job))
+
+
+def stream_simulation_audio_view(request, pk):
+    """Streams the simulation audio while it is built, saving it at the end"""
+
+    simulation = get_object_or_404(Simulation, pk=pk)
+
+    if not simulation.dialogues.exclude(complete_audio="").exclude(
+        complete_audio__isnull=True
+    ).exists():
+        return JsonResponse(
+            {"success": False, "error": "No dialogue audios found"}, status=404
+        )
+
+    def body():
+        completed = False
+        try:
+            yield from stream_simulation_audio(simulation)
+            completed = True
+        finally:
+            # The listener left early: finish the file in the background instead
+            if not completed:
+                enqueue("simulation_audio", simulation.pk)
+
+    response = StreamingHttpResponse(body(), content_type="audio/mpeg")
+    response["Cache-Control"] = "no-store"
+    # Ask nginx not to buffer, so each segment reaches the player immediately
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def dialogue_playlist(request, dialogue_id, fmt="json"):
+    dialogue = get_object_or_404(Dialogue, pk=dialogue_id)
+    return playlist_response(dialogue.audio_manifest, fmt)
+
+
+def simulation_playlist(request, pk, fmt="json"):
+    simulation = get_object_or_404(Simulation, pk=pk)
+    return playlist_response(simulation.audio_manifest, fmt)
+
+
+def playlist_response(manifest, fmt):
+    """Serves an audio manifest as JSON (with segment URLs) or as an m3u8 playlist"""
+
+    if not manifest:
+        return JsonResponse({"success": False, "error": "No playlist found"}, status=404)
+
+    if fmt == "m3u8":
+        return HttpResponse(
+            manifest_to_m3u8(manifest), content_type="application/vnd.apple.mpegurl"
+        )
+    return JsonResponse({"success": True, **manifest_with_urls(manifest)})
+
+
+def audio_job_status(request, job_id):
+    job = get_object_or_404(AudioJob, pk=job_id)
+    return JsonResponse(audio_job_payload(job))
+
+
+def audio_job_payload(job):
+    payload = job_payload(job)
+    payload["status_url"] = reverse("simulator:audio_job_status", args=[job.pk])
+    return payload
 
 
 def next_dialogue(request, pk):
@@ -176,17 +382,15 @@ def next_dialogue(request, pk):
             messages.success(request, f"Dialogue suivant: {next_dialogue.title}")
             return redirect("simulator:simulation_run", pk=pk)
     
-    # Simulation is complete - generate final audio automatically
+    # Simulation is complete - final audio is built in the background
     simulation.status = "completed"
     simulation.completed_at = timezone.now()
-    
-    # Generate final audio if not already exists
-    if not simulation.final_audio:
-        audio_path = generate_simulation_audio(simulation)
-        if audio_path:
-            simulation.final_audio = audio_path
-    
     simulation.save()
+
+    # Generate final audio if not already exists
+    if not simulation.has_audio:
+        enqueue("simulation_audio", simulation.pk)
+
     messages.success(request, "Simulation terminée avec succès!")
     return redirect("simulator:simulation_detail", pk=pk)
 
@@ -195,27 +399,45 @@ def complete_simulation(request, pk):
     simulation = get_object_or_404(Simulation, pk=pk)
     simulation.status = "completed"
     simulation.completed_at = timezone.now()
-    
-    # Generate final audio automatically if not already exists
-    if not simulation.final_audio:
-        audio_path = generate_simulation_audio(simulation)
-        if audio_path:
-            simulation.final_audio = audio_path
-    
     simulation.save()
+
+    # Final audio is built in the background if not already exists
+    if not simulation.has_audio:
+        enqueue("simulation_audio", simulation.pk)
+
     messages.success(request, "Simulation terminée avec succès!")
     return redirect("simulator:simulation_detail", pk=pk)
 
 
 # Participant Management
 def participant_list(request):
+    """The user's participants by name, a page at a time (after/before, format=json)"""
+
     participants = (
         Participant.objects.filter(user=request.user)
         if request.user.is_authenticated
-        else []
+        else Participant.objects.none()
     )
+    page = paginate_request(request, participants, ["speaker_name", "id"])
+
+    if request.GET.get("format") == "json":
+        return JsonResponse(
+            {
+                "success": True,
+                **page.payload(
+                    lambda participant: {
+                        "id": participant.pk,
+                        "speaker_name": participant.speaker_name,
+                        "is_system": participant.is_system,
+                    }
+                ),
+            }
+        )
+
     return render(
-        request, "simulator/participant_list.html", {"participants": participants}
+        request,
+        "simulator/participant_list.html",
+        {"participants": page, "page": page},
     )
 
 
@@ -265,13 +487,15 @@ def dialogue_create(request, simulation_pk):
 
 
 def dialogue_edit(request, pk):
-    dialogue = get_object_or_404(Dialogue, pk=pk)
+    dialogue = get_object_or_404(
+        Dialogue.objects.prefetch_related("participants"), pk=pk
+    )
     participants = (
         Participant.objects.filter(user=request.user)
         if request.user.is_authenticated
         else []
     )
-    lines = dialogue.lines.all()
+    lines = dialogue.lines.select_related("participant")
 
     return render(
         request,
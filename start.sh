@@ -0,0 +1,13 @@
+#!/usr/bin/env bash
+# Runs the audio worker next to the web server, in the same container, so
+# the files it builds land on the web service's media disk (a Render disk
+# is attached to a single service). The worker is restarted if it exits.
+set -o errexit
+
+while true; do
+    python manage.py run_audio_worker || true
+    sleep 5
+done &
+
+# ASGI, so the live recording WebSocket (simulator.realtime) is served too
+exec gunicorn core.asgi:application -k uvicorn.workers.UvicornWorker